@@ -92,6 +92,111 @@ void motorsTurnRight(uint8_t speed) {
   setAllSpeeds(speed);
 }
 
+// --- 速度控制 (麦克纳姆混合) ---
+// 指令格式: V<前进>,<平移>,<旋转>\n，各分量 -100..100
+// 前进为正、向右平移为正、顺时针 (右转) 为正
+#define VEL_MAX 100
+#define MIN_PWM 70 // 低于这个 PWM 电机转不动
+#define VEL_WATCHDOG 300 // 超过该时间 (ms) 没有新的速度指令就停车 (主机每 100ms 重发)
+
+unsigned long lastVelocityTime = 0;
+bool velocityActive = false; // 正在按速度指令运动，由看门狗监视
+
+// 设置单个轮子：value 为 -100..100，reversed 表示该侧电机接线反向
+void setWheel(AF_DCMotor &motor, int value, bool reversed) {
+  if (value == 0) {
+    motor.run(RELEASE);
+    return;
+  }
+  int magnitude = min(abs(value), VEL_MAX);
+  motor.setSpeed(map(magnitude, 0, VEL_MAX, MIN_PWM, 255));
+  bool forward = (value > 0) != reversed;
+  motor.run(forward ? FORWARD : BACKWARD);
+}
+
+void motorsVelocity(int forward, int strafe, int yaw) {
+  lastVelocityTime = millis();
+  velocityActive = forward != 0 || strafe != 0 || yaw != 0;
+  int lf = forward + strafe + yaw;
+  int rf = forward - strafe - yaw;
+  int lr = forward - strafe + yaw;
+  int rr = forward + strafe - yaw;
+
+  // 任一轮超出范围时整体等比例缩小，保持运动方向不变
+  int peak = max(max(abs(lf), abs(rf)), max(abs(lr), abs(rr)));
+  if (peak > VEL_MAX) {
+    lf = (long)lf * VEL_MAX / peak;
+    rf = (long)rf * VEL_MAX / peak;
+    lr = (long)lr * VEL_MAX / peak;
+    rr = (long)rr * VEL_MAX / peak;
+  }
+
+  // 右侧电机接线反向 (与 motorsForward 一致)
+  setWheel(motorLeftFront, lf, false);
+  setWheel(motorLeftRear, lr, false);
+  setWheel(motorRightFront, rf, true);
+  setWheel(motorRightRear, rr, true);
+}
+
+// --- 帧协议 (与 car_protocol.py 一致) ---
+// 0xA5 | seq | opcode | len | payload | crc8 (覆盖 seq..payload，多项式 0x07)
+#define START_BYTE 0xA5
+#define OP_CHAR 0x01
+#define OP_VELOCITY 0x02
+#define OP_ACK 0x80
+#define OP_TELEMETRY 0x81
+#define ACK_OK 0
+#define ACK_UNKNOWN 1
+#define MAX_PAYLOAD 32
+#define FRAME_TIMEOUT 50        // 半截帧超过该时间 (ms) 丢弃
+#define TELEMETRY_INTERVAL 200  // 遥测发送间隔 (ms)
+
+uint8_t frameBuf[3 + MAX_PAYLOAD + 1]; // seq, opcode, len, payload, crc
+uint8_t frameLen = 0;
+bool inFrame = false;
+bool framedHost = false;   // 收到过合法帧后才发送遥测、不再接受单字符指令，旧主机不受影响
+unsigned long frameStart = 0;
+unsigned long lastTelemetry = 0;
+uint8_t telemetrySeq = 0;
+
+// 遥测内容
+uint8_t lastSeq = 0;       // 最近执行的指令序号
+uint8_t servoAngle = 90;
+char motionState = 'S';
+long lastDistance = 0;
+
+uint8_t crc8Update(uint8_t crc, uint8_t data) {
+  crc ^= data;
+  for (uint8_t i = 0; i < 8; i++) {
+    crc = (crc & 0x80) ? (uint8_t)((crc << 1) ^ 0x07) : (uint8_t)(crc << 1);
+  }
+  return crc;
+}
+
+void sendFrame(uint8_t seq, uint8_t opcode, const uint8_t *payload, uint8_t len) {
+  uint8_t header[3] = {seq, opcode, len};
+  uint8_t crc = 0;
+  for (uint8_t i = 0; i < 3; i++) crc = crc8Update(crc, header[i]);
+  for (uint8_t i = 0; i < len; i++) crc = crc8Update(crc, payload[i]);
+  Serial.write(START_BYTE);
+  Serial.write(header, 3);
+  Serial.write(payload, len);
+  Serial.write(crc);
+}
+
+void sendTelemetry() {
+  // 距离 uint16, 舵机角度, 动作字符, 最近指令序号, 运行时间 uint32 (小端)
+  uint16_t dist = (uint16_t)constrain(lastDistance, 0, 65535);
+  unsigned long uptime = millis();
+  uint8_t payload[9] = {
+    (uint8_t)(dist & 0xFF), (uint8_t)(dist >> 8),
+    servoAngle, (uint8_t)motionState, lastSeq,
+    (uint8_t)(uptime & 0xFF), (uint8_t)(uptime >> 8),
+    (uint8_t)(uptime >> 16), (uint8_t)(uptime >> 24)
+  };
+  sendFrame(telemetrySeq++, OP_TELEMETRY, payload, sizeof(payload));
+}
+
 // 超声波测距函数
 long readDistance() {
   digitalWrite(TRIG_PIN, LOW);
@@ -106,6 +211,7 @@ long readDistance() {
 
 void setup() {
   Serial.begin(9600); 
+  Serial.setTimeout(20); // 解析速度指令时最多等待 20ms
   
   servo.attach(SERVO_PIN);
   servo.write(90);
@@ -116,34 +222,119 @@ void setup() {
   motorsStop();
 }
 
-void loop() {
-  if (Serial.available()) {
-    char command = Serial.read(); 
-
-    switch (command) {
-      // 电机控制
-      case 'F': motorsForward(SPEED_STRAIGHT); break;
-      case 'B': motorsBackward(SPEED_STRAIGHT); break;
-      case 'L': motorsTurnLeft(SPEED_TURN); break;
-      case 'R': motorsTurnRight(SPEED_TURN); break;
-      case 'S': motorsStop(); break;
-
-      // 舵机控制
-      case 'G': servo.write(90); break;  // 中
-      case 'H': servo.write(180); break; // 左/右极限
-      case 'J': servo.write(0); break;   // 右/左极限
-
-      // 传感器控制 
-      case 'U': { // 加上大括号以定义局部变量
-        long dist = readDistance();
+// 执行单字符指令，返回是否认识该指令
+// framed 为 true 时来自帧协议，测距结果放进遥测而不是打印文本
+bool executeChar(char command, bool framed) {
+  if (command == 'F' || command == 'B' || command == 'L' || command == 'R' || command == 'S') {
+    velocityActive = false; // 单字符运动指令不受速度看门狗限制
+  }
+  switch (command) {
+    // 电机控制
+    case 'F': motorsForward(SPEED_STRAIGHT); break;
+    case 'B': motorsBackward(SPEED_STRAIGHT); break;
+    case 'L': motorsTurnLeft(SPEED_TURN); break;
+    case 'R': motorsTurnRight(SPEED_TURN); break;
+    case 'S': motorsStop(); break;
+
+    // 速度指令 V<前进>,<平移>,<旋转> (旧的文本格式)
+    case 'V': {
+      int forward = Serial.parseInt();
+      int strafe = Serial.parseInt();
+      int yaw = Serial.parseInt();
+      motorsVelocity(forward, strafe, yaw);
+      break;
+    }
+
+    // 舵机控制
+    case 'G': servo.write(90); servoAngle = 90; return true;   // 中
+    case 'H': servo.write(180); servoAngle = 180; return true; // 左/右极限
+    case 'J': servo.write(0); servoAngle = 0; return true;     // 右/左极限
+
+    // 传感器控制 
+    case 'U': { // 加上大括号以定义局部变量
+      lastDistance = readDistance();
+      if (!framed) {
         Serial.print("Distance:");
-        Serial.println(dist);
-        break;
+        Serial.println(lastDistance);
+      }
+      return true;
+    }
+
+    default:
+      // motorsStop(); // 收到未知命令是否停车
+      return false;
+  }
+  motionState = command;
+  return true;
+}
+
+// 处理一个校验通过的帧，并回 ACK
+void handleFrame() {
+  uint8_t seq = frameBuf[0];
+  uint8_t opcode = frameBuf[1];
+  uint8_t len = frameBuf[2];
+  uint8_t *payload = frameBuf + 3;
+  bool known = false;
+
+  if (opcode == OP_CHAR && len >= 1) {
+    known = executeChar((char)payload[0], true);
+  } else if (opcode == OP_VELOCITY && len == 3) {
+    motorsVelocity((int8_t)payload[0], (int8_t)payload[1], (int8_t)payload[2]);
+    motionState = 'V';
+    known = true;
+  }
+
+  lastSeq = seq;
+  framedHost = true;
+  uint8_t status = known ? ACK_OK : ACK_UNKNOWN;
+  sendFrame(seq, OP_ACK, &status, 1);
+}
+
+void loop() {
+  while (Serial.available()) {
+    uint8_t b = Serial.read();
+
+    if (!inFrame) {
+      if (b == START_BYTE) {
+        inFrame = true;
+        frameLen = 0;
+        frameStart = millis();
+      } else if (!framedHost) {
+        executeChar((char)b, false); // 兼容旧的单字符协议
       }
+      // 帧协议主机：帧外的字节 (校验失败或丢了帧头的残帧) 直接丢弃，等下一个帧头，
+      // 否则残帧里恰好是 'F' / 'L' 之类的字节会让电机动起来
+      continue;
+    }
 
-      default:
-        // motorsStop(); // 收到未知命令是否停车
-        break;
+    frameBuf[frameLen++] = b;
+    if (frameLen == 3 && frameBuf[2] > MAX_PAYLOAD) {
+      inFrame = false; // 长度不合法，重新找帧头
+      continue;
+    }
+    if (frameLen > 3 && frameLen == 3 + frameBuf[2] + 1) {
+      uint8_t crc = 0;
+      for (uint8_t i = 0; i < frameLen - 1; i++) crc = crc8Update(crc, frameBuf[i]);
+      if (crc == frameBuf[frameLen - 1]) {
+        handleFrame();
+      }
+      inFrame = false;
     }
   }
+
+  if (inFrame && millis() - frameStart > FRAME_TIMEOUT) {
+    inFrame = false;
+  }
+
+  // 速度指令看门狗：主机 (跟踪进程) 停止重发时自动停车，不会一直按最后的速度跑下去
+  if (velocityActive && millis() - lastVelocityTime > VEL_WATCHDOG) {
+    velocityActive = false;
+    motorsStop();
+    motionState = 'S';
+  }
+
+  if (framedHost && millis() - lastTelemetry >= TELEMETRY_INTERVAL) {
+    lastTelemetry = millis();
+    sendTelemetry();
+  }
 }
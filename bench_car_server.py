@@ -0,0 +1,199 @@
+"""
+car_server HTTP 压测 (可在没有硬件的电脑上运行)
+
+多个并发客户端按比例请求 /move、/api/log_message、/api/get_logs，
+统计每个接口的吞吐量与延迟分位数 (P50/P95/P99/最大)。
+
+默认在本进程内用模拟硬件 (CAR_HARDWARE=sim，见 car_hardware.py) 启动 car_server，
+压测结束后从模拟串口取出实际写入的指令，检查串口指令顺序：
+每个客户端只发速度指令 V0,<客户端编号>,<计数>，计数递增，
+写到串口的指令里同一客户端的计数必须严格递增 (被合并掉的可以缺失，但不能乱序)。
+
+用法:
+    python3 bench_car_server.py
+    python3 bench_car_server.py --clients 16 --duration 10 --scenario flicker
+    python3 bench_car_server.py --url http://<RPi_IP>:5000   # 压测已在运行的服务 (不检查串口顺序)
+"""
+import argparse
+import contextlib
+import http.client
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+MAX_CLIENTS = 100    # 客户端编号写在速度指令的平移分量里 (0.01..1.00)
+MAX_COUNTER = 9999   # 计数写在前进 (百位) 与旋转 (个位) 分量里
+ENDPOINT_WEIGHTS = {"move": 0.5, "log_message": 0.25, "get_logs": 0.25}
+DRAIN_TIMEOUT = 3.0  # 压测结束后等待串口队列清空的时间 (s)
+
+
+def velocity_command(client, counter):
+    """把 (客户端, 计数) 编码进速度指令；前进分量 <= 0，不会被急刹拦下"""
+    forward = -(counter // 100) / 100
+    yaw = (counter % 100) / 100
+    return f"V{forward:.2f},{(client + 1) / 100:.2f},{yaw:.2f}"
+
+
+def decode_velocity(command):
+    """串口上的 "V<前进>,<平移>,<旋转>" (整数) -> (客户端, 计数)"""
+    forward, strafe, yaw = (int(v) for v in command[1:].split(","))
+    return strafe - 1, -forward * 100 + yaw
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def client_loop(client, host, port, deadline, results, rng):
+    """单个客户端：复用一条 HTTP 连接 (服务器关闭时自动重连)，直到时间结束"""
+    conn = http.client.HTTPConnection(host, port, timeout=5)
+    counter = 0
+    endpoints = list(ENDPOINT_WEIGHTS)
+    weights = list(ENDPOINT_WEIGHTS.values())
+    latencies = {name: [] for name in endpoints}
+    errors = {name: 0 for name in endpoints}
+    accepted = []  # 服务器返回 VELOCITY 的计数
+
+    while time.perf_counter() < deadline:
+        name = rng.choices(endpoints, weights)[0]
+        if name == "move":
+            if counter >= MAX_COUNTER:
+                continue
+            counter += 1
+            path = "/move?cmd=" + quote(velocity_command(client, counter))
+        elif name == "log_message":
+            path = "/api/log_message?msg=" + quote(f"[BENCH] client {client} #{counter}")
+        else:
+            path = "/api/get_logs"
+
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path)
+            response = conn.getresponse()
+            body = response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            ok, body = False, b""
+        latencies[name].append((time.perf_counter() - start) * 1000)
+        if not ok:
+            errors[name] += 1
+        elif name == "move" and body == b"VELOCITY":
+            accepted.append(counter)
+
+    conn.close()
+    results[client] = (latencies, errors, accepted)
+
+
+def run_load(base_url, clients, duration, seed):
+    parts = urlsplit(base_url)
+    host, port = parts.hostname, parts.port or 80
+    results = {}
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=client_loop,
+                                args=(i, host, port, deadline, results, random.Random(seed + i)))
+               for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - start
+
+
+def report_load(results, elapsed):
+    print(f"{'接口':<14}{'请求数':>8}{'吞吐(req/s)':>13}{'P50(ms)':>10}{'P95(ms)':>10}"
+          f"{'P99(ms)':>10}{'最大(ms)':>10}{'错误':>6}")
+    total = 0
+    for name in ENDPOINT_WEIGHTS:
+        values = sorted(v for latencies, _, _ in results.values() for v in latencies[name])
+        errors = sum(errs[name] for _, errs, _ in results.values())
+        total += len(values)
+        print(f"{name:<14}{len(values):>8}{len(values) / elapsed:>13.1f}{percentile(values, 0.50):>10.2f}"
+              f"{percentile(values, 0.95):>10.2f}{percentile(values, 0.99):>10.2f}"
+              f"{(values[-1] if values else 0):>10.2f}{errors:>6}")
+    print(f"合计: {total} 个请求, {elapsed:.1f}s, {total / elapsed:.1f} req/s")
+
+
+def check_serial_order(car_server, results):
+    """等待串口队列清空后，检查每个客户端写到串口的计数是否严格递增"""
+    deadline = time.time() + DRAIN_TIMEOUT
+    while car_server.get_serial_stats()["queue_depth"] and time.time() < deadline:
+        time.sleep(0.05)
+
+    written = {}
+    for _, command in car_server.ser.commands():
+        if command.startswith("V"):
+            client, counter = decode_velocity(command)
+            written.setdefault(client, []).append(counter)
+
+    accepted = sum(len(acc) for _, _, acc in results.values())
+    total_written = sum(len(v) for v in written.values())
+    violations = 0
+    for client, counters in written.items():
+        violations += sum(1 for a, b in zip(counters, counters[1:]) if b <= a)
+    unknown = sum(1 for counter_list in written.values() for c in counter_list if c <= 0)
+
+    stats = car_server.get_serial_stats()
+    print(f"串口: 接受 {accepted} 条速度指令, 写出 {total_written} 条 "
+          f"(合并 {stats['coalesced']}, 丢弃 {stats['dropped']}), 队列延迟 平均 {stats['avg_latency_ms']:.1f}ms "
+          f"最大 {stats['max_latency_ms']:.1f}ms")
+    link = car_server.get_link_stats()
+    print(f"应答: {link['acked']} 条, 丢失 {link['lost']}, RTT 平均 {link['avg_rtt_ms']:.2f}ms")
+    if violations or unknown:
+        print(f"!!! 串口指令顺序错误: {violations} 处乱序, {unknown} 条无法识别")
+    else:
+        print(f"串口指令顺序正确 ({len(written)} 个客户端)")
+    return violations == 0 and unknown == 0
+
+
+def start_local_server(scenario):
+    """在本进程内用模拟硬件启动 car_server，返回 (car_server 模块, 地址, 停止函数)"""
+    os.environ["CAR_HARDWARE"] = "sim"
+    os.environ["CAR_SIM_SCENARIO"] = scenario
+    os.environ.setdefault("CAR_SERIAL_PROTOCOL", "frame")  # 模拟串口会回 ACK，顺带统计应答延迟
+    import car_server
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, car_server.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return car_server, f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+
+def main():
+    parser = argparse.ArgumentParser(description="car_server HTTP 压测")
+    parser.add_argument("--url", help="压测已在运行的 car_server (默认在本进程内用模拟硬件启动)")
+    parser.add_argument("--clients", type=int, default=8, help=f"并发客户端数 (最多 {MAX_CLIENTS})")
+    parser.add_argument("--duration", type=float, default=5.0, help="压测时长 (s)")
+    parser.add_argument("--scenario", default="clear", help="模拟超声波场景 (见 car_hardware.SCENARIOS)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if not 1 <= args.clients <= MAX_CLIENTS:
+        parser.error(f"--clients 必须在 1..{MAX_CLIENTS} 之间")
+
+    car_server = stop = None
+    url = args.url
+    if url is None:
+        car_server, url, stop = start_local_server(args.scenario)
+
+    print(f"压测 {url}: {args.clients} 个客户端, {args.duration:.0f}s", flush=True)
+    # car_server 每条日志都会打印到控制台，压测期间丢弃这些输出
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results, elapsed = run_load(url, args.clients, args.duration, args.seed)
+    report_load(results, elapsed)
+
+    ok = True
+    if car_server is not None:
+        ok = check_serial_order(car_server, results)
+        stop()
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+硬件抽象：真实硬件 (串口 + gpiozero 超声波) 或模拟后端
+
+car_server.py 通过 open_serial() / open_distance_sensor() 获取硬件对象，
+backend='pi' 时才导入 pyserial 与 gpiozero，backend='sim' 时不需要任何硬件：
+  - SimSerial: 记录每次写入的字节与时间戳，帧协议下像 Arduino 一样回 ACK
+  - 模拟超声波: distance_sampler.FakeDistanceSensor + SCENARIOS 中的障碍场景
+可用环境变量 CAR_HARDWARE=sim 和 CAR_SIM_SCENARIO=<场景名> 在电脑上运行 car_server.py。
+"""
+import queue
+import struct
+import threading
+import time
+
+from car_protocol import (FrameDecoder, encode_frame, OP_CHAR, OP_VELOCITY, OP_ACK, OP_TELEMETRY,
+                          ACK_OK, ACK_UNKNOWN, TELEMETRY_FORMAT)
+from distance_sampler import FakeDistanceSensor
+
+BACKENDS = ("pi", "sim")
+
+
+class SimSerial:
+    """
+    模拟的串口，接口与 pyserial 的 Serial 相同 (write / read / in_waiting / close)。
+    写入按波特率模拟线上耗时；frame_protocol=True 时解码写入的帧并回 ACK 和遥测。
+    """
+
+    def __init__(self, port="sim", baudrate=9600, timeout=None, frame_protocol=True, model_wire=True):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.frame_protocol = frame_protocol
+        self.byte_time = 10.0 / baudrate if model_wire else 0.0  # 8N1 每字节 10 bit
+        self.lock = threading.Lock()
+        self.writes = []            # [(写入时间, bytes)]
+        self.replies = queue.Queue()
+        self.decoder = FrameDecoder()
+        self.telemetry_seq = 0
+        self.distance_cm = 0
+        self.servo_angle = 90
+        self.motion = 'S'
+        self.started = time.time()
+        self.is_open = True
+
+    def write(self, data):
+        data = bytes(data)
+        if self.byte_time:
+            time.sleep(len(data) * self.byte_time)
+        with self.lock:
+            self.writes.append((time.time(), data))
+            frames = self.decoder.feed(data) if self.frame_protocol else []
+        for frame in frames:
+            self._execute(frame)
+        return len(data)
+
+    def _execute(self, frame):
+        """模拟 Arduino 执行一帧：更新状态、回 ACK 与一条遥测"""
+        if frame.opcode == OP_CHAR and frame.payload:
+            command = chr(frame.payload[0])
+            self.servo_angle = {'G': 90, 'H': 180, 'J': 0}.get(command, self.servo_angle)
+            if command not in ('G', 'H', 'J', 'U'):
+                self.motion = command
+            status = ACK_OK
+        elif frame.opcode == OP_VELOCITY:
+            self.motion = 'V'
+            status = ACK_OK
+        else:
+            status = ACK_UNKNOWN
+        self.replies.put(encode_frame(frame.seq, OP_ACK, bytes([status])))
+        self.telemetry_seq += 1
+        uptime = int((time.time() - self.started) * 1000) & 0xFFFFFFFF
+        payload = struct.pack(TELEMETRY_FORMAT, self.distance_cm, self.servo_angle,
+                              ord(self.motion), frame.seq, uptime)
+        self.replies.put(encode_frame(self.telemetry_seq, OP_TELEMETRY, payload))
+
+    @property
+    def in_waiting(self):
+        return self.replies.qsize()
+
+    def read(self, size=1):
+        try:
+            first = self.replies.get(timeout=self.timeout)
+        except queue.Empty:
+            return b""
+        data = bytearray(first)
+        while len(data) < size:
+            try:
+                data.extend(self.replies.get_nowait())
+            except queue.Empty:
+                break
+        return bytes(data)
+
+    def close(self):
+        self.is_open = False
+
+    def commands(self):
+        """把写入的字节还原成指令序列 [(写入时间, 指令)]，速度指令为 "V<前进>,<平移>,<旋转>" 整数"""
+        with self.lock:
+            writes = list(self.writes)
+        result = []
+        if not self.frame_protocol:
+            for timestamp, data in writes:
+                text = data.decode("ascii", "replace")
+                result.append((timestamp, text.rstrip("\n")))
+            return result
+        decoder = FrameDecoder()
+        for timestamp, data in writes:
+            for frame in decoder.feed(data):
+                if frame.opcode == OP_CHAR:
+                    result.append((timestamp, frame.payload.decode("ascii", "replace")))
+                elif frame.opcode == OP_VELOCITY:
+                    values = struct.unpack("<bbb", frame.payload)
+                    result.append((timestamp, "V" + ",".join(str(v) for v in values)))
+        return result
+
+
+# ================= 超声波障碍场景 =================
+# script(elapsed_s, servo_angle) -> 距离 cm；舵机 90=正前方, 0=左, 180=右
+# (与 car_server 避障一致：'J' 转到 0° 扫左侧，'H' 转到 180° 扫右侧)
+def _clear(elapsed, angle):
+    return 200.0
+
+
+def _wall(elapsed, angle):
+    """正前方 20cm 有墙，左侧空旷，右侧较近"""
+    return {90: 20.0, 0: 150.0, 180: 60.0}.get(angle, 100.0)
+
+
+def _approach(elapsed, angle):
+    """正前方障碍以 10cm/s 靠近，最终停在 15cm"""
+    if angle != 90:
+        return 100.0
+    return max(15.0, 150.0 - 10.0 * elapsed)
+
+
+def _flicker(elapsed, angle):
+    """路况良好，但每秒出现一次 5cm 的噪声回波 (中值滤波应忽略)"""
+    return 5.0 if int(elapsed * 20) % 20 == 0 else 200.0
+
+
+SCENARIOS = {
+    "clear": _clear,
+    "wall": _wall,
+    "approach": _approach,
+    "flicker": _flicker,
+}
+
+
+def open_serial(backend, port, baudrate, timeout=None, frame_protocol=True):
+    if backend == "sim":
+        return SimSerial(port, baudrate, timeout=timeout, frame_protocol=frame_protocol)
+    import serial
+    return serial.Serial(port, baudrate, timeout=timeout)
+
+
+def open_distance_sensor(backend, echo, trigger, scenario="clear"):
+    if backend == "sim":
+        if scenario not in SCENARIOS:
+            raise ValueError(f"未知的模拟场景: {scenario} (可选 {', '.join(SCENARIOS)})")
+        return FakeDistanceSensor(script=SCENARIOS[scenario])
+    from gpiozero import DistanceSensor
+    return DistanceSensor(echo=echo, trigger=trigger)
@@ -0,0 +1,251 @@
+"""
+小车指令通道 (本地 UDP)
+
+vision_tracker.py / voice_controller.py 通过一个常驻的 UDP socket 把指令
+发给 car_server.py，省去每条指令的 TCP 建连和 HTTP 解析。
+CarLink 为同步版本 (线程安全)，AsyncCarLink 为 asyncio 版本。
+每条请求带序号，car_server 处理完后回一个应答，用来测量往返时间 (RTT)；
+超时没有应答的请求记为丢失。
+
+数据报格式 (UTF-8 文本):
+    请求: "<seq> CMD <指令>"   例如 "12 CMD F"
+          "<seq> LOG <日志>"   例如 "13 LOG [AI] 好的"
+          "<seq> STAT <来源> <键>=<值> ..."  上报状态，例如 "14 STAT vision fps=12.5 target=39"
+          "<seq> STATUS -"     查询小车当前状态，应答为紧凑的 JSON (见 car_server.get_car_status)
+    应答: "<seq> <结果>"       例如 "12 FORWARD"
+带延迟追踪时 seq 后面跟 "|<Trace 编码>" (见 tracing.py)，例如
+          "12|a1b2c3d4;vision;capture=...,decision=... CMD F"
+
+指令除了单字符 (F/B/L/R/Q/E/S) 外，还可以是速度指令
+"V<前进>,<平移>,<旋转>"，三个分量都在 -1..1 之间，例如 "V0.40,0.00,-0.25"。
+前进为正、向右平移为正、顺时针 (右转) 为正。
+"""
+import asyncio
+import json
+import math
+import socket
+import threading
+import time
+
+CAR_LINK_HOST = "127.0.0.1"
+CAR_LINK_PORT = 5002
+MAX_DATAGRAM = 8192
+
+
+def parse_request(data):
+    """解析请求数据报，返回 (seq, op, arg, trace)，trace 为 Trace 编码字符串或 None，格式错误抛出 ValueError"""
+    head, op, arg = data.decode('utf-8').split(' ', 2)
+    seq, _, trace = head.partition('|')
+    return int(seq), op, arg, trace or None
+
+
+def format_reply(seq, result):
+    return f"{seq} {result}".encode('utf-8')
+
+
+def _clamp_unit(value):
+    return max(-1.0, min(1.0, value))
+
+
+def format_velocity(forward, strafe, yaw):
+    """生成速度指令字符串"""
+    return f"V{_clamp_unit(forward):.2f},{_clamp_unit(strafe):.2f},{_clamp_unit(yaw):.2f}"
+
+
+def parse_velocity(cmd):
+    """解析速度指令，返回 (forward, strafe, yaw)，格式错误抛出 ValueError"""
+    if not cmd.startswith('V'):
+        raise ValueError(f"不是速度指令: {cmd}")
+    forward, strafe, yaw = (float(v) for v in cmd[1:].split(','))
+    if not all(math.isfinite(v) for v in (forward, strafe, yaw)):
+        raise ValueError(f"速度分量无效: {cmd}")
+    return _clamp_unit(forward), _clamp_unit(strafe), _clamp_unit(yaw)
+
+
+def format_report(source, fields):
+    """STAT 请求的参数: "<来源> <键>=<值> ..."，值中不能有空格"""
+    return " ".join([source] + [f"{key}={value}" for key, value in fields.items()])
+
+
+def parse_report(arg):
+    """解析 STAT 请求的参数，返回 (来源, {键: 值字符串})，格式错误抛出 ValueError"""
+    source, *pairs = arg.split()
+    fields = {}
+    for pair in pairs:
+        key, sep, value = pair.partition("=")
+        if not key or not sep:
+            raise ValueError(f"状态字段格式错误: {pair}")
+        fields[key] = value
+    return source, fields
+
+
+class _LinkStats:
+    """CarLink / AsyncCarLink 共用的 RTT 与丢失统计"""
+
+    def _init_stats(self, rtt_histogram):
+        self.rtt_histogram = rtt_histogram  # tracing.Histogram，提供时按秒记录每次 RTT
+        self.stats = {
+            "sent": 0,
+            "acked": 0,
+            "dropped": 0,       # 超时或发送失败
+            "last_rtt_ms": 0.0,
+            "avg_rtt_ms": 0.0,
+            "max_rtt_ms": 0.0,
+        }
+
+    def _record_rtt(self, op, rtt_ms):
+        self.stats["acked"] += 1
+        self.stats["last_rtt_ms"] = rtt_ms
+        self.stats["max_rtt_ms"] = max(self.stats["max_rtt_ms"], rtt_ms)
+        self.stats["avg_rtt_ms"] += 0.1 * (rtt_ms - self.stats["avg_rtt_ms"])
+        if self.rtt_histogram is not None:
+            self.rtt_histogram.observe(rtt_ms / 1000, op)
+
+    def _summary(self, st):
+        return (f"指令通道: 发送 {st['sent']} / 应答 {st['acked']} / 丢失 {st['dropped']}, "
+                f"RTT 平均 {st['avg_rtt_ms']:.2f}ms 最大 {st['max_rtt_ms']:.2f}ms")
+
+
+def _format_head(seq, trace):
+    head = str(seq)
+    if trace is not None:
+        trace.mark("link_send")
+        head += "|" + trace.encode()
+    return head
+
+
+class CarLink(_LinkStats):
+    """客户端：一个长期复用的 UDP socket，线程安全"""
+
+    def __init__(self, host=CAR_LINK_HOST, port=CAR_LINK_PORT, timeout=0.05, rtt_histogram=None):
+        self.timeout = timeout
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect((host, port))
+        self.lock = threading.Lock()
+        self.seq = 0
+        self._init_stats(rtt_histogram)
+
+    def send(self, cmd, timeout=None, trace=None):
+        """发送运动指令，返回 car_server 的处理结果，丢失时返回 None"""
+        return self._request("CMD", cmd, timeout, trace)
+
+    def log(self, msg, timeout=None):
+        """把日志发到网页终端"""
+        return self._request("LOG", msg, timeout)
+
+    def report(self, source, timeout=None, **fields):
+        """上报本进程的状态 (如跟踪帧率)，car_server 在 STATUS 中转给其他进程"""
+        return self._request("STAT", format_report(source, fields), timeout)
+
+    def status(self, timeout=None):
+        """查询小车当前状态，返回字典；car_server 未响应时返回 None"""
+        result = self._request("STATUS", "-", timeout)
+        try:
+            return json.loads(result) if result else None
+        except ValueError:
+            return None
+
+    def _request(self, op, arg, timeout, trace=None):
+        timeout = self.timeout if timeout is None else timeout
+        with self.lock:
+            self.seq += 1
+            seq = self.seq
+            self.stats["sent"] += 1
+            start = time.perf_counter()
+            deadline = start + timeout
+            head = _format_head(seq, trace)
+            try:
+                self.sock.send(f"{head} {op} {arg}".encode('utf-8')[:MAX_DATAGRAM])
+                while True:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        raise socket.timeout()
+                    self.sock.settimeout(remaining)
+                    reply_seq, _, result = self.sock.recv(MAX_DATAGRAM).decode('utf-8').partition(' ')
+                    # 丢弃之前超时请求迟到的应答
+                    if int(reply_seq) == seq:
+                        break
+            except (OSError, ValueError):
+                # socket.timeout / 服务器未启动 (ConnectionRefused) 都算丢失
+                self.stats["dropped"] += 1
+                return None
+
+            self._record_rtt(op, (time.perf_counter() - start) * 1000)
+            return result
+
+    def summary(self):
+        """一行统计信息，方便打印"""
+        with self.lock:
+            return self._summary(dict(self.stats))
+
+    def close(self):
+        self.sock.close()
+
+
+class AsyncCarLink(_LinkStats, asyncio.DatagramProtocol):
+    """
+    asyncio 版本的客户端 (voice_controller 使用)：请求按序号匹配应答，
+    等待应答时不阻塞事件循环，多条请求可以同时在途。用前先 await connect()。
+    """
+
+    def __init__(self, host=CAR_LINK_HOST, port=CAR_LINK_PORT, timeout=0.05, rtt_histogram=None):
+        self.address = (host, port)
+        self.timeout = timeout
+        self.transport = None
+        self.pending = {}   # seq -> Future
+        self.seq = 0
+        self._init_stats(rtt_histogram)
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        await loop.create_datagram_endpoint(lambda: self, remote_addr=self.address)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            reply_seq, _, result = data.decode('utf-8').partition(' ')
+            future = self.pending.get(int(reply_seq))
+        except ValueError:
+            return
+        # 已经超时的请求不在 pending 里，迟到的应答直接丢弃
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def error_received(self, exc):
+        pass  # 服务器未启动 (ConnectionRefused)：等超时记为丢失
+
+    async def send(self, cmd, timeout=None, trace=None):
+        """发送运动指令，返回 car_server 的处理结果，丢失时返回 None"""
+        return await self._request("CMD", cmd, timeout, trace)
+
+    async def log(self, msg, timeout=None):
+        return await self._request("LOG", msg, timeout)
+
+    async def _request(self, op, arg, timeout, trace=None):
+        timeout = self.timeout if timeout is None else timeout
+        self.seq += 1
+        seq = self.seq
+        self.stats["sent"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[seq] = future
+        start = time.perf_counter()
+        try:
+            self.transport.sendto(f"{_format_head(seq, trace)} {op} {arg}".encode('utf-8')[:MAX_DATAGRAM])
+            result = await asyncio.wait_for(future, timeout)
+        except (OSError, AttributeError, asyncio.TimeoutError):
+            # 未连接 / 发送失败 / 超时都算丢失
+            self.stats["dropped"] += 1
+            return None
+        finally:
+            self.pending.pop(seq, None)
+        self._record_rtt(op, (time.perf_counter() - start) * 1000)
+        return result
+
+    def summary(self):
+        return self._summary(self.stats)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
@@ -0,0 +1,111 @@
+"""
+树莓派 <-> Arduino 串口帧协议 (纯 Python 编解码)
+
+帧格式:
+    0xA5 | seq | opcode | len | payload (len 字节) | crc8
+    crc8 覆盖 seq / opcode / len / payload，多项式 0x07，初值 0。
+
+主机 -> Arduino:
+    OP_CHAR      payload = 1 字节的单字符指令 (F/B/L/R/S/G/H/J/U ...)
+    OP_VELOCITY  payload = 3 个 int8 (前进, 平移, 旋转)，范围 -100..100
+Arduino -> 主机:
+    OP_ACK       seq = 被确认的指令序号, payload = 1 字节状态 (ACK_OK / ACK_UNKNOWN)
+    OP_TELEMETRY seq = 遥测计数, payload 见 TELEMETRY_FORMAT
+
+Arduino 仍然兼容旧的纯 ASCII 指令 (0xA5 不是可打印字符，不会混淆)。
+编解码与应答的测试见 tests/test_car_protocol.py，不需要硬件。
+"""
+import struct
+from collections import namedtuple
+
+START_BYTE = 0xA5
+MAX_PAYLOAD = 32
+
+OP_CHAR = 0x01
+OP_VELOCITY = 0x02
+OP_ACK = 0x80
+OP_TELEMETRY = 0x81
+
+ACK_OK = 0
+ACK_UNKNOWN = 1
+
+# 距离 cm (uint16), 舵机角度 (uint8), 当前动作字符 (uint8),
+# 最近执行的指令序号 (uint8), 运行时间 ms (uint32)，小端
+TELEMETRY_FORMAT = "<HBBBI"
+
+Frame = namedtuple("Frame", "seq opcode payload")
+Telemetry = namedtuple("Telemetry", "distance_cm servo_angle motion last_seq uptime_ms")
+
+
+def crc8(data):
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def encode_frame(seq, opcode, payload=b""):
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError(f"payload 过长: {len(payload)}")
+    body = bytes([seq & 0xFF, opcode, len(payload)]) + bytes(payload)
+    return bytes([START_BYTE]) + body + bytes([crc8(body)])
+
+
+def encode_command(seq, command):
+    """
+    把 car_server 内部的指令字符串编码成帧：
+    单字符 -> OP_CHAR，"V<前进>,<平移>,<旋转>" (整数 -100..100) -> OP_VELOCITY
+    """
+    if command.startswith('V'):
+        values = [max(-100, min(100, int(v))) for v in command[1:].split(',')]
+        return encode_frame(seq, OP_VELOCITY, struct.pack("<bbb", *values))
+    return encode_frame(seq, OP_CHAR, command.encode('ascii')[:1])
+
+
+def parse_telemetry(payload):
+    distance, angle, motion, last_seq, uptime = struct.unpack(TELEMETRY_FORMAT, payload)
+    return Telemetry(distance, angle, chr(motion), last_seq, uptime)
+
+
+class FrameDecoder:
+    """增量解码：feed() 任意切分的字节流，返回其中完整且校验通过的帧"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.crc_errors = 0
+        self.skipped_bytes = 0  # 帧外的字节 (例如旧固件打印的文本)
+
+    def feed(self, data):
+        self.buffer.extend(data)
+        frames = []
+        while True:
+            start = self.buffer.find(START_BYTE)
+            if start < 0:
+                self.skipped_bytes += len(self.buffer)
+                self.buffer.clear()
+                break
+            if start:
+                self.skipped_bytes += start
+                del self.buffer[:start]
+            if len(self.buffer) < 4:
+                break
+            length = self.buffer[3]
+            if length > MAX_PAYLOAD:
+                # 不可能的长度，说明这个 0xA5 不是帧头
+                self.skipped_bytes += 1
+                del self.buffer[:1]
+                continue
+            total = 5 + length
+            if len(self.buffer) < total:
+                break
+            body = bytes(self.buffer[1:total - 1])
+            if crc8(body) != self.buffer[total - 1]:
+                self.crc_errors += 1
+                del self.buffer[:1]  # 从下一个字节重新找帧头
+                continue
+            frames.append(Frame(body[0], body[1], body[3:]))
+            del self.buffer[:total]
+        return frames
+
@@ -1,24 +1,43 @@
-import serial
 import threading
-from flask import Flask, render_template_string, request
-from gpiozero import DistanceSensor
+from flask import Flask, Response, render_template_string, request
+from car_hardware import open_serial, open_distance_sensor
+from distance_sampler import DistanceSampler
+import os
 import time
 from collections import deque
 import json
+import math
+import socket
+from car_link import (CAR_LINK_HOST, CAR_LINK_PORT, MAX_DATAGRAM, parse_request, format_reply, parse_velocity,
+                      parse_report)
+from car_protocol import (FrameDecoder, encode_command, parse_telemetry,
+                          OP_ACK, OP_TELEMETRY, ACK_OK)
+from tracing import Trace, Registry, TraceLog, PROMETHEUS_CONTENT_TYPE
 
 # ===================================================================
 # 配置区域
 # ===================================================================
+HARDWARE_BACKEND = os.environ.get('CAR_HARDWARE', 'pi')      # 'pi' 真实硬件，'sim' 模拟 (见 car_hardware.py)
+SIM_SCENARIO = os.environ.get('CAR_SIM_SCENARIO', 'clear')   # 模拟超声波的障碍场景
 SERIAL_PORT = '/dev/ttyACM0'  # 确认端口
 BAUD_RATE = 9600
+# 'ascii' 旧的单字符协议，任何版本的固件都能用；'frame' 带序号与应答的帧协议 (见 car_protocol.py)，
+# 需要烧录新版 arduino_car.ino (旧固件会把帧里的字节当成运动指令执行)
+SERIAL_PROTOCOL = os.environ.get('CAR_SERIAL_PROTOCOL', 'ascii')
+ACK_TIMEOUT = 0.5             # 帧协议下超过该时间没有应答的指令记为丢失 (s)
 MIN_EMERGENCY_DISTANCE = 30.0 # 触发避障的距离 (cm)
+CLEAR_HYSTERESIS = 5.0        # 距离超过 MIN_EMERGENCY_DISTANCE + 该值才解除急刹 (cm)
+SERVO_CENTER = 90
+SERVO_ANGLES = {'G': SERVO_CENTER, 'H': 180, 'J': 0}  # 舵机指令 -> 角度 (与 Arduino 一致)，避障时 J 扫左侧、H 扫右侧
 
 # ===================================================================
 # 1. 串口与状态管理
 # ===================================================================
 try:
-    ser = serial.Serial(SERIAL_PORT, BAUD_RATE)
-    print(f"成功连接到 Arduino 端口 {SERIAL_PORT}")
+    # 读超时让应答读取线程可以定期检查超时的指令
+    ser = open_serial(HARDWARE_BACKEND, SERIAL_PORT, BAUD_RATE, timeout=0.1,
+                      frame_protocol=(SERIAL_PROTOCOL == 'frame'))
+    print(f"成功连接到 Arduino 端口 {SERIAL_PORT} ({HARDWARE_BACKEND})")
 except Exception as e:
     print(f"!!! 错误: 无法连接到 {SERIAL_PORT}。 {e}")
     ser = None
@@ -27,65 +46,533 @@ except Exception as e:
 obstacle_state = {
     "lock": threading.Lock(),
     "emergency_stop": False,
+    "blocked": False,        # 滤波后的前方距离是否在急刹范围内 (带回差)，急刹只在它由 False 变 True 时触发
 }
 
-def send_to_arduino(command):
-    if ser:
+# 小车当前状态，供 OLED 等显示进程通过 /api/status 或 UDP STATUS 读取
+STATUS_REPORT_TTL = 3.0  # 其他进程的状态上报超过该时间未更新视为离线 (s)
+car_status = {
+    "lock": threading.Lock(),
+    "command": None,       # 最近一条运动指令
+    "command_time": None,
+    "reports": {},         # 来源 -> (字段字典, 上报时间)，例如 vision -> {"fps": "12.5"}
+}
+
+# 延迟追踪与 /metrics 指标 (见 tracing.py)
+metrics = Registry()
+trace_log = TraceLog(metrics, "car")
+serial_queue_seconds = metrics.histogram(
+    "car_serial_queue_seconds", "Serial queue wait from enqueue to write done")
+serial_ack_seconds = metrics.histogram(
+    "car_serial_ack_seconds", "Serial frame write to Arduino ACK")
+
+# ===================================================================
+# 1.1 串口发送队列 (单线程写串口)
+# ===================================================================
+# 所有线程 (Flask 请求 / gpiozero 回调 / 避障) 只负责把指令放进队列,
+# 由唯一的写线程按顺序写入串口，避免多线程同时 ser.write 交错。
+SERIAL_QUEUE_SIZE = 16        # 队列上限，满了丢弃最旧的指令
+SERIAL_RESEND_INTERVAL = 1.0  # 与上一条已发送指令相同时，间隔超过该时间才重发 (s)
+MOTION_COMMANDS = ('F', 'B', 'L', 'R', 'Q', 'E')
+VELOCITY_SCALE = 100          # 速度指令写入串口时放大为 -100..100 的整数
+
+def is_motion_command(command):
+    """运动指令：单字符运动或速度指令 (以 V 开头)"""
+    return command in MOTION_COMMANDS or command.startswith('V')
+
+serial_state = {
+    "cond": threading.Condition(),
+    "queue": deque(),          # (command, enqueue_time, trace)
+    "last_cmd": None,          # 最近一次写入串口的指令
+    "last_write_time": 0.0,
+    "sent": 0,                 # 实际写入串口的条数
+    "coalesced": 0,            # 被合并掉的重复指令条数
+    "dropped": 0,              # 队列满或被急停清掉的条数
+    "errors": 0,
+    "last_latency_ms": 0.0,    # 入队 -> 写入完成 的耗时
+    "max_latency_ms": 0.0,
+    "avg_latency_ms": 0.0,
+}
+
+def send_to_arduino(command, trace=None):
+    """把指令放入串口发送队列 (立即返回，不等待串口)"""
+    if not ser:
+        return
+    if trace is not None:
+        trace.mark("queued")
+    finished = []  # (trace, outcome)，出锁后再记录
+    cond = serial_state["cond"]
+    with cond:
+        queue = serial_state["queue"]
+        if command == 'S':
+            # 安全停车插队：未发出的运动指令已经没有意义，直接清掉
+            pending = len(queue)
+            kept = [item for item in queue if not is_motion_command(item[0])]
+            finished.extend((item[2], "dropped") for item in queue if is_motion_command(item[0]))
+            serial_state["dropped"] += pending - len(kept)
+            queue.clear()
+            queue.extend(kept)
+            if queue and queue[0][0] == 'S':
+                serial_state["coalesced"] += 1
+                finished.append((trace, "coalesced"))
+            else:
+                queue.appendleft((command, time.time(), trace))
+        elif queue and queue[-1][0] == command:
+            # 与队尾相同的指令直接合并 (例如跟踪脚本每 200ms 重复发送)
+            serial_state["coalesced"] += 1
+            finished.append((trace, "coalesced"))
+        elif queue and command.startswith('V') and queue[-1][0].startswith('V'):
+            # 连续的速度指令只需要最新的一条
+            finished.append((queue[-1][2], "superseded"))
+            queue[-1] = (command, queue[-1][1], trace)
+            serial_state["coalesced"] += 1
+        else:
+            if len(queue) >= SERIAL_QUEUE_SIZE:
+                finished.append((queue.popleft()[2], "dropped"))
+                serial_state["dropped"] += 1
+            queue.append((command, time.time(), trace))
+        cond.notify()
+    for old_trace, outcome in finished:
+        if old_trace is not None:
+            trace_log.finish(old_trace, outcome)
+
+def serial_writer_loop():
+    """串口写线程：依次取出队列中的指令写入串口"""
+    cond = serial_state["cond"]
+    while True:
+        with cond:
+            while not serial_state["queue"]:
+                cond.wait()
+            command, enqueue_time, trace = serial_state["queue"].popleft()
+            # 与刚写出去的指令相同且时间很近，Arduino 状态不会变化，跳过；
+            # 速度指令除外：重发是给固件看门狗的心跳，必须送达
+            skip = (command == serial_state["last_cmd"] and not command.startswith('V') and
+                    time.time() - serial_state["last_write_time"] < SERIAL_RESEND_INTERVAL)
+            if skip:
+                serial_state["coalesced"] += 1
+        if skip:
+            if trace is not None:
+                trace_log.finish(trace, "coalesced")
+            continue
+
+        if trace is not None:
+            trace.mark("serial_write")
         try:
-            ser.write(command.encode('utf-8'))
+            ser.write(encode_for_wire(command, trace))
             # print(f"发送 -> Arduino: {command}") # 调试时可打开
         except Exception as e:
             print(f"!!! 串口写入错误: {e}")
+            with cond:
+                serial_state["errors"] += 1
+            if trace is not None:
+                trace_log.finish(trace, "error")
+            continue
+
+        # 舵机指令写出后通知采样服务，让它按新角度缓存距离
+        if command in SERVO_ANGLES and distance_sampler is not None:
+            distance_sampler.set_servo_angle(SERVO_ANGLES[command])
+
+        now = time.time()
+        latency_ms = (now - enqueue_time) * 1000
+        serial_queue_seconds.observe(now - enqueue_time)
+        if trace is not None and SERIAL_PROTOCOL != 'frame':
+            # 旧协议没有应答，写完即结束
+            trace.mark("written", now)
+            trace_log.finish(trace, "written")
+        with cond:
+            serial_state["last_cmd"] = command
+            serial_state["last_write_time"] = now
+            serial_state["sent"] += 1
+            serial_state["last_latency_ms"] = latency_ms
+            serial_state["max_latency_ms"] = max(serial_state["max_latency_ms"], latency_ms)
+            # 指数滑动平均，避免保存全部样本
+            serial_state["avg_latency_ms"] += 0.1 * (latency_ms - serial_state["avg_latency_ms"])
+
+def get_serial_stats():
+    """串口队列状态 (供 /api/serial_stats 使用)"""
+    with serial_state["cond"]:
+        stats = {k: v for k, v in serial_state.items() if k not in ("cond", "queue")}
+        stats["queue_depth"] = len(serial_state["queue"])
+    return stats
+
+# ===================================================================
+# 1.2 帧协议：应答与遥测
+# ===================================================================
+link_state = {
+    "lock": threading.Lock(),
+    "seq": 0,
+    "pending": {},          # seq -> (command, write_time, trace)，等待应答的指令
+    "acked": 0,
+    "rejected": 0,          # Arduino 不认识的指令
+    "lost": 0,              # 超时没有应答
+    "crc_errors": 0,
+    "last_rtt_ms": 0.0,     # 写入 -> 收到应答
+    "avg_rtt_ms": 0.0,
+    "max_rtt_ms": 0.0,
+    "telemetry": None,
+    "telemetry_time": 0.0,
+}
+
+def encode_for_wire(command, trace=None):
+    """把队列里的指令转换成串口字节 (帧协议下同时登记等待应答)"""
+    if SERIAL_PROTOCOL != 'frame':
+        # 旧协议：速度指令以换行结尾，其余为单字符
+        return (command + '\n' if command.startswith('V') else command).encode('utf-8')
+    with link_state["lock"]:
+        link_state["seq"] = (link_state["seq"] + 1) % 256
+        seq = link_state["seq"]
+        link_state["pending"][seq] = (command, time.time(), trace)
+    return encode_command(seq, command)
+
+def serial_reader_loop():
+    """串口读线程：解码 Arduino 发回的应答与遥测帧"""
+    decoder = FrameDecoder()
+    while True:
+        try:
+            data = ser.read(ser.in_waiting or 1)
+        except Exception as e:
+            print(f"!!! 串口读取错误: {e}")
+            time.sleep(1.0)
+            continue
+
+        now = time.time()
+        frames = decoder.feed(data) if data else []
+        finished = []  # (trace, outcome)，出锁后再记录
+        with link_state["lock"]:
+            for frame in frames:
+                if frame.opcode == OP_ACK:
+                    sent = link_state["pending"].pop(frame.seq, None)
+                    if sent is None:
+                        continue  # 已经按丢失处理过的迟到应答
+                    accepted = frame.payload[:1] == bytes([ACK_OK])
+                    if not accepted:
+                        link_state["rejected"] += 1
+                    if sent[2] is not None:
+                        sent[2].mark("acked", now)
+                        finished.append((sent[2], "acked" if accepted else "rejected"))
+                    serial_ack_seconds.observe(now - sent[1])
+                    rtt_ms = (now - sent[1]) * 1000
+                    link_state["acked"] += 1
+                    link_state["last_rtt_ms"] = rtt_ms
+                    link_state["max_rtt_ms"] = max(link_state["max_rtt_ms"], rtt_ms)
+                    link_state["avg_rtt_ms"] += 0.1 * (rtt_ms - link_state["avg_rtt_ms"])
+                elif frame.opcode == OP_TELEMETRY:
+                    try:
+                        link_state["telemetry"] = parse_telemetry(frame.payload)._asdict()
+                        link_state["telemetry_time"] = now
+                    except Exception:
+                        pass
+
+            # 超时未应答的指令记为丢失
+            for seq, (_, write_time, trace) in list(link_state["pending"].items()):
+                if now - write_time > ACK_TIMEOUT:
+                    del link_state["pending"][seq]
+                    link_state["lost"] += 1
+                    if trace is not None:
+                        finished.append((trace, "lost"))
+            link_state["crc_errors"] = decoder.crc_errors
+        for trace, outcome in finished:
+            trace_log.finish(trace, outcome)
+
+def get_link_stats():
+    """应答延迟、丢失数与最近一次遥测 (供 /api/telemetry 使用)"""
+    with link_state["lock"]:
+        stats = {k: v for k, v in link_state.items() if k not in ("lock", "pending", "seq")}
+        stats["protocol"] = SERIAL_PROTOCOL
+        stats["in_flight"] = len(link_state["pending"])
+        if link_state["telemetry_time"]:
+            stats["telemetry_age"] = round(time.time() - link_state["telemetry_time"], 2)
+    return stats
 
 # ===================================================================
 # 2. 传感器逻辑 (GPIOZERO)
 # ===================================================================
 def emergency_brake_detected():
-    """距离过近，立刻停车"""
+    """距离由安全变为过近，立刻停车"""
     global obstacle_state
     with obstacle_state["lock"]:
-        if obstacle_state["emergency_stop"]:
+        # 只在 安全 -> 过近 的边沿刹车：手动后退解除急刹后，离开障碍的过程中
+        # 距离仍小于阈值，不能每次采样都再刹一次 (否则 B 之后 50ms 就被 S 打断)
+        if obstacle_state["blocked"]:
             return
+        obstacle_state["blocked"] = True
         add_log(f"!!! 触发紧急刹车 (<{MIN_EMERGENCY_DISTANCE}cm) !!!")
         obstacle_state["emergency_stop"] = True
     
     send_to_arduino('S') # 物理停车
 
 def emergency_brake_cleared():
-    """距离恢复安全"""
+    """距离恢复安全 (超过回差)，重新允许触发急刹"""
     global obstacle_state
     with obstacle_state["lock"]:
+        obstacle_state["blocked"] = False
         if obstacle_state["emergency_stop"]:
             add_log("--- 障碍解除 ---")
             obstacle_state["emergency_stop"] = False
 
+def check_emergency_distance(sampler):
+    """每次采样后调用：用中值滤波后的距离判断急刹 (带回差)，单次噪声回波不会触发"""
+    # 舵机扫向两侧或刚回中还没稳定时测的不是正前方，不参与判断
+    if sampler.servo_angle != SERVO_CENTER:
+        return
+    distance = sampler.settled_median()
+    if math.isnan(distance):
+        return
+    if distance < MIN_EMERGENCY_DISTANCE:
+        emergency_brake_detected()
+    elif distance > MIN_EMERGENCY_DISTANCE + CLEAR_HYSTERESIS:
+        emergency_brake_cleared()
+
 try:
     # 超声波引脚 (BCM编码)
     GPIO_TRIG = 23
     GPIO_ECHO = 24
     
-    ultrasonic_sensor = DistanceSensor(echo=GPIO_ECHO, trigger=GPIO_TRIG)
-    ultrasonic_sensor.threshold_distance = MIN_EMERGENCY_DISTANCE / 100.0
-    ultrasonic_sensor.when_in_range = emergency_brake_detected
-    ultrasonic_sensor.when_out_of_range = emergency_brake_cleared
+    ultrasonic_sensor = open_distance_sensor(HARDWARE_BACKEND, GPIO_ECHO, GPIO_TRIG, SIM_SCENARIO)
+    # 连续采样代替 gpiozero 的阈值回调
+    distance_sampler = DistanceSampler(ultrasonic_sensor, on_sample=check_emergency_distance)
     
     print(f"超声波传感器就绪 (T:{GPIO_TRIG}, E:{GPIO_ECHO})")
 
 except Exception as e:
     print(f"!!! 传感器初始化失败: {e}")
     ultrasonic_sensor = None
+    distance_sampler = None
+
+# ===================================================================
+# 2.1 避障状态机 (后台线程)
+# ===================================================================
+# /move 只负责触发和查询，扫描 / 回中 / 旋转由后台线程按阶段执行，
+# 每个阶段用 cancel 事件等待代替 time.sleep，新指令可以随时打断。
+AVOID_SCAN_TIMEOUT = 1.0   # 舵机转到一侧后最多等待多久拿到稳定读数 (s)
+AVOID_CENTER_SETTLE = 0.3  # 舵机回中的时间 (s)
+AVOID_ROTATE_TIME = 0.4    # 原地旋转避让的时间 (s)
+
+avoid_state = {
+    "lock": threading.Lock(),
+    "trigger": threading.Event(),
+    "cancel": threading.Event(),
+    "phase": "IDLE",        # IDLE / SCAN_LEFT / SCAN_RIGHT / RECENTER / ROTATE_LEFT / ROTATE_RIGHT
+    "result": None,         # 上一次避障结果
+    "dist_left": None,
+    "dist_right": None,
+    "started": 0.0,
+}
+
+def read_distance_at(angle):
+    """
+    等待采样服务给出该舵机角度稳定后的滤波距离 (cm)，被打断时返回 None。
+    传感器不可用或超时没有读数时视为无路可走。
+    """
+    if distance_sampler is None:
+        return 0.0
+    deadline = time.time() + AVOID_SCAN_TIMEOUT
+    while time.time() < deadline:
+        if avoid_state["cancel"].is_set():
+            return None
+        distance = distance_sampler.distance_at(angle, timeout=0.05)
+        if distance is not None:
+            return distance
+    return 0.0
+
+def start_avoidance():
+    """触发一次避障，已经在执行时返回 False"""
+    with avoid_state["lock"]:
+        if avoid_state["phase"] != "IDLE":
+            return False
+        avoid_state["phase"] = "SCAN_LEFT"
+        avoid_state["result"] = None
+        avoid_state["dist_left"] = None
+        avoid_state["dist_right"] = None
+        avoid_state["started"] = time.time()
+        avoid_state["cancel"].clear()
+        avoid_state["trigger"].set()
+    return True
+
+def cancel_avoidance():
+    """打断正在执行的避障 (新指令到来时调用)"""
+    with avoid_state["lock"]:
+        if avoid_state["phase"] == "IDLE":
+            return False
+        avoid_state["cancel"].set()
+    return True
+
+def _avoid_step(phase, command, duration):
+    """进入一个阶段：发送指令后等待 duration 秒，被打断返回 False"""
+    with avoid_state["lock"]:
+        # 在锁内检查并发送，保证打断后不会再有旧的动作写进串口队列
+        if avoid_state["cancel"].is_set():
+            return False
+        avoid_state["phase"] = phase
+        send_to_arduino(command)
+    return not avoid_state["cancel"].wait(duration)
+
+def _run_avoidance():
+    """完整的避障流程，返回结果字符串"""
+    # A. 扫描左侧 (Arduino 'J')
+    # 舵机到位并稳定后，采样服务会更新该角度的滤波距离，这里直接等这个读数
+    dist_left = None
+    if _avoid_step("SCAN_LEFT", 'J', 0):
+        dist_left = read_distance_at(SERVO_ANGLES['J'])
+    if dist_left is None:
+        send_to_arduino('G')
+        return "CANCELLED"
+    avoid_state["dist_left"] = dist_left
+    add_log(f"左侧距离: {dist_left:.1f}cm")
+
+    # B. 扫描右侧 (Arduino 'H')
+    dist_right = None
+    if _avoid_step("SCAN_RIGHT", 'H', 0):
+        dist_right = read_distance_at(SERVO_ANGLES['H'])
+    if dist_right is None:
+        send_to_arduino('G')
+        return "CANCELLED"
+    avoid_state["dist_right"] = dist_right
+    add_log(f"右侧距离: {dist_right:.1f}cm")
+
+    # C. 舵机回中 (Arduino 'G')
+    if not _avoid_step("RECENTER", 'G', AVOID_CENTER_SETTLE):
+        return "CANCELLED"
+
+    # D. 决策 (麦克纳姆轮：原地旋转)
+    # 哪边空旷就往哪边原地转一小会儿，停下
+    if dist_left > MIN_EMERGENCY_DISTANCE and dist_left > dist_right:
+        add_log(">> 决定：原地左旋避让")
+        if not _avoid_step("ROTATE_LEFT", 'L', AVOID_ROTATE_TIME):
+            return "CANCELLED"
+        send_to_arduino('S')
+        return "AVOIDED LEFT"
+
+    elif dist_right > MIN_EMERGENCY_DISTANCE and dist_right >= dist_left:
+        add_log(">> 决定：原地右旋避让")
+        if not _avoid_step("ROTATE_RIGHT", 'R', AVOID_ROTATE_TIME):
+            return "CANCELLED"
+        send_to_arduino('S')
+        return "AVOIDED RIGHT"
+
+    else:
+        add_log(">> 决定：死胡同，无法避让")
+        return "BLOCKED"
+
+def avoidance_worker():
+    """避障后台线程：等待触发，执行一次完整流程后回到 IDLE"""
+    while True:
+        avoid_state["trigger"].wait()
+        avoid_state["trigger"].clear()
+        try:
+            result = _run_avoidance()
+        except Exception as e:
+            print(f"!!! 避障流程出错: {e}")
+            result = "ERROR"
+        if result == "CANCELLED":
+            add_log("--- 避障被新指令打断 ---")
+        with avoid_state["lock"]:
+            avoid_state["phase"] = "IDLE"
+            avoid_state["result"] = result
+
+def get_avoid_status():
+    """避障状态 (供 /api/avoid_status 使用)"""
+    with avoid_state["lock"]:
+        status = {k: avoid_state[k] for k in ("phase", "result", "dist_left", "dist_right")}
+        if avoid_state["phase"] != "IDLE":
+            status["elapsed"] = round(time.time() - avoid_state["started"], 2)
+    return status
+
+threading.Thread(target=avoidance_worker, daemon=True).start()
+
+def _report_value(text):
+    try:
+        value = float(text)
+    except ValueError:
+        return text
+    return value if math.isfinite(value) else None  # NaN / inf 不是合法 JSON
+
+def update_report(source, fields):
+    """记录其他进程上报的状态 (UDP STAT)，数值字段转成 float"""
+    fields = {key: _report_value(value) for key, value in fields.items()}
+    with car_status["lock"]:
+        car_status["reports"][source] = (fields, time.time())
+
+def get_car_status():
+    """显示用的状态摘要，字段都很便宜，可以高频查询"""
+    now = time.time()
+    with obstacle_state["lock"]:
+        emergency_stop = obstacle_state["emergency_stop"]
+    with avoid_state["lock"]:
+        phase = avoid_state["phase"]
+    with car_status["lock"]:
+        command = car_status["command"]
+        command_time = car_status["command_time"]
+        reports = {source: fields for source, (fields, t) in car_status["reports"].items()
+                   if now - t < STATUS_REPORT_TTL}
+    vision = reports.get("vision", {})
+    distance = distance_sampler.median() if distance_sampler else None
+    if distance is not None and not math.isfinite(distance):
+        distance = None  # 没有有效读数时 median() 为 NaN，json.dumps 会输出非法的 NaN
+    return {
+        "emergency_stop": emergency_stop,
+        "avoid_phase": phase,
+        "command": command,
+        "command_age": round(now - command_time, 1) if command_time else None,
+        "distance_cm": round(distance, 1) if distance is not None else None,
+        "tracker_fps": vision.get("fps"),
+        "tracker_paused": bool(vision.get("paused")) if vision else None,
+        "reports": reports,
+    }
 
 # ===================================================================
 # 3. 网页服务器
 # ===================================================================
 
-LOG_BUFFER = deque(maxlen=20) # 只保留最近 20 条记录的日志队列
+LOG_BUFFER = deque(maxlen=20) # 只保留最近 20 条记录的日志队列, 元素为 (seq, line)
+LOG_HEARTBEAT = 15.0          # 推送流空闲时的心跳间隔 (s)，用于发现断开的浏览器
+
+# 日志序号单调递增，客户端断线重连时用 ?since= 只取新日志
+log_state = {
+    "cond": threading.Condition(),
+    "seq": 0,
+}
 
 def add_log(message):
     """添加日志并打印到后台控制台"""
     print(message) # 保持后台可见
     timestamp = time.strftime("%H:%M:%S", time.localtime())
-    LOG_BUFFER.append(f"[{timestamp}] {message}")
+    with log_state["cond"]:
+        log_state["seq"] += 1
+        LOG_BUFFER.append((log_state["seq"], f"[{timestamp}] {message}"))
+        log_state["cond"].notify_all()
+
+def logs_since(since):
+    """返回序号大于 since 的日志 (调用方需持有 log_state["cond"])"""
+    # 服务器重启后序号归零，客户端带来的旧序号需要作废
+    if since > log_state["seq"]:
+        since = 0
+    return [(seq, line) for seq, line in LOG_BUFFER if seq > since]
+
+def log_stream(since):
+    """SSE 生成器：只推送新日志，空闲时发送心跳"""
+    while True:
+        with log_state["cond"]:
+            entries = logs_since(since)
+            if not entries:
+                log_state["cond"].wait(timeout=LOG_HEARTBEAT)
+                entries = logs_since(since)
+        if not entries:
+            yield ": keep-alive\n\n"
+            continue
+        for seq, line in entries:
+            payload = json.dumps({"seq": seq, "line": line}, ensure_ascii=False)
+            yield f"id: {seq}\ndata: {payload}\n\n"
+        since = entries[-1][0]
+
+# 串口与采样线程在 import 时启动 (压测与测试直接 import car_server)，但要等它们用到的
+# SERVO_ANGLES、distance_sampler、add_log 等全部定义之后，不能依赖线程启动的时机
+if ser:
+    threading.Thread(target=serial_writer_loop, daemon=True).start()
+    if SERIAL_PROTOCOL == 'frame':
+        threading.Thread(target=serial_reader_loop, daemon=True).start()
+if distance_sampler is not None:
+    distance_sampler.start()
     
 app = Flask(__name__)
 
@@ -119,8 +606,11 @@ HTML_CONTROLLER = """
             border-radius: 4px;
             overflow: hidden;
             flex-shrink: 0;
+            position: relative;
         }
         img { width: 100%; height: 100%; object-fit: cover; }
+        /* 检测框叠加层 (直通推流时由浏览器绘制) */
+        #overlay { position: absolute; top: 0; left: 0; width: 100%; height: 100%; pointer-events: none; }
         
         /* === 控制面板 === */
         .control-panel {
@@ -225,6 +715,7 @@ HTML_CONTROLLER = """
 <body>
     <div class="video-container">
         <img id="cam-stream" src="" alt="NO SIGNAL">
+        <canvas id="overlay" width="300" height="225"></canvas>
     </div>
 
     <div class="control-panel">
@@ -246,7 +737,8 @@ HTML_CONTROLLER = """
 
     <script>
         const host = window.location.hostname;
-        const streamUrl = `http://${host}:5001/video_feed`;
+        // 默认原始画面 (直通模式下不重新编码)，只有 Wi-Fi 跟不上 (写出阻塞) 时才自动降档
+        const streamUrl = `http://${host}:5001/video_feed?profile=full&adaptive=1`;
         document.getElementById('cam-stream').src = streamUrl;
 
         // 按钮映射
@@ -273,29 +765,71 @@ HTML_CONTROLLER = """
             fetch(`/move?cmd=${cmd}`);
         }
 
-        // === 终端日志轮询 ===
+        // === 终端日志推送 (SSE) ===
         const term = document.getElementById('terminal');
-        
-        setInterval(() => {
-            fetch('/api/get_logs')
-                .then(res => res.json())
-                .then(data => {
-                    // 清空并重新渲染
-                    term.innerHTML = ""; 
-                    data.forEach(line => {
-                        const div = document.createElement('div');
-                        div.className = 'log-line';
-                        // 简单的颜色高亮处理
-                        if(line.includes("[AI]")) div.className += " log-ai";
-                        if(line.includes("!!!")) div.className += " log-warn";
-                        if(line.includes("CMD")) div.className += " log-sys";
-                        div.innerText = line;
-                        term.appendChild(div);
-                    });
-                    // 自动滚动到底部
-                    term.scrollTop = term.scrollHeight;
-                });
-        }, 1000); // 每秒刷新一次
+        const MAX_LOG_LINES = 20;
+        let lastSeq = 0;
+
+        function appendLog(line) {
+            const div = document.createElement('div');
+            div.className = 'log-line';
+            // 简单的颜色高亮处理
+            if(line.includes("[AI]")) div.className += " log-ai";
+            if(line.includes("!!!")) div.className += " log-warn";
+            if(line.includes("CMD")) div.className += " log-sys";
+            div.innerText = line;
+            term.appendChild(div);
+            // 只保留最近的若干行
+            while (term.childElementCount > MAX_LOG_LINES) {
+                term.removeChild(term.firstElementChild);
+            }
+            // 自动滚动到底部
+            term.scrollTop = term.scrollHeight;
+        }
+
+        // EventSource 断线后会自动重连，并通过 Last-Event-ID 从上次的位置续传
+        const logSource = new EventSource('/api/log_stream');
+        logSource.onmessage = (e) => {
+            const entry = JSON.parse(e.data);
+            if (entry.seq <= lastSeq) return; // 重连时可能重复
+            lastSeq = entry.seq;
+            appendLog(entry.line);
+        };
+
+        // === 检测框叠加 (vision_tracker 直通推流时画面上没有框，由这里绘制) ===
+        const overlay = document.getElementById('overlay');
+        const ctx = overlay.getContext('2d');
+        const OVERLAY_STALE_MS = 1000; // 超过这个时间没有新数据就清掉旧框
+        let overlayTimer = null;
+
+        function drawOverlay(meta) {
+            ctx.clearRect(0, 0, overlay.width, overlay.height);
+            const sx = overlay.width / meta.w, sy = overlay.height / meta.h;
+            const rect = (b) => ctx.strokeRect(b[0] * sx, b[1] * sy, (b[2] - b[0]) * sx, (b[3] - b[1]) * sy);
+            // 颜色与 vision_tracker 的 draw 模式一致：目标绿色粗框，其他红色细框，光流推算黄色
+            meta.boxes.forEach(b => {
+                if (b[4]) {
+                    ctx.strokeStyle = '#00ff00'; ctx.lineWidth = 2; rect(b);
+                    ctx.fillStyle = '#00ff00'; ctx.font = '11px monospace';
+                    const label = `TARGET ${meta.target}` + (b[5] ? ` #${b[5]}` : '');
+                    ctx.fillText(label, b[0] * sx, Math.max(10, b[1] * sy - 3));
+                } else {
+                    ctx.strokeStyle = '#ff0000'; ctx.lineWidth = 1; rect(b);
+                }
+            });
+            if (meta.flow) {
+                ctx.strokeStyle = '#ffff00'; ctx.lineWidth = 1.5; rect(meta.flow);
+            }
+            if (meta.paused) {
+                ctx.fillStyle = '#ff9f43'; ctx.font = '11px monospace';
+                ctx.fillText('PAUSED', 4, 12);
+            }
+            clearTimeout(overlayTimer);
+            overlayTimer = setTimeout(() => ctx.clearRect(0, 0, overlay.width, overlay.height), OVERLAY_STALE_MS);
+        }
+
+        const overlaySource = new EventSource(`http://${host}:5001/overlay_stream`);
+        overlaySource.onmessage = (e) => drawOverlay(JSON.parse(e.data));
     </script>
 </body>
 </html>
@@ -320,13 +854,104 @@ def api_log_message():
 # 给前端提供日志数据
 @app.route('/api/get_logs')
 def api_get_logs():
-    return json.dumps(list(LOG_BUFFER))
+    since = request.args.get('since', 0, type=int)
+    with log_state["cond"]:
+        entries = logs_since(since)
+    return json.dumps([line for _, line in entries])
+
+# 日志推送流 (SSE)，断线重连时通过 ?since= 或 Last-Event-ID 续传
+@app.route('/api/log_stream')
+def api_log_stream():
+    since = request.args.get('since', type=int)
+    if since is None:
+        since = request.headers.get('Last-Event-ID', 0, type=int)
+    return Response(log_stream(since), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# 串口队列深度与延迟统计
+@app.route('/api/serial_stats')
+def api_serial_stats():
+    return json.dumps(get_serial_stats())
+
+# 超声波滤波距离与各角度的缓存读数
+@app.route('/api/distance')
+def api_distance():
+    if distance_sampler is None:
+        return json.dumps({"error": "sensor unavailable"})
+    return json.dumps(distance_sampler.stats())
+
+# Arduino 应答延迟、丢失与遥测
+@app.route('/api/telemetry')
+def api_telemetry():
+    return json.dumps(get_link_stats())
+
+# 小车状态摘要：急刹、当前指令、避障阶段、跟踪帧率
+@app.route('/api/status')
+def api_status():
+    return json.dumps(get_car_status())
+
+# 避障状态机当前阶段
+@app.route('/api/avoid_status')
+def api_avoid_status():
+    return json.dumps(get_avoid_status())
+
+# 最近完成的延迟追踪 (各跳相对起点的毫秒数)
+@app.route('/api/traces')
+def api_traces():
+    return json.dumps(trace_log.latest(request.args.get('n', 50, type=int)))
+
+# 已有的统计字典按 Prometheus 格式导出 (抓取时取值)
+for _name, _help, _fn, _kind in [
+    ("car_serial_sent_total", "Commands written to the serial port", lambda: serial_state["sent"], "counter"),
+    ("car_serial_coalesced_total", "Duplicate commands merged before the serial port", lambda: serial_state["coalesced"], "counter"),
+    ("car_serial_dropped_total", "Commands dropped from the serial queue", lambda: serial_state["dropped"], "counter"),
+    ("car_serial_errors_total", "Serial write errors", lambda: serial_state["errors"], "counter"),
+    ("car_serial_queue_depth", "Commands waiting in the serial queue", lambda: len(serial_state["queue"]), "gauge"),
+    ("car_serial_acked_total", "Frames acknowledged by the Arduino", lambda: link_state["acked"], "counter"),
+    ("car_serial_lost_total", "Frames without ACK within the timeout", lambda: link_state["lost"], "counter"),
+    ("car_serial_crc_errors_total", "Frames from the Arduino with bad CRC", lambda: link_state["crc_errors"], "counter"),
+    ("car_emergency_stop", "1 while the emergency brake is engaged", lambda: int(obstacle_state["emergency_stop"]), "gauge"),
+    ("car_distance_cm", "Median front distance", lambda: distance_sampler and distance_sampler.median(), "gauge"),
+]:
+    metrics.callback(_name, _help, _fn, _kind)
+
+@app.route('/metrics')
+def api_metrics():
+    return Response(metrics.render(), mimetype=PROMETHEUS_CONTENT_TYPE)
 
 @app.route('/move')
 def move():
-    global obstacle_state
     cmd = request.args.get('cmd')
     if not cmd: return "No Command", 400
+    # Trace 可以放在 X-Trace 请求头或 ?trace= 参数里
+    return run_traced_command(cmd, request.headers.get('X-Trace') or request.args.get('trace'))
+
+def run_traced_command(cmd, trace_text):
+    """解析随指令传来的 Trace 并执行指令；没有进入串口队列的 Trace 在这里结束"""
+    trace = None
+    if trace_text:
+        try:
+            trace = Trace.decode(trace_text)
+        except ValueError:
+            pass
+    if trace is None:
+        return handle_command(cmd)
+    trace.mark("received")
+    result = handle_command(cmd, trace)
+    if not trace.has("queued"):
+        trace_log.finish(trace, "not_sent")
+    return result
+
+def handle_command(cmd, trace=None):
+    """执行一条运动指令 (HTTP /move 与 UDP 指令通道共用)，返回结果字符串"""
+    global obstacle_state
+    with car_status["lock"]:
+        car_status["command"] = cmd
+        car_status["command_time"] = time.time()
+
+    # 速度指令 (PID 跟踪时频繁发送，不写日志)
+    if cmd.startswith('V'):
+        return handle_velocity(cmd, trace)
 
     # 简单记录非停止指令
     if cmd != 'S':
@@ -334,71 +959,106 @@ def move():
 
     # 1. 检查是否是“前进”指令且处于急刹状态
     if cmd == 'F':
+        # 避障进行中：重复的前进指令只查询进度，不打断
+        with avoid_state["lock"]:
+            phase = avoid_state["phase"]
+        if phase != "IDLE":
+            return f"AVOIDING {phase}"
+
         with obstacle_state["lock"]:
             is_blocked = obstacle_state["emergency_stop"]
         
         if is_blocked:
-            # === 触发智能避障逻辑 ===
-            add_log("检测到阻挡，开始自动扫描避障...")
-            
-            # A. 扫描左侧 (Arduino 'J')
-            send_to_arduino('J') 
-            time.sleep(0.6) 
-            # 手动读取一次距离，因为 gpiozero 是基于阈值的，需要具体数值
-            dist_left = ultrasonic_sensor.distance * 100
-            add_log(f"左侧距离: {dist_left:.1f}cm")
-            
-            # B. 扫描右侧 (Arduino 'H')
-            send_to_arduino('H')
-            time.sleep(0.6)
-            dist_right = ultrasonic_sensor.distance * 100
-            add_log(f"右侧距离: {dist_right:.1f}cm")
-            
-            # C. 舵机回中 (Arduino 'G')
-            send_to_arduino('G')
-            time.sleep(0.3)
-            
-            # D. 决策 (麦克纳姆轮：原地旋转)
-            # 哪边空旷就往哪边原地转一小会儿，停下
-            if dist_left > MIN_EMERGENCY_DISTANCE and dist_left > dist_right:
-                add_log(">> 决定：原地左旋避让")
-                send_to_arduino('L') # 原地左转
-                time.sleep(0.4)      # 转动时间
-                send_to_arduino('S')
-                return "AVOIDED LEFT"
-                
-            elif dist_right > MIN_EMERGENCY_DISTANCE and dist_right >= dist_left:
-                add_log(">> 决定：原地右旋避让")
-                send_to_arduino('R') # 原地右转
-                time.sleep(0.4)      # 转动时间
-                send_to_arduino('S')
-                return "AVOIDED RIGHT"
-                
-            else:
-                add_log(">> 决定：死胡同，无法避让")
-                return "BLOCKED"
+            # === 触发智能避障逻辑 (后台执行，立即返回) ===
+            if start_avoidance():
+                add_log("检测到阻挡，开始自动扫描避障...")
+            return "AVOIDING"
         
         else:
             # 路况良好
-            send_to_arduino('F')
+            send_to_arduino('F', trace)
             return "FORWARD"
 
+    # 其它任何指令都会打断正在执行的避障
+    cancel_avoidance()
+
     # 2. 后退指令 (B) - 后退能解除软件层面的急刹锁
-    elif cmd == 'B':
+    if cmd == 'B':
         with obstacle_state["lock"]:
             if obstacle_state["emergency_stop"]:
                 obstacle_state["emergency_stop"] = False
                 print("手动后退 -> 解除急刹锁定")
-        send_to_arduino('B')
+        send_to_arduino('B', trace)
         return "BACKWARD"
     
     else:
         # 为了安全，每次手动操作非前进指令时，最好让舵机回正
         send_to_arduino('G') 
-        send_to_arduino(cmd)
+        send_to_arduino(cmd, trace)
         return f"CMD {cmd}"
 
+def handle_velocity(cmd, trace=None):
+    """速度指令 V<前进>,<平移>,<旋转>：换算成整数后转发给 Arduino 做麦克纳姆混合"""
+    try:
+        forward, strafe, yaw = parse_velocity(cmd)
+    except ValueError:
+        return "Bad Velocity"
+
+    if forward > 0:
+        # 向前的分量与 F 指令一样受急刹与避障约束
+        with avoid_state["lock"]:
+            phase = avoid_state["phase"]
+        if phase != "IDLE":
+            return f"AVOIDING {phase}"
+        with obstacle_state["lock"]:
+            is_blocked = obstacle_state["emergency_stop"]
+        if is_blocked:
+            if start_avoidance():
+                add_log("检测到阻挡，开始自动扫描避障...")
+            return "AVOIDING"
+
+    cancel_avoidance()
+    if forward == 0 and strafe == 0 and yaw == 0:
+        send_to_arduino('S', trace)
+        return "STOP"
+    values = (round(v * VELOCITY_SCALE) for v in (forward, strafe, yaw))
+    send_to_arduino("V" + ",".join(str(v) for v in values), trace)
+    return "VELOCITY"
+
+# ===================================================================
+# 6. UDP 指令通道 (供 vision_tracker / voice_controller 使用)
+# ===================================================================
+def car_link_server():
+    """监听本地 UDP 端口，按到达顺序处理指令并回应答"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((CAR_LINK_HOST, CAR_LINK_PORT))
+    print(f"UDP 指令通道已在 {CAR_LINK_HOST}:{CAR_LINK_PORT} 启动")
+    while True:
+        data, addr = sock.recvfrom(MAX_DATAGRAM)
+        try:
+            seq, op, arg, trace = parse_request(data)
+        except ValueError:
+            continue
+        try:
+            if op == "CMD":
+                result = run_traced_command(arg, trace) if arg else "No Command"
+            elif op == "LOG":
+                add_log(arg)
+                result = "OK"
+            elif op == "STAT":
+                update_report(*parse_report(arg))
+                result = "OK"
+            elif op == "STATUS":
+                result = json.dumps(get_car_status(), separators=(",", ":"))
+            else:
+                result = f"Unknown op {op}"
+        except Exception as e:
+            print(f"!!! 指令处理出错: {e}")
+            result = "ERROR"
+        sock.sendto(format_reply(seq, result), addr)
+
 if __name__ == '__main__':
+    threading.Thread(target=car_link_server, daemon=True).start()
     try:
         app.run(host='0.0.0.0', port=5000, threaded=True) # Threaded 对 Flask+GPIO 很重要
     finally:
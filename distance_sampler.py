@@ -0,0 +1,203 @@
+"""
+超声波连续采样服务
+
+后台线程以固定频率读取距离，写入定长数组实现的环形缓冲区
+(时间戳 / 距离 / 当时的舵机角度)，并提供:
+  - 向量化的中值与 EMA 滤波，单次回波噪声不会直接触发急刹
+  - 按舵机角度缓存的距离：舵机转到某个角度并稳定后，自动更新该角度的读数
+  - FakeDistanceSensor：不接硬件时使用的假传感器
+
+传感器只需要提供 gpiozero.DistanceSensor 一样的 distance 属性 (单位 m)。
+"""
+import threading
+import time
+
+import numpy as np
+
+SAMPLE_RATE_HZ = 20     # 采样频率
+RING_SIZE = 256         # 环形缓冲区长度 (20Hz 下约 12 秒)
+SERVO_SETTLE = 0.3      # 舵机转动后等待多久的读数才算这个角度的距离 (s)
+MEDIAN_WINDOW = 5       # 中值滤波窗口 (样本数)
+EMA_ALPHA = 0.3
+EMA_WINDOW = 20
+
+
+class DistanceRing:
+    """定长数组实现的环形缓冲区，读出时按时间顺序排列"""
+
+    def __init__(self, size=RING_SIZE):
+        self.size = size
+        self.times = np.zeros(size)
+        self.values = np.full(size, np.nan)
+        self.angles = np.zeros(size, dtype=np.int16)
+        self.count = 0  # 累计写入次数
+        self.lock = threading.Lock()
+
+    def append(self, timestamp, value, angle):
+        with self.lock:
+            index = self.count % self.size
+            self.times[index] = timestamp
+            self.values[index] = value
+            self.angles[index] = angle
+            self.count += 1
+
+    def latest(self, n=None):
+        """最近 n 个样本 (默认全部)，返回 (times, values, angles) 三个数组的拷贝"""
+        with self.lock:
+            available = min(self.count, self.size)
+            n = available if n is None else min(n, available)
+            indices = (np.arange(self.count - n, self.count)) % self.size
+            return self.times[indices], self.values[indices], self.angles[indices]
+
+
+def median_filter(values):
+    """忽略 NaN 的中值，没有有效样本时返回 NaN"""
+    valid = values[~np.isnan(values)]
+    return float(np.median(valid)) if valid.size else float("nan")
+
+
+def ema_filter(values, alpha=EMA_ALPHA):
+    """按时间顺序的指数滑动平均，一次向量运算算出最后一个点的值"""
+    valid = values[~np.isnan(values)]
+    if not valid.size:
+        return float("nan")
+    weights = (1 - alpha) ** np.arange(valid.size - 1, -1, -1)
+    return float(np.dot(weights, valid) / weights.sum())
+
+
+class DistanceSampler:
+    """后台采样线程 + 环形缓冲区 + 按角度的距离缓存"""
+
+    def __init__(self, sensor, rate_hz=SAMPLE_RATE_HZ, size=RING_SIZE,
+                 settle=SERVO_SETTLE, on_sample=None):
+        self.sensor = sensor
+        self.period = 1.0 / rate_hz
+        self.settle = settle
+        self.on_sample = on_sample  # 每次采样后回调 on_sample(self)
+        self.ring = DistanceRing(size)
+        self.cond = threading.Condition()
+        self.servo_angle = 90
+        self.servo_moved = 0.0
+        self.angle_cache = {}       # 角度 -> (距离 cm, 更新时间)
+        self.read_errors = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=1.0)
+
+    def _loop(self):
+        next_time = time.time()
+        while self.running:
+            try:
+                value = self.sensor.distance * 100
+            except Exception:
+                self.read_errors += 1
+                value = float("nan")
+            now = time.time()
+            with self.cond:
+                angle, moved = self.servo_angle, self.servo_moved
+            self.ring.append(now, value, angle)
+
+            # 舵机已稳定：用稳定之后的样本更新这个角度的距离
+            if now - moved >= self.settle:
+                filtered = self._median_after(angle, moved)
+                if not np.isnan(filtered):
+                    with self.cond:
+                        if self.servo_moved == moved:
+                            self.angle_cache[angle] = (filtered, now)
+                            self.cond.notify_all()
+
+            if self.on_sample:
+                try:
+                    self.on_sample(self)
+                except Exception as e:
+                    print(f"!!! 距离回调出错: {e}")
+
+            next_time += self.period
+            delay = next_time - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_time = time.time()  # 落后太多时不追赶
+
+    def set_servo_angle(self, angle):
+        """舵机转动时调用 (串口写出舵机指令之后)"""
+        with self.cond:
+            if angle == self.servo_angle:
+                return
+            self.servo_angle = angle
+            self.servo_moved = time.time()
+        if hasattr(self.sensor, "servo_angle"):
+            self.sensor.servo_angle = angle  # 让假传感器模拟不同方向的障碍
+
+    def _median_after(self, angle, moved, window=MEDIAN_WINDOW):
+        times, values, angles = self.ring.latest(window)
+        mask = (times >= moved + self.settle) & (angles == angle)
+        return median_filter(values[mask])
+
+    def median(self, window=MEDIAN_WINDOW):
+        """最近 window 个样本的中值 (cm)"""
+        return median_filter(self.ring.latest(window)[1])
+
+    def settled_median(self, window=MEDIAN_WINDOW):
+        """只用舵机在当前角度稳定之后的样本求中值，还没稳定时返回 NaN"""
+        with self.cond:
+            angle, moved = self.servo_angle, self.servo_moved
+        return self._median_after(angle, moved, window)
+
+    def ema(self, alpha=EMA_ALPHA, window=EMA_WINDOW):
+        return ema_filter(self.ring.latest(window)[1], alpha)
+
+    def distance_at(self, angle, timeout=0.0):
+        """
+        舵机当前角度稳定后的滤波距离 (cm)。舵机刚转到该角度时最多等待 timeout 秒，
+        直到稳定后的读数出来；舵机不在该角度或还没有新读数时返回 None。
+        """
+        def fresh():
+            cached = self.angle_cache.get(angle)
+            return cached is not None and self.servo_angle == angle and cached[1] >= self.servo_moved
+        with self.cond:
+            if not fresh() and timeout > 0:
+                self.cond.wait_for(fresh, timeout)
+            return self.angle_cache[angle][0] if fresh() else None
+
+    def stats(self):
+        with self.cond:
+            cache = {str(a): round(v, 1) for a, (v, _) in self.angle_cache.items()}
+            angle = self.servo_angle
+        median, ema = self.median(), self.ema()
+        return {
+            "median_cm": None if np.isnan(median) else round(median, 1),
+            "ema_cm": None if np.isnan(ema) else round(ema, 1),
+            "servo_angle": angle,
+            "angle_cache": cache,
+            "samples": self.ring.count,
+            "read_errors": self.read_errors,
+        }
+
+
+class FakeDistanceSensor:
+    """
+    假传感器，接口与 gpiozero.DistanceSensor 一致 (distance 单位 m)。
+    script(elapsed_s, servo_angle) -> 距离 cm，不提供时返回固定的 distance_cm。
+    """
+
+    def __init__(self, distance_cm=100.0, script=None):
+        self.distance_cm = distance_cm
+        self.script = script
+        self.servo_angle = 90
+        self.start_time = time.time()
+
+    @property
+    def distance(self):
+        if self.script is not None:
+            return self.script(time.time() - self.start_time, self.servo_angle) / 100.0
+        return self.distance_cm / 100.0
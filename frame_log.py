@@ -0,0 +1,137 @@
+"""
+帧日志 (内存映射文件)
+
+录制摄像头画面 (JPEG)、采集时间戳以及跟踪线程发出的指令，
+供 vision_tracker.py --replay 离线回放和基准测试使用。
+
+文件布局 (小端):
+    文件头: 魔数 b"CARLOG01" | 数据末尾偏移 uint64 | 帧数 uint32 | 指令数 uint32 | 保留 8 字节
+    记录:   类型 uint8 | 保留 3 字节 | 序号 uint32 | 时间戳 float64 | 长度 uint32 | 数据
+指令记录的序号是发出该指令时最近一帧的序号，回放时可以逐帧对比。
+每写一条记录都会更新文件头，程序中途退出时已写入的部分仍然可读。
+"""
+import mmap
+import struct
+import threading
+
+import cv2
+
+MAGIC = b"CARLOG01"
+HEADER = struct.Struct("<8sQII8x")
+RECORD = struct.Struct("<B3xIdI")
+
+REC_FRAME = 1
+REC_COMMAND = 2
+
+DEFAULT_CAPACITY = 512 * 1024 * 1024  # 预分配大小 (稀疏文件，关闭时截断到实际长度)
+DEFAULT_JPEG_QUALITY = 90
+
+
+class FrameLogWriter:
+    def __init__(self, path, capacity=DEFAULT_CAPACITY, jpeg_quality=DEFAULT_JPEG_QUALITY):
+        self.path = path
+        self.capacity = capacity
+        self.jpeg_quality = jpeg_quality
+        self.file = open(path, "w+b")
+        self.file.truncate(capacity)
+        self.mm = mmap.mmap(self.file.fileno(), capacity)
+        self.lock = threading.Lock()
+        self.offset = HEADER.size
+        self.frames = 0
+        self.commands = 0
+        self.full = False
+        self._write_header()
+
+    def _write_header(self):
+        HEADER.pack_into(self.mm, 0, MAGIC, self.offset, self.frames, self.commands)
+
+    def _append(self, kind, seq, timestamp, data):
+        end = self.offset + RECORD.size + len(data)
+        if end > self.capacity:
+            if not self.full:
+                print(f"!!! 帧日志已满 ({self.capacity // (1024 * 1024)}MB)，停止录制")
+            self.full = True
+            return False
+        RECORD.pack_into(self.mm, self.offset, kind, seq, timestamp, len(data))
+        self.mm[self.offset + RECORD.size:end] = data
+        self.offset = end
+        return True
+
+    def add_frame(self, timestamp, frame):
+        """录制一帧原始画面 (BGR)，编码为 JPEG 以节省空间"""
+        flag, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if flag:
+            self.add_frame_jpeg(timestamp, encoded.tobytes())
+
+    def add_frame_jpeg(self, timestamp, jpeg):
+        with self.lock:
+            if self._append(REC_FRAME, self.frames, timestamp, jpeg):
+                self.frames += 1
+                self._write_header()
+
+    def add_command(self, timestamp, command):
+        """记录一条指令，关联到最近录制的一帧"""
+        with self.lock:
+            if self._append(REC_COMMAND, max(self.frames - 1, 0), timestamp, command.encode("utf-8")):
+                self.commands += 1
+                self._write_header()
+
+    def close(self):
+        with self.lock:
+            self.mm.flush()
+            self.mm.close()
+            self.file.truncate(self.offset)
+            self.file.close()
+        print(f"帧日志已保存: {self.path} ({self.frames} 帧, {self.commands} 条指令, "
+              f"{self.offset / (1024 * 1024):.1f}MB)")
+
+
+class FrameLogReader:
+    """只读映射整个日志，frames() 返回的 JPEG 数据直接引用映射内存，不做拷贝"""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.end, self.frame_count, self.command_count = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"不是帧日志文件: {path}")
+
+    def records(self):
+        """按写入顺序遍历 (类型, 序号, 时间戳, 数据 memoryview)"""
+        # 遍历结束或生成器被关闭时释放整个映射的视图；调用方还拿着的数据切片要自己 del
+        with memoryview(self.mm) as view:
+            offset = HEADER.size
+            while offset + RECORD.size <= self.end:
+                kind, seq, timestamp, length = RECORD.unpack_from(self.mm, offset)
+                start = offset + RECORD.size
+                yield kind, seq, timestamp, view[start:start + length]
+                offset = start + length
+
+    def frames(self):
+        for kind, seq, timestamp, data in self.records():
+            if kind == REC_FRAME:
+                yield seq, timestamp, data
+
+    def commands(self):
+        """[(帧序号, 时间戳, 指令), ...]"""
+        return [(seq, timestamp, bytes(data).decode("utf-8"))
+                for kind, seq, timestamp, data in self.records() if kind == REC_COMMAND]
+
+    def close(self):
+        try:
+            self.mm.close()
+        except BufferError:
+            # 还有 records()/frames() 返回的数据没释放 (例如遍历中途出错，异常的 traceback 还引用着它)：
+            # 映射等这些引用消失后由垃圾回收关闭，这里不能再抛异常掩盖调用方真正的错误
+            pass
+        self.file.close()
+
+
+def is_frame_log(path):
+    """根据文件头判断是不是帧日志 (否则按视频文件处理)"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
@@ -0,0 +1,328 @@
+"""
+共享内存帧环 (multiprocessing.shared_memory)
+
+vision_tracker.py 把每一帧原始画面 (BGR) 连同序号、采集时间戳与检测结果写进一块共享内存，
+本机的其他进程 (录制、第二个检测器、语音助手描述画面等) 用 FrameRingReader 直接读取，
+不用再打开摄像头，也不用从 MJPEG 流解码。读到的画面是指向共享内存的 NumPy 视图，不做拷贝。
+
+内存布局 (小端):
+    头部 (64 字节): 魔数 b"CARRING1" | 槽数 uint32 | 宽 uint32 | 高 uint32 | 通道数 uint32
+                    | 最大检测数 uint32 | 保留 4 字节 | 最新序号 uint64 | 最新写入时间 float64
+                    | 读者心跳 float64 | 保留 8 字节
+    槽 0..N-1:      槽头 (64 字节) | 检测结果 float32 [最大检测数, 6] | 画面 uint8 [高, 宽, 通道]
+    槽头: 序号 uint64 | 时间戳 float64 | 目标类别 int32 | 检测数 uint32 | 目标框 int32 x4 | 标志 uint32
+    检测结果每行: x1, y1, x2, y2, 置信度, 类别
+第 seq 帧写在 (seq - 1) % 槽数 号槽里。写入前先把槽头序号清零，写完再填上序号并更新头部的最新序号；
+读者读取前后各检查一次槽头序号，不一致说明这一槽已被覆盖 (RingFrame.valid())。
+读者每次读取都会刷新心跳，写入方据此判断有没有人在读，没人读时不拷贝画面。
+
+直接运行本文件会在子进程里写、在本进程里读，做一遍自检；--watch 连接 vision_tracker 的帧环并打印帧率与检测结果。
+"""
+import argparse
+import struct
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+RING_NAME = "car_frames"
+MAGIC = b"CARRING1"
+HEADER = struct.Struct("<8sIIIII4xQdd8x")
+LATEST = struct.Struct("<Qd")     # 最新序号 + 最新写入时间
+LATEST_OFFSET = 32
+READER_OFFSET = 48                # 读者心跳 (float64)
+SLOT_HEADER = struct.Struct("<QdiI4iI20x")
+HEADER_SIZE = 64
+DET_FIELDS = 6
+
+DEFAULT_SLOTS = 4
+MAX_DETECTIONS = 64
+READER_TIMEOUT = 2.0   # 读者心跳超过该时间未刷新视为没有读者 (s)
+POLL_INTERVAL = 0.005  # 读者等待新帧时的轮询间隔 (s)
+
+FLAG_DETECTED = 1      # 这一帧跑了 YOLO (否则检测结果为空、目标框来自光流)
+FLAG_PAUSED = 2        # 跟踪已暂停 (只有画面)
+
+_SEQ = struct.Struct("<Q")
+_HEARTBEAT = struct.Struct("<d")
+
+
+def _slot_size(width, height, channels, max_detections):
+    size = SLOT_HEADER.size + max_detections * DET_FIELDS * 4 + width * height * channels
+    return (size + 63) // 64 * 64
+
+
+class _Ring:
+    """写入方与读者共用的布局计算"""
+
+    def _layout(self, slots, width, height, channels, max_detections):
+        self.slots = slots
+        self.shape = (height, width, channels)
+        self.max_detections = max_detections
+        self.slot_size = _slot_size(width, height, channels, max_detections)
+        self.frames = []
+        self.detections = []
+        buf = self.shm.buf
+        for i in range(slots):
+            base = HEADER_SIZE + i * self.slot_size
+            det_offset = base + SLOT_HEADER.size
+            frame_offset = det_offset + max_detections * DET_FIELDS * 4
+            self.detections.append(np.ndarray((max_detections, DET_FIELDS), np.float32, buf, det_offset))
+            self.frames.append(np.ndarray(self.shape, np.uint8, buf, frame_offset))
+
+    def _slot_offset(self, seq):
+        return HEADER_SIZE + (seq - 1) % self.slots * self.slot_size
+
+
+class FrameRingWriter(_Ring):
+    """写入方 (vision_tracker)：创建共享内存，进程退出时 close() 删除"""
+
+    def __init__(self, name=RING_NAME, width=640, height=480, channels=3,
+                 slots=DEFAULT_SLOTS, max_detections=MAX_DETECTIONS):
+        size = HEADER_SIZE + slots * _slot_size(width, height, channels, max_detections)
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # 上次异常退出留下的同名共享内存
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self.name = name
+        self.seq = 0
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, slots, width, height, channels, max_detections,
+                         0, 0.0, 0.0)
+        self._layout(slots, width, height, channels, max_detections)
+
+    def has_readers(self, now=None):
+        """最近有读者读取过 (心跳未过期)"""
+        heartbeat, = _HEARTBEAT.unpack_from(self.shm.buf, READER_OFFSET)
+        return (time.time() if now is None else now) - heartbeat < READER_TIMEOUT
+
+    def write(self, frame, timestamp, target_class=-1, target_box=None,
+              boxes=None, classes=None, confs=None, flags=0):
+        """
+        写入一帧，返回序号。frame 为 BGR 画面 (形状必须与创建时一致)，
+        boxes (N, 4) / classes (N,) / confs (N,) 为本帧的检测结果，超过最大检测数的部分丢弃。
+        """
+        if frame.shape != self.shape:
+            raise ValueError(f"画面尺寸 {frame.shape} 与帧环 {self.shape} 不一致")
+        seq = self.seq + 1
+        index = (seq - 1) % self.slots
+        offset = self._slot_offset(seq)
+        buf = self.shm.buf
+
+        _SEQ.pack_into(buf, offset, 0)  # 写入期间序号为 0，读者据此判断画面不完整
+        np.copyto(self.frames[index], frame)
+        count = 0
+        if boxes is not None and len(boxes):
+            count = min(len(boxes), self.max_detections)
+            det = self.detections[index]
+            det[:count, :4] = boxes[:count]
+            det[:count, 4] = confs[:count] if confs is not None else 0.0
+            det[:count, 5] = classes[:count] if classes is not None else -1
+        box = tuple(target_box) if target_box is not None else (-1, -1, -1, -1)
+        SLOT_HEADER.pack_into(buf, offset, seq, timestamp, target_class, count, *box, flags)
+        LATEST.pack_into(buf, LATEST_OFFSET, seq, time.time())
+        self.seq = seq
+        return seq
+
+    def close(self):
+        self.frames = self.detections = None  # 先释放指向共享内存的视图
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class RingFrame:
+    """读者拿到的一帧：frame / detections 是共享内存上的只读视图，用完前可用 valid() 检查是否已被覆盖"""
+    __slots__ = ("seq", "timestamp", "target_class", "target_box", "flags", "frame", "detections", "_reader")
+
+    def __init__(self, reader, seq, timestamp, target_class, target_box, flags, frame, detections):
+        self._reader = reader
+        self.seq = seq
+        self.timestamp = timestamp
+        self.target_class = target_class
+        self.target_box = target_box   # (x1, y1, x2, y2)，没有目标时为 None
+        self.flags = flags
+        self.frame = frame
+        self.detections = detections   # (N, 6): x1, y1, x2, y2, 置信度, 类别
+
+    def valid(self):
+        """这一槽还没被写入方覆盖 (视图里的数据仍然是第 seq 帧)"""
+        return self._reader._slot_seq(self.seq) == self.seq
+
+    def copy(self):
+        """拷贝出独立的数组；拷贝完成后仍有效才返回，否则返回 None"""
+        frame, detections = self.frame.copy(), self.detections.copy()
+        if not self.valid():
+            return None
+        return RingFrame(self._reader, self.seq, self.timestamp, self.target_class, self.target_box,
+                         self.flags, frame, detections)
+
+
+def _attach(name):
+    """只连接、不接管共享内存：Python 3.13 以前读者退出时 resource_tracker 会把它删掉"""
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class FrameRingReader(_Ring):
+    """读者：连接 vision_tracker 创建的帧环；帧环不存在时抛出 FileNotFoundError"""
+
+    def __init__(self, name=RING_NAME):
+        self.shm = _attach(name)
+        magic, slots, width, height, channels, max_detections, _, _, _ = HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC:
+            self.shm.close()
+            raise ValueError(f"不是帧环: {name}")
+        self._layout(slots, width, height, channels, max_detections)
+
+    def _slot_seq(self, seq):
+        return _SEQ.unpack_from(self.shm.buf, self._slot_offset(seq))[0]
+
+    def latest_seq(self):
+        return LATEST.unpack_from(self.shm.buf, LATEST_OFFSET)[0]
+
+    def latest(self):
+        """最新一帧 (RingFrame)，还没有画面或正好被覆盖时返回 None"""
+        _HEARTBEAT.pack_into(self.shm.buf, READER_OFFSET, time.time())
+        seq = self.latest_seq()
+        if seq == 0:
+            return None
+        index = (seq - 1) % self.slots
+        slot_seq, timestamp, target_class, count, x1, y1, x2, y2, flags = SLOT_HEADER.unpack_from(
+            self.shm.buf, self._slot_offset(seq))
+        if slot_seq != seq:
+            return None
+        frame = self.frames[index].view()
+        frame.flags.writeable = False
+        detections = self.detections[index][:count].view()
+        detections.flags.writeable = False
+        target_box = (x1, y1, x2, y2) if x1 >= 0 else None
+        return RingFrame(self, seq, timestamp, target_class, target_box, flags, frame, detections)
+
+    def wait(self, last_seq=0, timeout=1.0):
+        """等待比 last_seq 更新的一帧 (轮询)，超时返回 None"""
+        deadline = time.time() + timeout
+        while True:
+            if self.latest_seq() > last_seq:
+                frame = self.latest()
+                if frame is not None:
+                    return frame
+            if time.time() >= deadline:
+                return None
+            # 等待期间也刷新心跳，写入方才会继续写
+            _HEARTBEAT.pack_into(self.shm.buf, READER_OFFSET, time.time())
+            time.sleep(POLL_INTERVAL)
+
+    def close(self):
+        """调用前要先释放拿到的 RingFrame (视图还在引用共享内存时无法关闭)"""
+        self.frames = self.detections = None
+        self.shm.close()
+
+
+# ================= 自检 / 查看 =================
+def _selftest_writer(name, count, interval):
+    writer = FrameRingWriter(name, width=64, height=48, slots=3)
+    try:
+        # 等读者连上 (心跳出现) 再开始写
+        deadline = time.time() + 5
+        while not writer.has_readers() and time.time() < deadline:
+            time.sleep(0.01)
+        for i in range(1, count + 1):
+            frame = np.full((48, 64, 3), i % 256, np.uint8)
+            boxes = np.array([[i, 1, i + 10, 20]] * (i % 3))
+            writer.write(frame, time.time(), target_class=39, target_box=(i, 1, i + 10, 20) if i % 2 else None,
+                         boxes=boxes, classes=np.full(len(boxes), 39), confs=np.full(len(boxes), 0.5),
+                         flags=FLAG_DETECTED)
+            time.sleep(interval)
+        time.sleep(0.2)
+    finally:
+        writer.close()
+
+
+def _selftest():
+    import multiprocessing
+    name = f"{RING_NAME}_selftest"
+    count = 200
+    process = multiprocessing.Process(target=_selftest_writer, args=(name, count, 0.002))
+    process.start()
+    reader = None
+    for _ in range(200):
+        try:
+            reader = FrameRingReader(name)
+            break
+        except FileNotFoundError:
+            time.sleep(0.01)
+    assert reader is not None, "写入进程没有创建帧环"
+
+    last_seq, received, torn, errors = 0, 0, 0, 0
+    while last_seq < count:
+        item = reader.wait(last_seq, timeout=2.0)
+        if item is None:
+            break
+        if item.seq <= last_seq:
+            errors += 1
+        last_seq = item.seq
+        received += 1
+        # 零拷贝：画面直接指向共享内存
+        if not np.shares_memory(item.frame, reader.frames[(item.seq - 1) % reader.slots]):
+            errors += 1
+        value = int(item.frame[0, 0, 0])
+        ok = item.valid()
+        if not ok:
+            torn += 1
+        elif value != item.seq % 256 or len(item.detections) != item.seq % 3:
+            errors += 1
+        elif (item.target_box is not None) != bool(item.seq % 2) or item.target_class != 39:
+            errors += 1
+        del item
+    process.join()
+    reader.close()
+    print(f"自检{'通过' if not errors and last_seq == count else '失败'}: 写入 {count} 帧, "
+          f"读到 {received} 帧 (最新 {last_seq}), 读取期间被覆盖 {torn} 帧, 错误 {errors}")
+    raise SystemExit(1 if errors or last_seq != count else 0)
+
+
+def _watch(name):
+    reader = FrameRingReader(name)
+    print(f"已连接帧环 {name}: {reader.shape[1]}x{reader.shape[0]}, {reader.slots} 槽")
+    last_seq, frames, window_start = 0, 0, time.time()
+    try:
+        while True:
+            item = reader.wait(last_seq, timeout=2.0)
+            if item is None:
+                print("(没有新画面)")
+                continue
+            last_seq = item.seq
+            frames += 1
+            now = time.time()
+            if now - window_start >= 1.0:
+                state = "暂停" if item.flags & FLAG_PAUSED else ("YOLO" if item.flags & FLAG_DETECTED else "光流")
+                print(f"#{item.seq} {frames / (now - window_start):.1f} FPS, 延迟 {(now - item.timestamp) * 1000:.0f}ms, "
+                      f"{state}, 检测 {len(item.detections)} 个, 目标 {item.target_class} {item.target_box}")
+                frames, window_start = 0, now
+            del item
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="共享内存帧环自检 / 查看")
+    parser.add_argument("--watch", action="store_true", help="连接 vision_tracker 的帧环并打印帧率与检测结果")
+    parser.add_argument("--name", default=RING_NAME)
+    args = parser.parse_args()
+    if args.watch:
+        _watch(args.name)
+    else:
+        _selftest()
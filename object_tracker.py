@@ -0,0 +1,314 @@
+"""
+多目标跟踪 (ByteTrack 风格，纯 NumPy)
+
+给每帧的 YOLO 检测框分配持久的轨迹 ID，vision_tracker 据此锁定一个目标，
+画面里有两个同类物体时不会在它们之间来回跳 (原来每帧取面积最大的框，小车会左右摆)。
+
+每次 update():
+  1. 按速度把已有轨迹的框外推到当前时刻
+  2. 第一轮: 高分检测 与 所有轨迹 按 IoU 贪心匹配 (IoU 矩阵一次向量化算出，不同类别的 IoU 记为 0)
+  3. 第二轮: 低分检测 (被遮挡时分数往往偏低) 与 剩下的轨迹 匹配，只续命不新建
+  4. 没匹配上的高分检测新建轨迹；超过 MAX_LOST_SECONDS 没有匹配到的轨迹删除
+
+直接运行本文件在合成轨迹 (两个人交叉走过、漏检、遮挡降分、误检) 上做基准测试：
+每帧关联耗时、ID 切换次数，以及与“取面积最大”相比锁定目标的跳变次数。
+"""
+import argparse
+import time
+
+import numpy as np
+
+HIGH_CONF = 0.4          # 高分检测：参与第一轮匹配，可以新建轨迹 (与原来 YOLO 的置信度阈值一致)
+LOW_CONF = 0.1           # 低分检测下限：只在第二轮匹配已有轨迹
+MATCH_IOU = 0.3          # 第一轮匹配的 IoU 下限
+LOW_MATCH_IOU = 0.5      # 第二轮 (低分检测) 要求更高的重叠
+MAX_LOST_SECONDS = 1.0   # 轨迹连续多久没匹配到就删除 (锁定的目标也在此时丢失)
+VELOCITY_SMOOTHING = 0.5 # 速度的指数平滑系数
+
+
+def iou_matrix(a, b):
+    """(N, 4) 与 (M, 4) 个 xyxy 框两两之间的 IoU，返回 (N, M)"""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+
+def _iou_matrix_loop(a, b):
+    """逐对计算的写法，仅作为基准测试的对照"""
+    result = np.zeros((len(a), len(b)), dtype=np.float32)
+    for i, (ax1, ay1, ax2, ay2) in enumerate(a):
+        for j, (bx1, by1, bx2, by2) in enumerate(b):
+            iw = min(ax2, bx2) - max(ax1, bx1)
+            ih = min(ay2, by2) - max(ay1, by1)
+            if iw <= 0 or ih <= 0:
+                continue
+            inter = iw * ih
+            result[i, j] = inter / ((ax2 - ax1) * (ay2 - ay1) + (bx2 - bx1) * (by2 - by1) - inter)
+    return result
+
+
+def greedy_match(iou, min_iou):
+    """
+    按 IoU 从大到小贪心配对，返回 (配对 [(行, 列)], 未匹配的行, 未匹配的列)。
+    只遍历超过阈值的候选对，通常只有几个。
+    """
+    rows, cols = np.nonzero(iou >= min_iou)
+    order = np.argsort(-iou[rows, cols], kind="stable")
+    used_rows, used_cols, matches = set(), set(), []
+    for r, c in zip(rows[order].tolist(), cols[order].tolist()):
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        matches.append((r, c))
+    unmatched_rows = [r for r in range(iou.shape[0]) if r not in used_rows]
+    unmatched_cols = [c for c in range(iou.shape[1]) if c not in used_cols]
+    return matches, unmatched_rows, unmatched_cols
+
+
+class MultiObjectTracker:
+    """轨迹状态按列存成 NumPy 数组，外推与 IoU 都是整批计算"""
+
+    def __init__(self, max_lost=MAX_LOST_SECONDS):
+        self.max_lost = max_lost
+        self.next_id = 1
+        self.reset()
+
+    def reset(self):
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.classes = np.zeros(0, dtype=np.int32)
+        self.boxes = np.zeros((0, 4), dtype=np.float32)     # 最近一次匹配到的框
+        self.velocity = np.zeros((0, 4), dtype=np.float32)  # 每个坐标的速度 (像素/秒)
+        self.last_seen = np.zeros(0, dtype=np.float64)
+        self.hits = np.zeros(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def alive(self, track_id):
+        return bool(np.any(self.ids == track_id))
+
+    def predict(self, timestamp):
+        """各轨迹外推到 timestamp 时的框"""
+        dt = (timestamp - self.last_seen).astype(np.float32)[:, None]
+        return self.boxes + self.velocity * dt
+
+    def _associate(self, predicted, track_index, det_boxes, det_classes, det_index, min_iou):
+        """在给定的轨迹子集与检测子集之间匹配，返回 [(轨迹下标, 检测下标)] 与未匹配的轨迹下标"""
+        if not len(track_index) or not len(det_index):
+            return [], list(track_index)
+        iou = iou_matrix(predicted[track_index], det_boxes[det_index])
+        iou[self.classes[track_index][:, None] != det_classes[det_index][None, :]] = 0.0
+        matches, unmatched_tracks, _ = greedy_match(iou, min_iou)
+        return ([(track_index[t], det_index[d]) for t, d in matches],
+                [track_index[t] for t in unmatched_tracks])
+
+    def update(self, xyxy, confs, classes, timestamp):
+        """
+        用一帧的检测结果更新轨迹，返回每个检测框对应的轨迹 ID (int64 数组)，
+        没有分配轨迹的低分检测为 0。
+        """
+        det_boxes = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        det_confs = np.asarray(confs, dtype=np.float32).reshape(-1)
+        det_classes = np.asarray(classes).astype(np.int32).reshape(-1)
+        assigned = np.zeros(len(det_boxes), dtype=np.int64)
+
+        predicted = self.predict(timestamp)
+        all_tracks = list(range(len(self.ids)))
+        high = np.flatnonzero(det_confs >= HIGH_CONF)
+        low = np.flatnonzero((det_confs >= LOW_CONF) & (det_confs < HIGH_CONF))
+
+        matches, remaining = self._associate(predicted, all_tracks, det_boxes, det_classes, high, MATCH_IOU)
+        low_matches, _ = self._associate(predicted, remaining, det_boxes, det_classes, low, LOW_MATCH_IOU)
+        matches += low_matches
+
+        if matches:
+            t_idx = np.array([t for t, _ in matches])
+            d_idx = np.array([d for _, d in matches])
+            dt = np.maximum(timestamp - self.last_seen[t_idx], 1e-3).astype(np.float32)[:, None]
+            measured = (det_boxes[d_idx] - self.boxes[t_idx]) / dt
+            self.velocity[t_idx] += VELOCITY_SMOOTHING * (measured - self.velocity[t_idx])
+            self.boxes[t_idx] = det_boxes[d_idx]
+            self.last_seen[t_idx] = timestamp
+            self.hits[t_idx] += 1
+            assigned[d_idx] = self.ids[t_idx]
+
+        # 没匹配上的高分检测新建轨迹
+        matched_dets = {d for _, d in matches}
+        new = np.array([d for d in high.tolist() if d not in matched_dets], dtype=np.int64)
+        if len(new):
+            new_ids = np.arange(self.next_id, self.next_id + len(new))
+            self.next_id += len(new)
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.classes = np.concatenate([self.classes, det_classes[new]])
+            self.boxes = np.concatenate([self.boxes, det_boxes[new]])
+            self.velocity = np.concatenate([self.velocity, np.zeros((len(new), 4), np.float32)])
+            self.last_seen = np.concatenate([self.last_seen, np.full(len(new), timestamp)])
+            self.hits = np.concatenate([self.hits, np.ones(len(new), np.int32)])
+            assigned[new] = new_ids
+
+        # 删除丢失太久的轨迹
+        keep = timestamp - self.last_seen <= self.max_lost
+        if not keep.all():
+            for name in ("ids", "classes", "boxes", "velocity", "last_seen", "hits"):
+                setattr(self, name, getattr(self, name)[keep])
+        return assigned
+
+
+def select_locked(track_ids, boxes, classes, target_class_id, locked_id):
+    """
+    锁定目标：已锁定的轨迹本帧匹配到时继续用它；还没锁定时取目标类别中面积最大的框并锁定它。
+    返回 (目标下标 或 -1, 新的锁定 ID)。锁定的轨迹本帧没匹配上时返回 -1 但保持锁定，
+    由调用方在轨迹被删除 (丢失) 后清除锁定。
+    """
+    if locked_id is not None:
+        hit = np.flatnonzero(track_ids == locked_id)
+        return (int(hit[0]) if len(hit) else -1), locked_id
+    boxes = np.asarray(boxes).reshape(-1, 4)
+    candidates = (np.asarray(classes).astype(np.int32) == target_class_id) & (track_ids > 0)
+    if not candidates.any():
+        return -1, None
+    areas = np.where(candidates, (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]), -1)
+    index = int(np.argmax(areas))
+    if areas[index] <= 0:
+        return -1, None
+    return index, int(track_ids[index])
+
+
+# ================= 基准测试 =================
+def synthetic_scene(frames, fps, extra_objects, rng):
+    """
+    合成检测序列：两个人 (类别 0) 相向走过并在中间交叉，交叉时互相遮挡 (分数降低、偶尔漏检)，
+    两人框的大小交替变化，使“面积最大”的那个来回切换；另加若干个其他物体与随机误检。
+    返回 [(时间戳, xyxy, 置信度, 类别, 真实 ID)]，误检的真实 ID 为 -1。
+    """
+    width, height = 640, 480
+    objects = [
+        # (起点 x, 速度 px/s, y, 宽, 高, 类别, 高度摆动相位)
+        (60.0, 90.0, 120.0, 80.0, 220.0, 0, 0.0),
+        (520.0, -90.0, 110.0, 80.0, 220.0, 0, np.pi),
+    ]
+    for _ in range(extra_objects):
+        objects.append((rng.uniform(0, width - 60), rng.uniform(-60, 60), rng.uniform(0, height - 80),
+                        rng.uniform(30, 80), rng.uniform(30, 80), int(rng.integers(1, 80)), 0.0))
+
+    scene = []
+    for f in range(frames):
+        t = f / fps
+        boxes, confs, classes, gt = [], [], [], []
+        person_x = [objects[0][0] + objects[0][1] * t, objects[1][0] + objects[1][1] * t]
+        crossing = abs(person_x[0] - person_x[1]) < 70
+        for gid, (x0, vx, y, w, h, cls, phase) in enumerate(objects):
+            x = (x0 + vx * t) % (width - w) if gid >= 2 else x0 + vx * t
+            h = h * (1 + 0.08 * np.sin(2 * np.pi * 0.7 * t + phase))  # 走路时框的高度起伏
+            conf = rng.uniform(0.6, 0.95)
+            if gid < 2 and crossing:
+                conf = rng.uniform(0.15, 0.5)  # 互相遮挡
+            if rng.random() < (0.25 if gid < 2 and crossing else 0.05):
+                continue  # 漏检
+            jitter = rng.normal(0, 3, 4)
+            boxes.append([x + jitter[0], y + jitter[1], x + w + jitter[2], y + h + jitter[3]])
+            confs.append(conf)
+            classes.append(cls)
+            gt.append(gid)
+        if rng.random() < 0.05:
+            x, y = rng.uniform(0, width - 60), rng.uniform(0, height - 60)
+            boxes.append([x, y, x + 50, y + 50])
+            confs.append(rng.uniform(0.4, 0.6))
+            classes.append(0)
+            gt.append(-1)
+        scene.append((t, np.array(boxes, np.float32).reshape(-1, 4), np.array(confs, np.float32),
+                      np.array(classes, np.int32), np.array(gt)))
+    return scene
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def run_benchmark(frames, fps, extra_objects, seed):
+    rng = np.random.default_rng(seed)
+    scene = synthetic_scene(frames, fps, extra_objects, rng)
+    tracker = MultiObjectTracker()
+    locked_id = None
+    last_track = {}      # 真实 ID -> 上次分配到的轨迹 ID
+    id_switches = 0
+    timings = []
+    locked_gt, largest_gt = [], []
+
+    for t, boxes, confs, classes, gt in scene:
+        start = time.perf_counter()
+        track_ids = tracker.update(boxes, confs, classes, t)
+        if locked_id is not None and not tracker.alive(locked_id):
+            locked_id = None
+        index, locked_id = select_locked(track_ids, boxes, classes, 0, locked_id)
+        timings.append((time.perf_counter() - start) * 1000)
+
+        for gid, tid in zip(gt.tolist(), track_ids.tolist()):
+            if gid < 0 or tid == 0:
+                continue
+            if gid in last_track and last_track[gid] != tid:
+                id_switches += 1
+            last_track[gid] = tid
+        if index >= 0:
+            locked_gt.append(int(gt[index]))
+        # 原来的做法：每帧取高分检测里目标类别面积最大的框
+        mask = (classes == 0) & (confs >= HIGH_CONF)
+        if mask.any():
+            areas = np.where(mask, (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]), -1)
+            largest_gt.append(int(gt[int(np.argmax(areas))]))
+
+    def jumps(sequence):
+        return sum(1 for a, b in zip(sequence, sequence[1:]) if a != b)
+
+    objects = 2 + extra_objects
+    print(f"合成场景: {frames} 帧 @ {fps}fps, {objects} 个物体 + 随机误检, 种子 {seed}")
+    print(f"  关联耗时/帧: 平均 {np.mean(timings):.3f}ms, P95 {_percentile(timings, 0.95):.3f}ms, "
+          f"最大 {max(timings):.3f}ms")
+    print(f"  ID 切换: {id_switches} 次, 共创建轨迹 {tracker.next_id - 1} 条")
+    print(f"  目标跳变: 锁定轨迹 {jumps(locked_gt)} 次 ({len(locked_gt)} 帧有目标), "
+          f"取面积最大 {jumps(largest_gt)} 次 ({len(largest_gt)} 帧有目标)")
+    return timings, id_switches
+
+
+def bench_iou(sizes=(5, 20, 50, 100), repeat=200, seed=0):
+    """向量化 IoU 矩阵与逐对计算的耗时对比"""
+    rng = np.random.default_rng(seed)
+    print(f"{'轨迹x检测':<12}{'向量化(ms)':>12}{'逐对(ms)':>12}{'加速':>8}")
+    for n in sizes:
+        xy = rng.uniform(0, 600, (2, n, 2)).astype(np.float32)
+        a = np.concatenate([xy[0], xy[0] + 40], axis=1)
+        b = np.concatenate([xy[1], xy[1] + 40], axis=1)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fast = iou_matrix(a, b)
+        vec_ms = (time.perf_counter() - start) * 1000 / repeat
+        loops = max(1, repeat // max(1, n // 5))
+        start = time.perf_counter()
+        for _ in range(loops):
+            slow = _iou_matrix_loop(a.tolist(), b.tolist())
+        loop_ms = (time.perf_counter() - start) * 1000 / loops
+        assert np.allclose(fast, slow, atol=1e-5)
+        print(f"{f'{n}x{n}':<12}{vec_ms:>12.3f}{loop_ms:>12.3f}{loop_ms / vec_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多目标跟踪基准测试 (合成轨迹)")
+    parser.add_argument("--frames", type=int, default=900)
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--objects", type=int, default=6, help="除两个交叉的人之外的物体数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run_benchmark(args.frames, args.fps, args.objects, args.seed)
+    for objects in (20, 50):
+        run_benchmark(args.frames, args.fps, objects, args.seed)
+    bench_iou()
@@ -1,58 +1,227 @@
-import time
-import subprocess
+"""
+OLED 状态屏守护进程 (SH1106 128x64, I2C)
+
+各项数据直接读 /proc、/sys 与 statvfs，不再每秒 fork shell 管道 (top -bn1 本身就很占 CPU)：
+  - IP       每 30s   (UDP socket 取本机出口地址，不发包)
+  - CPU/温度  每 2s    (/proc/stat 两次采样的差值、/sys/class/thermal)
+  - 内存      每 5s    (/proc/meminfo)
+  - 磁盘      每 60s   (os.statvfs)
+  - 小车状态  每 0.5s  (car_link UDP STATUS：急刹、当前指令、跟踪帧率)
+每项按自己的间隔刷新，只有渲染出的文字发生变化时才重绘屏幕。
+
+用法:
+    python3 oled.server.py                      # 真实 OLED
+    python3 oled.server.py --backend dummy      # 无硬件：渲染到内存图像，重绘时打印文字
+    python3 oled.server.py --backend dummy --save oled.png --duration 10
+"""
+import argparse
 import datetime
-from luma.core.interface.serial import i2c
-from luma.oled.device import sh1106 
-from luma.core.render import canvas
-from PIL import ImageFont
+import os
+import socket
+import time
+
+from car_link import CarLink
 
-# 初始化OLED
-try:
-    serial = i2c(port=1, address=0x3C)
-    device = sh1106(serial)
-    print("OLED 初始化成功。")
-except Exception as e:
-    print(f"OLED 初始化失败: {e}")
-    exit()
+IP_INTERVAL = 30.0
+CPU_INTERVAL = 2.0
+MEM_INTERVAL = 5.0
+DISK_INTERVAL = 60.0
+CAR_INTERVAL = 0.5
+CLOCK_INTERVAL = 1.0   # 只显示到分钟，每秒检查一次即可
+CAR_LINK_TIMEOUT = 0.05
+LINE_HEIGHT = 10       # 默认字体 6 行正好铺满 64 像素
+THERMAL_PATH = "/sys/class/thermal/thermal_zone0/temp"
 
 
-def get_system_info(cmd):
+# ================= 数据读取 =================
+def read_ip():
+    """本机出口 IP：UDP socket 的 connect 只查路由表，不会发出数据包"""
     try:
-        return subprocess.check_output(cmd, shell=True).decode("utf-8").strip()
-    except Exception:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect(("10.255.255.255", 1))
+            return sock.getsockname()[0]
+    except OSError:
         return "N/A"
 
-def main():
-    while True:
-        # 收集数据 
-        ip_cmd = "hostname -I | cut -d' ' -f1"
-        ip_addr = get_system_info(ip_cmd) 
-        
-        cpu_cmd = "top -bn1 | grep load | awk '{printf \"CPU: %.2f%%\", $(NF-2)}'"
-        cpu_load = get_system_info(cpu_cmd) 
-        
-        mem_cmd = "free -m | awk 'NR==2{printf \"RAM: %s/%sMB\", $3,$2}'"
-        mem_usage = get_system_info(mem_cmd) 
-        
-        disk_cmd = "df -h | awk '$NF==\"/\"{printf \"Disk: %d/%dGB %s\", $3,$2,$5}'"
-        disk_usage = get_system_info(disk_cmd) 
-
-        now = datetime.datetime.now()
-        current_time = now.strftime("%H:%M:%S")
-
-        # 绘制到屏幕
-        with canvas(device) as draw:
-            # (x, y) 坐标
-            draw.text((0, 0),  f"IP: {ip_addr}", fill="white")
-            draw.text((0, 12), f"{cpu_load}", fill="white")
-            draw.text((0, 24), f"{mem_usage}", fill="white")
-            draw.text((0, 36), f"{disk_usage}", fill="white")
-            draw.text((0, 48), f"Time: {current_time}", fill="white")
-            
-        time.sleep(1) # 每秒刷新一次
+
+cpu_state = {"prev": None}  # 上一次 /proc/stat 的 (总时间, 空闲时间)
+
+
+def read_cpu():
+    """两次采样之间的 CPU 占用率 (%)，第一次调用返回 None"""
+    try:
+        with open("/proc/stat") as f:
+            fields = [int(v) for v in f.readline().split()[1:9]]
+    except (OSError, ValueError):
+        return None
+    total = sum(fields)
+    idle = fields[3] + fields[4]  # idle + iowait
+    prev, cpu_state["prev"] = cpu_state["prev"], (total, idle)
+    if prev is None or total == prev[0]:
+        return None
+    return 100.0 * (1 - (idle - prev[1]) / (total - prev[0]))
+
+
+def read_temperature():
+    """SoC 温度 (摄氏度)，读不到时返回 None"""
+    try:
+        with open(THERMAL_PATH) as f:
+            return int(f.read()) / 1000
+    except (OSError, ValueError):
+        return None
+
+
+def read_memory():
+    """(已用 MB, 总量 MB)，已用 = MemTotal - MemAvailable (与 free -m 一致)"""
+    info = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("MemTotal", "MemAvailable"):
+                    info[key] = int(value.split()[0])
+    except (OSError, ValueError):
+        return None
+    if len(info) < 2:
+        return None
+    return (info["MemTotal"] - info["MemAvailable"]) // 1024, info["MemTotal"] // 1024
+
+
+def read_disk(path="/"):
+    """(已用 GB, 总量 GB, 使用率 %)，使用率与 df 相同：已用 / (已用 + 普通用户可用)"""
+    try:
+        st = os.statvfs(path)
+    except OSError:
+        return None
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    avail = st.f_bavail * st.f_frsize
+    total = st.f_blocks * st.f_frsize
+    percent = 100.0 * used / (used + avail) if used + avail else 0.0
+    return used / 2**30, total / 2**30, percent
+
+
+def read_clock():
+    return datetime.datetime.now().strftime("%H:%M")
+
+
+# ================= 渲染 =================
+def format_car(status):
+    if status is None:
+        return "Car: offline", "Trk: -"
+    car = f"Car: {status.get('command') or '-'}"
+    if status.get("emergency_stop"):
+        car += " E-STOP"
+    elif status.get("avoid_phase", "IDLE") != "IDLE":
+        car += " AVOID"
+    fps = status.get("tracker_fps")
+    if fps is None:
+        tracker = "Trk: off"
+    elif status.get("tracker_paused"):
+        tracker = "Trk: paused"
+    else:
+        tracker = f"Trk: {fps:.0f}fps"
+    return car, tracker
+
+
+def render_lines(values):
+    """把各项读数排成屏幕上的 6 行文字；数值取整，避免无意义的重绘"""
+    cpu, temp = values["cpu"]
+    cpu_text = f"CPU: {cpu:.0f}%" if cpu is not None else "CPU: N/A"
+    if temp is not None:
+        cpu_text += f" {temp:.0f}C"
+    mem = values["mem"]
+    disk = values["disk"]
+    car, tracker = format_car(values["car"])
+    return (
+        f"IP: {values['ip']}",
+        cpu_text,
+        f"RAM: {mem[0]}/{mem[1]}MB" if mem else "RAM: N/A",
+        f"Disk: {disk[0]:.0f}/{disk[1]:.0f}GB {disk[2]:.0f}%" if disk else "Disk: N/A",
+        car,
+        f"{tracker:<14}{values['clock']}",
+    )
+
+
+def redraw_if_changed(draw, values, last_lines):
+    """按当前读数渲染，文字与上次相同时不调用 draw；返回 (本次的文字, 是否重绘)"""
+    lines = render_lines(values)
+    if lines == last_lines:
+        return lines, False
+    draw(lines)
+    return lines, True
+
+
+def open_device(backend):
+    """sh1106: 真实 OLED；dummy: luma 的内存设备，画面保存在 device.image"""
+    if backend == "dummy":
+        from luma.core.device import dummy
+        return dummy(width=128, height=64, mode="1")
+    from luma.core.interface.serial import i2c
+    from luma.oled.device import sh1106
+    return sh1106(i2c(port=1, address=0x3C))
+
+
+def draw_lines(device, lines):
+    from luma.core.render import canvas
+    with canvas(device) as draw:
+        for row, text in enumerate(lines):
+            draw.text((0, row * LINE_HEIGHT), text, fill="white")
+
+
+def main(args):
+    try:
+        device = open_device(args.backend)
+        print(f"OLED 初始化成功 ({args.backend})。")
+    except Exception as e:
+        print(f"OLED 初始化失败: {e}")
+        raise SystemExit(1)
+
+    car_link = CarLink(timeout=CAR_LINK_TIMEOUT)
+    # 名称 -> (刷新间隔, 读取函数)
+    collectors = {
+        "ip": (IP_INTERVAL, read_ip),
+        "cpu": (CPU_INTERVAL, lambda: (read_cpu(), read_temperature())),
+        "mem": (MEM_INTERVAL, read_memory),
+        "disk": (DISK_INTERVAL, read_disk),
+        "car": (CAR_INTERVAL, car_link.status),
+        "clock": (CLOCK_INTERVAL, read_clock),
+    }
+    values = {}
+    due = {name: 0.0 for name in collectors}
+    stats = {"reads": 0, "redraws": 0}
+    last_lines = None
+    deadline = time.monotonic() + args.duration if args.duration else None
+
+    try:
+        while deadline is None or time.monotonic() < deadline:
+            now = time.monotonic()
+            for name, (interval, read) in collectors.items():
+                if now >= due[name]:
+                    values[name] = read()
+                    due[name] = now + interval
+                    stats["reads"] += 1
+
+            last_lines, redrawn = redraw_if_changed(lambda lines: draw_lines(device, lines), values, last_lines)
+            if redrawn:
+                stats["redraws"] += 1
+                if args.backend == "dummy":
+                    print(" | ".join(last_lines), flush=True)
+                    if args.save:
+                        device.image.save(args.save)
+
+            time.sleep(max(0.0, min(due.values()) - time.monotonic()))
+    finally:
+        car_link.close()
+        print(f"读取 {stats['reads']} 次, 重绘 {stats['redraws']} 次")
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="OLED 状态屏")
+    parser.add_argument("--backend", choices=("sh1106", "dummy"), default="sh1106",
+                        help="dummy 不需要硬件，画面渲染到内存图像")
+    parser.add_argument("--save", help="dummy 后端每次重绘后把画面保存为图片")
+    parser.add_argument("--duration", type=float, default=0, help="运行多少秒后退出 (0 表示一直运行)")
     try:
-        main()
+        main(parser.parse_args())
     except KeyboardInterrupt:
-        print("程序已停止。")
\ No newline at end of file
+        print("程序已停止。")
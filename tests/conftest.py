@@ -0,0 +1,13 @@
+"""
+测试公共设置：让测试直接 import 仓库根目录下的模块，car_server 使用模拟硬件
+(car_hardware.SimSerial + 模拟超声波)，不需要 Arduino、树莓派或摄像头。
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ.setdefault("CAR_HARDWARE", "sim")
+os.environ.setdefault("CAR_SIM_SCENARIO", "clear")
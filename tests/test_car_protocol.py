@@ -0,0 +1,148 @@
+"""
+car_protocol 帧编解码：CRC 校验、垃圾字节后的重新同步、ACK 与指令序号的对应。
+最后一个用例在一对 pty 上模拟 Arduino，走一遍真实的串口读写。
+"""
+import os
+import struct
+import threading
+import time
+
+import pytest
+
+from car_hardware import SimSerial
+from car_protocol import (FrameDecoder, encode_command, encode_frame, parse_telemetry, crc8,
+                          START_BYTE, MAX_PAYLOAD, OP_CHAR, OP_VELOCITY, OP_ACK, OP_TELEMETRY,
+                          ACK_OK, ACK_UNKNOWN, TELEMETRY_FORMAT)
+
+
+def test_commands_round_trip():
+    decoder = FrameDecoder()
+    frames = decoder.feed(encode_command(1, 'F') + encode_command(2, 'V40,0,-25') +
+                          encode_command(3, 'V-300,100,0'))
+    assert [(f.seq, f.opcode) for f in frames] == [(1, OP_CHAR), (2, OP_VELOCITY), (3, OP_VELOCITY)]
+    assert frames[0].payload == b'F'
+    assert struct.unpack("<bbb", frames[1].payload) == (40, 0, -25)
+    assert struct.unpack("<bbb", frames[2].payload) == (-100, 100, 0)  # 超出范围的分量被限幅
+    assert decoder.crc_errors == 0 and decoder.skipped_bytes == 0
+
+
+def test_frames_split_across_reads():
+    data = encode_command(7, 'S') + encode_command(8, 'G')
+    decoder = FrameDecoder()
+    frames = []
+    for i in range(len(data)):
+        frames += decoder.feed(data[i:i + 1])
+    assert [(f.seq, f.payload) for f in frames] == [(7, b'S'), (8, b'G')]
+
+
+def test_bad_crc_is_dropped():
+    bad = bytearray(encode_command(9, 'F'))
+    bad[-1] ^= 0xFF
+    decoder = FrameDecoder()
+    assert decoder.feed(bytes(bad)) == []
+    assert decoder.crc_errors == 1
+
+
+def test_corrupted_payload_is_never_executed():
+    frame = bytearray(encode_command(5, 'S'))
+    frame[4] = ord('F')  # 线上翻转了指令字节，CRC 不再匹配
+    decoder = FrameDecoder()
+    frames = decoder.feed(bytes(frame) + encode_command(6, 'S'))
+    assert [(f.seq, f.opcode, f.payload) for f in frames] == [(6, OP_CHAR, b'S')]
+    assert decoder.crc_errors == 1
+
+
+def test_resync_after_garbage_bytes():
+    telemetry = struct.pack(TELEMETRY_FORMAT, 42, 90, ord('S'), 3, 1000)
+    # 旧固件打印的文本、一个假帧头 (长度不可能)、半个帧头，之后才是真正的帧
+    garbage = b"Distance:42\r\n" + bytes([START_BYTE, 1, OP_CHAR, MAX_PAYLOAD + 1]) + bytes([START_BYTE, 2])
+    decoder = FrameDecoder()
+    frames = decoder.feed(garbage + encode_frame(3, OP_ACK, bytes([ACK_OK])) +
+                          b"noise" + encode_frame(1, OP_TELEMETRY, telemetry))
+    assert [(f.seq, f.opcode) for f in frames] == [(3, OP_ACK), (1, OP_TELEMETRY)]
+    assert parse_telemetry(frames[1].payload).distance_cm == 42
+    assert decoder.skipped_bytes > 0
+    assert decoder.buffer == bytearray()
+
+
+def test_crc8_matches_firmware_polynomial():
+    # 多项式 0x07、初值 0 的 CRC-8 标准校验值
+    assert crc8(b"123456789") == 0xF4
+    with pytest.raises(ValueError):
+        encode_frame(1, OP_CHAR, bytes(MAX_PAYLOAD + 1))
+
+
+def test_acks_match_command_sequence_numbers():
+    """SimSerial 与 Arduino 一样按收到的序号回 ACK，主机按序号对应回自己发出的指令"""
+    port = SimSerial(frame_protocol=True, model_wire=False, timeout=0.1)
+    pending = {}
+    for seq, command in enumerate(['F', 'V40,0,-25', 'S', 'G'], 250):
+        seq %= 256  # 序号回绕
+        pending[seq] = command
+        port.write(encode_command(seq, command))
+    # 不认识的操作码回 ACK_UNKNOWN
+    port.write(encode_frame(4, 0x7F, b"?"))
+    pending[4] = None
+
+    decoder = FrameDecoder()
+    acks, telemetry = {}, []
+    while port.in_waiting:
+        for frame in decoder.feed(port.read(port.in_waiting)):
+            if frame.opcode == OP_ACK:
+                acks[frame.seq] = frame.payload[0]
+            elif frame.opcode == OP_TELEMETRY:
+                telemetry.append(parse_telemetry(frame.payload))
+
+    assert set(acks) == set(pending)
+    assert all(status == ACK_OK for seq, status in acks.items() if pending[seq] is not None)
+    assert acks[4] == ACK_UNKNOWN
+    assert [t.last_seq for t in telemetry] == [250, 251, 252, 253, 4]
+    assert telemetry[1].motion == 'V' and telemetry[2].motion == 'S'
+    assert telemetry[3].servo_angle == 90
+
+
+@pytest.mark.skipif(not hasattr(os, "openpty"), reason="需要 pty")
+def test_ack_and_telemetry_over_pty():
+    """在一对 pty 上模拟 Arduino：收到指令回 ACK 并发送夹杂噪声的遥测"""
+    import tty
+
+    host_fd, mcu_fd = os.openpty()
+    tty.setraw(host_fd)
+    tty.setraw(mcu_fd)
+
+    def fake_mcu():
+        decoder = FrameDecoder()
+        telemetry_seq = 0
+        while True:
+            for frame in decoder.feed(os.read(mcu_fd, 64)):
+                if frame.opcode == OP_CHAR and frame.payload == b'X':
+                    return
+                status = ACK_OK if frame.opcode in (OP_CHAR, OP_VELOCITY) else ACK_UNKNOWN
+                os.write(mcu_fd, encode_frame(frame.seq, OP_ACK, bytes([status])))
+                telemetry_seq += 1
+                payload = struct.pack(TELEMETRY_FORMAT, 42, 90, ord('S'), frame.seq, 1000)
+                os.write(mcu_fd, b"noise" + encode_frame(telemetry_seq, OP_TELEMETRY, payload))
+
+    mcu = threading.Thread(target=fake_mcu, daemon=True)
+    mcu.start()
+    try:
+        decoder = FrameDecoder()
+        for seq, command in enumerate(['F', 'V40,0,-25', 'S', 'V-100,100,0'], 1):
+            os.write(host_fd, encode_command(seq, command))
+            acked = telemetry = None
+            deadline = time.time() + 2.0
+            while (acked is None or telemetry is None) and time.time() < deadline:
+                for frame in decoder.feed(os.read(host_fd, 64)):
+                    if frame.opcode == OP_ACK:
+                        acked = frame
+                    elif frame.opcode == OP_TELEMETRY:
+                        telemetry = parse_telemetry(frame.payload)
+            assert acked is not None and acked.seq == seq and acked.payload[0] == ACK_OK
+            assert telemetry is not None and telemetry.last_seq == seq and telemetry.distance_cm == 42
+        assert decoder.skipped_bytes >= len(b"noise")
+        assert decoder.crc_errors == 0
+    finally:
+        os.write(host_fd, encode_command(99, 'X'))
+        mcu.join(timeout=1.0)
+        os.close(host_fd)
+        os.close(mcu_fd)
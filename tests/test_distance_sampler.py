@@ -0,0 +1,195 @@
+"""
+distance_sampler：中值滤波、按舵机角度的距离缓存，以及 car_server 基于滤波距离的急刹回差。
+传感器使用 FakeDistanceSensor，采样频率调高以缩短测试时间。
+"""
+import time
+
+import numpy as np
+import pytest
+
+import car_server
+from distance_sampler import DistanceRing, DistanceSampler, FakeDistanceSensor, median_filter, ema_filter
+
+RATE_HZ = 200
+SETTLE = 0.05
+
+
+def wait_until(predicate, timeout=1.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+@pytest.fixture
+def make_sampler():
+    samplers = []
+
+    def make(sensor, **kwargs):
+        sampler = DistanceSampler(sensor, rate_hz=RATE_HZ, settle=SETTLE, **kwargs)
+        samplers.append(sampler)
+        sampler.start()
+        return sampler
+    yield make
+    for sampler in samplers:
+        sampler.stop()
+
+
+def test_ring_keeps_latest_samples_in_order():
+    ring = DistanceRing(size=4)
+    for i in range(6):
+        ring.append(float(i), 10.0 * i, 90)
+    times, values, angles = ring.latest()
+    assert list(times) == [2.0, 3.0, 4.0, 5.0]
+    assert list(values) == [20.0, 30.0, 40.0, 50.0]
+    assert list(ring.latest(2)[1]) == [40.0, 50.0]
+
+
+def test_filters_ignore_nan():
+    values = np.array([np.nan, 100.0, 5.0, 101.0, np.nan])
+    assert median_filter(values) == 100.0
+    assert np.isnan(median_filter(np.array([np.nan, np.nan])))
+    assert np.isnan(ema_filter(np.array([np.nan])))
+
+
+def test_median_rejects_a_single_5cm_echo(make_sampler):
+    readings = iter([100.0, 101.0, 99.0, 100.0, 5.0, 100.0, 102.0])
+    seen = []
+
+    def script(elapsed, angle):
+        value = next(readings, 100.0)
+        seen.append(value)
+        return value
+
+    sampler = make_sampler(FakeDistanceSensor(script=script))
+    assert wait_until(lambda: sampler.ring.count >= 7)
+    sampler.stop()
+    assert 5.0 in seen
+    for end in range(5, 8):
+        window = sampler.ring.latest()[1][end - 5:end]
+        assert median_filter(window) >= 99.0
+    assert sampler.median() >= 99.0
+
+
+def test_angle_cache_is_fresh_only_after_the_servo_settles(make_sampler):
+    sensor = FakeDistanceSensor(script=lambda elapsed, angle: {90: 20.0, 0: 150.0, 180: 60.0}[angle])
+    sampler = make_sampler(sensor)
+    assert sampler.distance_at(90, timeout=1.0) == pytest.approx(20.0)
+
+    sampler.set_servo_angle(0)
+    assert sensor.servo_angle == 0
+    # 舵机刚转动：旧角度的缓存不能再用，新角度还没有稳定的读数
+    assert sampler.distance_at(90) is None
+    assert sampler.distance_at(0) is None
+    assert sampler.distance_at(0, timeout=1.0) == pytest.approx(150.0)
+
+    # 回到之前测过的角度：上一次的缓存是旧的，要等稳定后的新读数
+    sampler.set_servo_angle(90)
+    assert sampler.distance_at(90) is None
+    assert sampler.distance_at(90, timeout=1.0) == pytest.approx(20.0)
+    assert set(sampler.stats()["angle_cache"]) == {"0", "90"}
+
+
+def test_settled_median_skips_samples_from_the_previous_angle(make_sampler):
+    sensor = FakeDistanceSensor(script=lambda elapsed, angle: 20.0 if angle == 90 else 150.0)
+    sampler = make_sampler(sensor)
+    assert wait_until(lambda: not np.isnan(sampler.settled_median()))
+    sampler.set_servo_angle(180)
+    assert np.isnan(sampler.settled_median())
+    assert wait_until(lambda: not np.isnan(sampler.settled_median()))
+    assert sampler.settled_median() == pytest.approx(150.0)
+
+
+class ScriptedSampler:
+    """只提供 check_emergency_distance 用到的接口，滤波后的距离由测试直接给出"""
+    def __init__(self):
+        self.servo_angle = car_server.SERVO_CENTER
+        self.distance = float("nan")
+
+    def settled_median(self):
+        return self.distance
+
+
+@pytest.fixture
+def brake():
+    """暂停 car_server 自己的采样线程，由测试逐个喂滤波距离；返回 (喂距离, 读串口指令)"""
+    sampler = car_server.distance_sampler
+    if sampler is not None:
+        sampler.stop()
+    with car_server.obstacle_state["lock"]:
+        car_server.obstacle_state["emergency_stop"] = False
+        car_server.obstacle_state["blocked"] = False
+    with car_server.serial_state["cond"]:
+        car_server.serial_state["last_cmd"] = None  # 之前测试写出的 S 不能让这里的 S 被当成重复跳过
+    scripted = ScriptedSampler()
+    start = time.time()
+
+    def feed(*distances):
+        for distance in distances:
+            scripted.distance = distance
+            car_server.check_emergency_distance(scripted)
+        time.sleep(0.1)  # 等串口写线程写出
+
+    def written():
+        return [c for t, c in car_server.ser.commands() if t >= start]
+    yield feed, written
+    with car_server.obstacle_state["lock"]:
+        car_server.obstacle_state["emergency_stop"] = False
+        car_server.obstacle_state["blocked"] = False
+    if sampler is not None:
+        sampler.start()
+
+
+def test_brake_triggers_once_and_clears_past_hysteresis(brake):
+    feed, written = brake
+    feed(100.0, 80.0, 50.0)
+    assert not car_server.obstacle_state["emergency_stop"]
+
+    feed(25.0)
+    assert car_server.obstacle_state["emergency_stop"]
+    assert written() == ['S']
+
+    # 回差区间内既不解除也不重复刹车
+    feed(20.0, 31.0, 34.0, 15.0)
+    assert car_server.obstacle_state["emergency_stop"]
+    assert written() == ['S']
+
+    feed(car_server.MIN_EMERGENCY_DISTANCE + car_server.CLEAR_HYSTERESIS + 1)
+    assert not car_server.obstacle_state["emergency_stop"]
+
+    time.sleep(car_server.SERIAL_RESEND_INTERVAL)  # 否则写线程把紧接着的第二个 S 当重复指令跳过
+    feed(25.0)
+    assert car_server.obstacle_state["emergency_stop"]
+    assert written() == ['S', 'S']
+
+
+def test_manual_reverse_is_not_braked_again(brake):
+    feed, written = brake
+    feed(20.0)
+    assert written() == ['S']
+
+    assert car_server.handle_command('B') == "BACKWARD"
+    assert not car_server.obstacle_state["emergency_stop"]
+    # 后退离开障碍的途中每次采样仍小于阈值，不能再被刹停
+    feed(20.0, 22.0, 26.0, 29.0, 33.0)
+    assert written() == ['S', 'B']
+    assert not car_server.obstacle_state["emergency_stop"]
+
+    # 离开回差区间后重新生效
+    feed(40.0, 28.0)
+    assert written() == ['S', 'B', 'S']
+
+
+def test_noise_and_side_angles_are_ignored(brake):
+    feed, written = brake
+    feed(float("nan"))
+    assert written() == []
+    scripted = ScriptedSampler()
+    scripted.servo_angle = 0
+    scripted.distance = 10.0
+    car_server.check_emergency_distance(scripted)
+    time.sleep(0.1)
+    assert written() == []
+    assert not car_server.obstacle_state["emergency_stop"]
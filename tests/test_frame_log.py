@@ -0,0 +1,63 @@
+"""
+frame_log：录制后读回，以及遍历中途放弃 / 出错时 close() 不抛 BufferError 掩盖真正的异常。
+"""
+import numpy as np
+import pytest
+
+import vision_tracker
+from frame_log import FrameLogWriter, FrameLogReader, is_frame_log, REC_FRAME
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    path = str(tmp_path / "run.carlog")
+    writer = FrameLogWriter(path, capacity=1 << 20)
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    for i in range(3):
+        frame[:, :, 1] = 80 * i
+        writer.add_frame(100.0 + i, frame)
+        writer.add_command(100.0 + i + 0.01, f"V0.{i}0,0.00,0.00")
+    writer.close()
+    return path
+
+
+def test_round_trip(log_path):
+    assert is_frame_log(log_path)
+    reader = FrameLogReader(log_path)
+    try:
+        assert (reader.frame_count, reader.command_count) == (3, 3)
+        frames = [(seq, timestamp, bytes(data)) for seq, timestamp, data in reader.frames()]
+        assert [seq for seq, _, _ in frames] == [0, 1, 2]
+        assert all(data[:2] == b"\xff\xd8" for _, _, data in frames)
+        assert reader.commands() == [(i, 100.0 + i + 0.01, f"V0.{i}0,0.00,0.00") for i in range(3)]
+    finally:
+        reader.close()
+
+
+def test_not_a_frame_log(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"\x00" * 64)
+    assert not is_frame_log(str(path))
+    with pytest.raises(ValueError):
+        FrameLogReader(str(path))
+
+
+def test_close_with_abandoned_generator_and_live_slice(log_path):
+    reader = FrameLogReader(log_path)
+    records = reader.records()
+    kind, seq, timestamp, data = next(records)
+    assert kind == REC_FRAME
+    # 生成器没遍历完、数据切片也还在：close() 不能抛 BufferError
+    reader.close()
+    assert reader.file.closed
+    del records, data
+
+
+def test_replay_error_is_not_masked_by_close(log_path):
+    class FailingTimer:
+        def add(self, stage, start):
+            raise RuntimeError("decode stage failed")
+
+    with pytest.raises(RuntimeError, match="decode stage failed"):
+        for _ in vision_tracker.iter_replay_frames(log_path, FailingTimer()):
+            pass
@@ -0,0 +1,95 @@
+"""
+oled.server.py：读数缺失 / 小车离线时的渲染，以及只在文字变化时重绘。
+文件名带点号，不能直接 import，用 importlib 按路径加载。
+"""
+import importlib.util
+import os
+
+import pytest
+
+OLED_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "oled.server.py")
+spec = importlib.util.spec_from_file_location("oled_server", OLED_PATH)
+oled = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(oled)
+
+
+def empty_values():
+    """所有读数都取不到、小车离线时 main() 收集到的值"""
+    return {"ip": "N/A", "cpu": (None, None), "mem": None, "disk": None, "car": None, "clock": "12:34"}
+
+
+def car_values(**status):
+    values = empty_values()
+    values.update(cpu=(12.4, 48.6), mem=(301, 3790), disk=(7.2, 29.0, 26.4))
+    values["car"] = dict({"command": "F", "emergency_stop": False, "avoid_phase": "IDLE",
+                          "tracker_fps": None, "tracker_paused": False}, **status)
+    return values
+
+
+def test_render_with_missing_readings_and_offline_car():
+    lines = oled.render_lines(empty_values())
+    assert lines == (
+        "IP: N/A",
+        "CPU: N/A",
+        "RAM: N/A",
+        "Disk: N/A",
+        "Car: offline",
+        "Trk: -        12:34",
+    )
+
+
+def test_render_car_states():
+    lines = oled.render_lines(car_values())
+    assert lines[1:4] == ("CPU: 12% 49C", "RAM: 301/3790MB", "Disk: 7/29GB 26%")
+    assert lines[4] == "Car: F"
+    assert lines[5].startswith("Trk: off")
+    assert oled.render_lines(car_values(emergency_stop=True))[4] == "Car: F E-STOP"
+    assert oled.render_lines(car_values(command=None, avoid_phase="SCAN_LEFT"))[4] == "Car: - AVOID"
+    assert oled.render_lines(car_values(tracker_fps=11.6))[5].startswith("Trk: 12fps")
+    assert oled.render_lines(car_values(tracker_fps=0.0, tracker_paused=True))[5].startswith("Trk: paused")
+
+
+def test_redraw_only_when_text_changes():
+    drawn = []
+    values = empty_values()
+    lines, redrawn = oled.redraw_if_changed(drawn.append, values, None)
+    assert redrawn and drawn == [lines]
+
+    # 读数一样 (或取整后一样) 时不重绘
+    lines, redrawn = oled.redraw_if_changed(drawn.append, empty_values(), lines)
+    assert not redrawn and len(drawn) == 1
+    values = car_values(tracker_fps=12.2)
+    lines, redrawn = oled.redraw_if_changed(drawn.append, values, lines)
+    assert redrawn and len(drawn) == 2
+    values["car"]["tracker_fps"] = 11.8
+    values["cpu"] = (12.1, 49.2)
+    lines, redrawn = oled.redraw_if_changed(drawn.append, values, lines)
+    assert not redrawn and len(drawn) == 2
+
+    # 小车掉线是可见变化
+    values["car"] = None
+    lines, redrawn = oled.redraw_if_changed(drawn.append, values, lines)
+    assert redrawn and drawn[-1][4] == "Car: offline"
+
+
+def test_proc_readers():
+    oled.cpu_state["prev"] = None
+    if not os.path.exists("/proc/stat"):
+        pytest.skip("需要 /proc")
+    assert oled.read_cpu() is None  # 第一次只记录基准
+    sum(range(200000))
+    cpu = oled.read_cpu()
+    assert cpu is None or 0.0 <= cpu <= 100.0
+
+    used, total = oled.read_memory()
+    assert 0 < used <= total
+    used_gb, total_gb, percent = oled.read_disk("/")
+    assert 0 <= used_gb <= total_gb and 0.0 <= percent <= 100.0
+    assert oled.read_disk("/does/not/exist") is None
+
+
+def test_draw_on_dummy_device():
+    pytest.importorskip("luma.core.device")
+    device = oled.open_device("dummy")
+    oled.draw_lines(device, oled.render_lines(empty_values()))
+    assert device.image.getbbox() is not None  # 画出了文字
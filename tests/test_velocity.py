@@ -0,0 +1,106 @@
+"""
+vision_tracker.VelocityController -> car_server.handle_command -> 串口写线程 -> SimSerial：
+检查真正写到 (模拟) 串口上的速度指令流。
+"""
+import time
+
+import pytest
+
+import car_server
+import vision_tracker
+from car_link import format_velocity
+from vision_tracker import VelocityController, CENTER_X, FRAME_HEIGHT, VEL_KEEPALIVE
+
+
+@pytest.fixture
+def wire():
+    """返回一个函数：等串口写线程写完 count 条指令后，返回这段时间内写出的指令"""
+    assert car_server.ser is not None
+    car_server.handle_command('S')
+    time.sleep(0.1)
+    start = time.time()
+
+    def written(count, timeout=1.0):
+        deadline = time.time() + timeout
+        while True:
+            commands = [c for t, c in car_server.ser.commands() if t >= start]
+            if len(commands) >= count or time.time() > deadline:
+                return commands
+            time.sleep(0.01)
+    return written
+
+
+def box(center_x, height):
+    """以 center_x 为中心、高 height 像素的目标框"""
+    return (center_x - 40, 100, center_x + 40, 100 + height)
+
+
+def drive(controller, target_box, now):
+    """与 TrackerPipeline 的 pid 分支一样：算速度，需要时经 car_server 发出"""
+    velocity = controller.compute(target_box, now)
+    if controller.should_send(velocity, now):
+        car_server.handle_command(format_velocity(*velocity))
+    return velocity
+
+
+def parse(command):
+    return tuple(int(v) for v in command[1:].split(","))
+
+
+def test_default_control_mode_works_with_old_firmware():
+    assert vision_tracker.CONTROL_MODE == 'bang'
+
+
+def test_far_target_on_the_right_drives_forward_and_turns_right(wire):
+    controller = VelocityController()
+    now = time.time()
+    drive(controller, box(CENTER_X + 60, int(FRAME_HEIGHT * 0.1)), now)
+    velocity = drive(controller, box(CENTER_X + 60, int(FRAME_HEIGHT * 0.1)), now + 0.2)
+
+    forward, strafe, yaw = parse(wire(2)[-1])
+    assert velocity[0] > 0 and velocity[2] > 0
+    assert forward > 0 and strafe == 0 and yaw > 0
+    assert max(abs(forward), abs(yaw)) <= car_server.VELOCITY_SCALE
+
+
+def test_close_target_stops_instead_of_reversing(wire):
+    controller = VelocityController()
+    now = time.time()
+    for i in range(5):
+        drive(controller, box(CENTER_X, int(FRAME_HEIGHT * 0.9)), now + i * 0.2)
+
+    commands = wire(1)
+    assert commands
+    assert all(c == 'S' or parse(c)[0] >= 0 for c in commands)
+    assert commands[-1] == 'S'
+
+
+def test_unchanged_velocity_is_resent_as_keepalive(wire):
+    controller = VelocityController()
+    target = box(CENTER_X + 80, int(FRAME_HEIGHT * 0.1))
+    now = time.time()
+    controller.compute(target, now)
+    velocity = controller.compute(target, now + 0.05)
+    assert controller.should_send(velocity, now + 0.05)
+    assert not controller.should_send(velocity, now + 0.05 + VEL_KEEPALIVE / 2)
+    assert controller.should_send(velocity, now + 0.06 + VEL_KEEPALIVE)
+
+    # 相同的速度指令是固件看门狗的心跳，串口写线程不能把它当重复指令跳过
+    command = format_velocity(*velocity)
+    for _ in range(3):
+        car_server.handle_command(command)
+        time.sleep(VEL_KEEPALIVE)
+    commands = [c for c in wire(3) if c.startswith('V')]
+    assert len(commands) == 3 and len(set(commands)) == 1
+
+
+def test_lost_target_stops_immediately(wire):
+    controller = VelocityController()
+    now = time.time()
+    drive(controller, box(CENTER_X - 80, int(FRAME_HEIGHT * 0.1)), now)
+    drive(controller, box(CENTER_X - 80, int(FRAME_HEIGHT * 0.1)), now + 0.05)
+    # 目标丢失：即使还没到重发间隔也要立刻停车
+    velocity = drive(controller, None, now + 0.06)
+
+    assert velocity == (0.0, 0.0, 0.0)
+    assert wire(3)[-1] == 'S'
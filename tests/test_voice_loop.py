@@ -0,0 +1,100 @@
+"""
+voice_controller 主循环 (asyncio) 在 voice_stubs 替身上的端到端测试：
+“讲个故事” -> “停” 打断朗读并停车；LLM 出错之后主循环仍然接受新的语句。
+"""
+import argparse
+import asyncio
+import types
+
+import pytest
+
+import voice_controller
+import voice_stubs
+from voice_stubs import StubLLMClient, StubRecognizer, StubSynthesizer
+
+SAY_INTERVAL = 1.0
+SPEAK_CHARS_PER_SECOND = 30.0  # 故事要念好几秒，“停”一定落在朗读中间
+
+
+class RecordingSynthesizer(StubSynthesizer):
+    def __init__(self):
+        super().__init__(SPEAK_CHARS_PER_SECOND)
+        self.spoken = []
+        self.stops = 0
+
+    def speak_text_async(self, text):
+        self.spoken.append(text)
+        return super().speak_text_async(text)
+
+    def stop_speaking_async(self):
+        self.stops += 1
+        return super().stop_speaking_async()
+
+
+async def broken_stream():
+    """念出第一句之后连接断开"""
+    for text in ("好的，", "我查一下。", "结果"):
+        yield voice_stubs._Chunk([voice_stubs._Choice(voice_stubs._Delta(text))])
+    raise ConnectionError("模拟网络中断")
+
+
+class FlakyCompletions:
+    """问题里带“出错”时回复流中途断开，其余交给 StubLLMClient"""
+    def __init__(self):
+        self.inner = StubLLMClient().chat.completions
+        self.questions = []
+
+    async def create(self, **kwargs):
+        question = kwargs["messages"][-1]["content"]
+        self.questions.append(question)
+        if "出错" in question:
+            return broken_stream()
+        return await self.inner.create(**kwargs)
+
+
+@pytest.fixture
+def voice(monkeypatch):
+    monkeypatch.setattr(voice_stubs, "RECOGNIZE_CHAR_DELAY", 0.005)
+    monkeypatch.setattr(voice_stubs, "LLM_FIRST_TOKEN_DELAY", 0.01)
+    monkeypatch.setattr(voice_stubs, "LLM_TOKEN_DELAY", 0.001)
+    monkeypatch.setattr(voice_controller, "conversation_history", [voice_controller.SYSTEM_PROMPT])
+    monkeypatch.setattr(voice_controller, "reply_cache", voice_controller.ReplyCache())
+    monkeypatch.setitem(voice_controller.turn_state, "speaking", False)
+    monkeypatch.setitem(voice_controller.turn_state, "barge_in_time", 0.0)
+
+    car_commands = []
+
+    async def control_car(cmd_code, trace=None):
+        car_commands.append(cmd_code)
+    monkeypatch.setattr(voice_controller, "control_car", control_car)
+
+    completions = FlakyCompletions()
+    monkeypatch.setattr(voice_controller, "create_llm_client",
+                        lambda stub=False: types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions)))
+    synthesizer = RecordingSynthesizer()
+
+    def run(script):
+        recognizer = StubRecognizer(script, SAY_INTERVAL)
+        monkeypatch.setattr(voice_controller, "create_speech", lambda *args: (recognizer, synthesizer))
+        args = argparse.Namespace(stub=True, say=script, say_interval=SAY_INTERVAL)
+        asyncio.run(asyncio.wait_for(voice_controller.main(args), timeout=20))
+    return types.SimpleNamespace(run=run, synthesizer=synthesizer, completions=completions,
+                                 car_commands=car_commands)
+
+
+def test_stop_barges_in_and_later_utterances_are_heard(voice):
+    voice.run(["讲个故事", "停", "出错了吗", "你好", "退出"])
+
+    story = voice_stubs.STUB_REPLIES[0][1]
+    # 故事只念了开头就被“停”打断：合成器被叫停，小车收到停车指令
+    assert voice.synthesizer.stops >= 1
+    assert "S" in voice.car_commands
+    assert not any(text in story and len(text) == len(story) for text in voice.synthesizer.spoken)
+    assert voice.completions.questions[0] == "讲个故事"
+
+    # 回复流中途出错：已经送去朗读的句子加上兜底回复，念完后之后的“你好”不能被当成回声丢掉
+    assert "好的，我查一下。" in voice.synthesizer.spoken
+    assert "我的大脑有点短路了。" in voice.synthesizer.spoken
+    assert voice.completions.questions[-1] == "你好"
+    assert any(text.startswith("你好！") for text in voice.synthesizer.spoken)
+    assert not voice_controller.turn_state["speaking"]
@@ -0,0 +1,226 @@
+"""
+端到端延迟追踪 + Prometheus 指标 (纯 Python，不依赖 prometheus_client)
+
+一条指令从源头开始带一个 Trace：
+    vision_tracker: 帧采集 (capture) -> 控制决策 (decision) -> 发出 (link_send)
+    voice_controller: 识别出语音 (recognized) -> AI 回复 (llm_reply) -> 发出 (link_send)
+    car_server: 收到 (received) -> 入队 (queued) -> 写串口 (serial_write) -> 应答 (acked)
+每一跳记录一个时间戳 (time.time()，同一台树莓派上各进程可直接比较)。
+Trace 随指令经 UDP 指令通道 (car_link.py) 或 HTTP /move 的 X-Trace 头传到 car_server，
+编码格式: "<trace_id>;<source>;<stage>=<ts>,<stage>=<ts>,..."
+
+Registry 把直方图 / 计数器按 Prometheus 文本格式 (0.0.4) 输出，供 /metrics 使用。
+"""
+import bisect
+import os
+import threading
+import time
+from collections import deque
+
+# 延迟直方图的桶 (秒)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RECENT_TRACES = 200   # /api/traces 保留最近多少条完整的 Trace
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def new_trace_id():
+    return os.urandom(4).hex()
+
+
+class Trace:
+    """一条指令经过的各跳及其时间戳"""
+    __slots__ = ("trace_id", "source", "hops", "outcome")
+
+    def __init__(self, source, trace_id=None):
+        self.trace_id = trace_id or new_trace_id()
+        self.source = source
+        self.hops = []        # [(stage, timestamp)]
+        self.outcome = None   # 结束时的结果 (acked / written / coalesced / lost ...)
+
+    def mark(self, stage, timestamp=None):
+        self.hops.append((stage, time.time() if timestamp is None else timestamp))
+
+    def has(self, stage):
+        return any(name == stage for name, _ in self.hops)
+
+    @property
+    def origin(self):
+        return self.hops[0][1] if self.hops else None
+
+    def encode(self):
+        hops = ",".join(f"{stage}={timestamp:.6f}" for stage, timestamp in self.hops)
+        return f"{self.trace_id};{self.source};{hops}"
+
+    @classmethod
+    def decode(cls, text):
+        """解析 encode() 的结果，格式错误抛出 ValueError"""
+        trace_id, source, hops = text.split(";", 2)
+        if not trace_id or not source:
+            raise ValueError(f"Trace 格式错误: {text}")
+        trace = cls(source, trace_id)
+        for hop in filter(None, hops.split(",")):
+            stage, timestamp = hop.split("=", 1)
+            trace.hops.append((stage, float(timestamp)))
+        return trace
+
+    def to_dict(self):
+        origin = self.origin
+        return {
+            "trace_id": self.trace_id,
+            "source": self.source,
+            "outcome": self.outcome,
+            "start": origin,
+            "hops": [{"stage": stage, "ms": round((timestamp - origin) * 1000, 2)}
+                     for stage, timestamp in self.hops],
+        }
+
+
+# ================= Prometheus 指标 =================
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if value != value:
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.series = {}   # 标签值 -> [各桶计数 (非累计), 总和, 次数]
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labelvalues)
+            if series is None:
+                series = self.series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = [(values, list(counts), total, count)
+                        for values, (counts, total, count) in sorted(self.series.items())]
+        for values, counts, total, count in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = _labels(self.labelnames, values, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {total!r}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def inc(self, *labelvalues, amount=1):
+        with self.lock:
+            self.series[labelvalues] = self.series.get(labelvalues, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            snapshot = sorted(self.series.items())
+        for values, value in snapshot:
+            lines.append(f"{self.name}{_labels(self.labelnames, values)} {_format_value(value)}")
+        return lines
+
+
+class CallbackMetric:
+    """抓取时才调用 fn() 取值，用来导出程序里已有的统计字典"""
+
+    def __init__(self, name, help_text, fn, kind="gauge"):
+        self.name = name
+        self.help_text = help_text
+        self.fn = fn
+        self.kind = kind
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}",
+                f"{self.name} {_format_value(value)}"]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, labelnames, buckets))
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._add(Counter(name, help_text, labelnames))
+
+    def callback(self, name, help_text, fn, kind="gauge"):
+        return self._add(CallbackMetric(name, help_text, fn, kind))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class TraceLog:
+    """结束的 Trace：各跳相对起点的延迟写入直方图，并保留最近若干条供查看"""
+
+    def __init__(self, registry, prefix, size=RECENT_TRACES):
+        self.hop_seconds = registry.histogram(
+            f"{prefix}_trace_hop_seconds", "Time from trace origin to each hop", ("source", "stage"))
+        self.total_seconds = registry.histogram(
+            f"{prefix}_trace_total_seconds", "Time from trace origin to completion", ("source", "outcome"))
+        self.recent = deque(maxlen=size)
+        self.lock = threading.Lock()
+
+    def finish(self, trace, outcome):
+        """记录一条 Trace 的结果，重复调用只记第一次"""
+        with self.lock:
+            if trace.outcome is not None:
+                return
+            trace.outcome = outcome
+            self.recent.append(trace)
+        origin = trace.origin
+        if origin is None:
+            return
+        for stage, timestamp in trace.hops[1:]:
+            self.hop_seconds.observe(max(0.0, timestamp - origin), trace.source, stage)
+        self.total_seconds.observe(max(0.0, time.time() - origin), trace.source, outcome)
+
+    def latest(self, n=50):
+        with self.lock:
+            traces = list(self.recent)[-n:]
+        return [trace.to_dict() for trace in traces]
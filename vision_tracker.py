@@ -1,13 +1,26 @@
 import cv2
-from ultralytics import YOLO
-import requests
+import numpy as np
 import time
-import sys
+import math
+import os
+import glob
+import shutil
+import argparse
+import hashlib
+import socket
 import threading
-from flask import Flask, Response
+import json
+from flask import Flask, Response, request
+from car_link import CarLink, format_velocity
+from tracing import Trace, Registry, PROMETHEUS_CONTENT_TYPE
+from frame_log import FrameLogWriter, FrameLogReader, is_frame_log
+from frame_ring import FrameRingWriter, FLAG_DETECTED, FLAG_PAUSED
+from object_tracker import MultiObjectTracker, select_locked, HIGH_CONF, LOW_CONF
 
 # ================= 配置区域 =================
-CAR_SERVER_URL = "http://127.0.0.1:5000/move"
+CMD_TIMEOUT = 0.05  # 指令应答超时 (s)，本机 UDP 往返通常不到 1ms
+LINK_REPORT_INTERVAL = 30.0  # 打印指令通道统计的间隔 (s)
+STATUS_REPORT_INTERVAL = 1.0  # 向 car_server 上报跟踪帧率的间隔 (s)，供 OLED 显示
 STREAM_PORT = 5001  # 视频流专用端口
 
 FRAME_WIDTH = 640
@@ -20,34 +33,966 @@ MIN_HEIGHT_RATIO = 0.2
 # 默认目标 ID
 DEFAULT_CLASS_ID = 0 
 
-# 全局变量（用于线程间共享画面）
-output_frame = None
-lock = threading.Lock()
+# 控制方式: 'bang' 发送旧的 L/R/F/S (所有固件都支持)，'pid' 发送比例速度指令
+# (需要先烧录带 V 指令与速度看门狗的新版 arduino_car.ino，旧固件收到 V 会一直按上一条指令跑)
+CONTROL_MODE = 'bang'
+YAW_PID = (1.2, 0.0, 0.15)       # (kp, ki, kd)，输入为归一化的水平偏差
+FORWARD_PID = (2.5, 0.0, 0.1)    # 输入为目标高度比例与期望值之差
+TARGET_HEIGHT_RATIO = (MAX_HEIGHT_RATIO + MIN_HEIGHT_RATIO) / 2
+YAW_DEADZONE = 0.05              # 水平偏差小于该值视为已对准
+HEIGHT_DEADZONE = 0.1            # 高度比例与期望值相差小于该值视为距离合适
+MAX_FORWARD_SPEED = 0.8
+MAX_YAW_SPEED = 0.6
+VEL_DEADBAND = 0.05              # 速度变化小于该值时不重发
+VEL_KEEPALIVE = 0.1              # 速度不变时的重发间隔 (s)，须小于固件的 VEL_WATCHDOG (300ms)
+
+# 推理后端
+MODEL_WEIGHTS = 'yolov8n.pt'
+MODEL_CACHE_DIR = 'models'  # 导出后的模型缓存在这里，只转换一次
+INFERENCE_SIZE = 320
+DEFAULT_BACKEND = 'torch'
+BENCHMARK_WARMUP = 3        # 基准测试时每个后端先空跑几次
+
+# 隔帧检测：YOLO 每 N 帧跑一次，中间用光流推算目标框
+DETECT_INTERVAL = 0         # 0 表示根据推理耗时自动调整 N，1 表示每帧都检测
+MAX_DETECT_INTERVAL = 8     # 自动调整时 N 的上限，防止光流漂移太久
+CAMERA_FRAME_MS = 1000 / 30 # 摄像头出帧间隔
+REDETECT_CONF = 0.5         # 目标置信度低于该值时下一帧重新检测
+
+# 目标选择: 'track' 用多目标跟踪给检测框分配持久 ID，锁定一个目标直到它丢失 (见 object_tracker.py)；
+#          'largest' 每帧取面积最大的目标 (旧方式，画面里有两个同类物体时会来回跳)
+TARGET_SELECTION = 'track'
+
+CMD_INTERVAL = 0.2         # bang 控制方式下的发送间隔 (s)
+REPLAY_PRINT_COMMANDS = 20 # 回放结束时打印的指令条数
+
+STREAM_WAIT_TIMEOUT = 1.0  # 视频流客户端等待新帧的超时 (s)
+STREAM_MAX_FPS = 0         # 视频流帧率上限，0 表示不限制 (没人观看时不绘图也不编码)
+# 推流方式: 'passthrough' 直接转发摄像头的 MJPEG 原始字节，检测框经 /overlay_stream 发给网页绘制；
+#          'draw' 在画面上画框后重新编码 (旧方式，摄像头不支持原始 JPEG 时自动改用)
+STREAM_MODE = 'passthrough'
+OVERLAY_KEEPALIVE = 10.0   # 检测框推送流没有新数据时的心跳间隔 (s)
+
+# 推流档位 (/video_feed?profile=<名称>): 名称 -> (宽度, JPEG 质量, 帧率上限)
+# 宽度 / 质量为 None 表示原始分辨率与默认质量 (直通模式下直接转发摄像头的 JPEG)，帧率 0 表示不限制
+STREAM_PROFILES = {
+    "full":   (None, None, 0),
+    "high":   (640, 80, 0),
+    "medium": (320, 70, 15),
+    "low":    (320, 50, 10),
+    "tiny":   (160, 40, 5),
+}
+DEFAULT_STREAM_PROFILE = "full"
+STREAM_PROFILE_LADDER = ("full", "high", "medium", "low", "tiny")  # 自适应推流按此顺序降档
+MIN_STREAM_WIDTH = 80
+ADAPT_SLOW_RATIO = 0.5     # 写出一帧的耗时超过帧间隔的该比例视为拥塞
+ADAPT_DOWN_AFTER = 3       # 连续几帧拥塞后降一档
+ADAPT_UP_AFTER = 5.0       # 连续通畅多少秒后升一档 (最高回到请求的档位)
+# 自适应客户端的套接字发送缓冲区 (字节)：默认缓冲区能攒下几秒的画面，网速跟不上时要很久才会阻塞
+ADAPT_SEND_BUFFER = 32 * 1024
 
 # 初始化 Flask (用于视频流)
 app = Flask(__name__)
 
 # ===========================================
 
-def send_cmd(cmd):
-    try:
-        requests.get(f"{CAR_SERVER_URL}?cmd={cmd}", timeout=0.1)
-        # print(f">> 发送指令: {cmd}")
-    except Exception:
-        pass 
+class FrameBroadcaster:
+    """
+    MJPEG 广播器：跟踪线程发布原始画面，每个推流档位每一帧最多编码一次，
+    使用同一档位的客户端共享同一份 JPEG 字节。客户端按帧序号等待，只拿自己没看过的帧。
+    直通模式下发布的是摄像头原始 JPEG (publish_jpeg)，原始档位完全不编码。
+    """
+    def __init__(self, max_fps=0):
+        self.cond = threading.Condition()
+        self.max_fps = max_fps  # 推流帧率上限，0 表示跟随推理速度
+        self.last_publish = 0.0
+        self.seq = 0            # 最新画面的序号
+        self.frame = None       # 最新画面 (BGR)，直通且未解码时为 None
+        self.source_jpeg = None # 直通模式下摄像头的原始 JPEG
+        self.encoders = {}      # (宽度, 质量) -> 该档位的编码缓存与统计
+        self.passthrough = 0    # 直通发布的帧数
+        self.mode = 'draw'      # 当前推流方式，由 tracker_thread 设置
+        self.clients = {}       # client_id -> 统计信息
+        self.next_client_id = 0
+
+    def wants_frame(self):
+        """是否需要发布这一帧：有人在看，且距上次发布已超过推流间隔"""
+        with self.cond:
+            if not self.clients:
+                return False
+            if self.max_fps > 0 and time.time() - self.last_publish < 1.0 / self.max_fps:
+                return False
+            return True
+
+    def publish(self, frame):
+        """发布新画面 (调用方之后不能再修改 frame)"""
+        with self.cond:
+            self.last_publish = time.time()
+            self.seq += 1
+            self.frame = frame
+            self.source_jpeg = None
+            self.cond.notify_all()
+
+    def publish_jpeg(self, jpeg, frame=None):
+        """直通模式：发布摄像头输出的 JPEG 字节 (frame 为已解码的画面，缩小档位直接使用)"""
+        with self.cond:
+            self.last_publish = time.time()
+            self.seq += 1
+            self.frame = frame
+            self.source_jpeg = jpeg
+            self.passthrough += 1
+            self.cond.notify_all()
+
+    def wait_frame(self, last_seq, timeout=STREAM_WAIT_TIMEOUT):
+        """等待比 last_seq 更新的画面，返回其序号；超时返回 None"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > last_seq, timeout):
+                return None
+            return self.seq
 
-def tracker_thread(target_class_id):
+    def _encoder(self, key):
+        with self.cond:
+            encoder = self.encoders.get(key)
+            if encoder is None:
+                encoder = self.encoders[key] = {
+                    "lock": threading.Lock(), "seq": 0, "jpeg": None,
+                    "encoded": 0, "encode_ms": 0.0, "bytes": 0.0,
+                }
+            return encoder
+
+    def get_jpeg(self, width=None, quality=None):
+        """
+        最新画面在某个档位下的 JPEG，返回 (seq, jpeg)。
+        width/quality 为 None 表示原始分辨率与默认质量；直通模式下原始档位直接返回摄像头的 JPEG。
+        第一个请求这一帧的客户端负责编码，同档位的其他客户端直接复用。
+        """
+        with self.cond:
+            seq, frame, source_jpeg = self.seq, self.frame, self.source_jpeg
+        if source_jpeg is not None and width is None and quality is None:
+            return seq, source_jpeg
+
+        encoder = self._encoder((width, quality))
+        with encoder["lock"]:
+            if encoder["seq"] < seq:
+                start = time.perf_counter()
+                if frame is None:
+                    # 暂停时直通画面没有解码，缩小档位自己解码一次
+                    if source_jpeg is None:
+                        return seq, None
+                    frame = cv2.imdecode(np.frombuffer(source_jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                    if frame is None:
+                        # 摄像头偶尔输出损坏的 JPEG：这一帧按原样转发，不缩小
+                        encoder["jpeg"] = source_jpeg
+                        encoder["seq"] = seq
+                        return seq, source_jpeg
+                if width is not None and width < frame.shape[1]:
+                    height = round(frame.shape[0] * width / frame.shape[1])
+                    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                params = [cv2.IMWRITE_JPEG_QUALITY, quality] if quality is not None else []
+                flag, encoded = cv2.imencode(".jpg", frame, params)
+                if not flag:
+                    return seq, None
+                encoder["jpeg"] = encoded.tobytes()
+                encoder["seq"] = seq
+                encoder["encoded"] += 1
+                encoder["encode_ms"] += 0.1 * ((time.perf_counter() - start) * 1000 - encoder["encode_ms"])
+                encoder["bytes"] += 0.1 * (len(encoder["jpeg"]) - encoder["bytes"])
+            return encoder["seq"], encoder["jpeg"]
+
+    def subscribe(self, profile):
+        with self.cond:
+            self.next_client_id += 1
+            now = time.time()
+            self.clients[self.next_client_id] = {
+                "connected": now, "frames": 0, "fps": 0.0, "kbps": 0.0,
+                "profile": profile, "write_ms": 0.0, "switches": 0,
+                "window_start": now, "window_frames": 0, "window_bytes": 0,
+            }
+            return self.next_client_id
+
+    def unsubscribe(self, client_id):
+        with self.cond:
+            self.clients.pop(client_id, None)
+
+    def record_sent(self, client_id, size, write_s, profile):
+        """记录某个客户端发出了一帧 (字节数、写入耗时、当前档位)，每秒更新一次 FPS 与码率"""
+        now = time.time()
+        with self.cond:
+            client = self.clients.get(client_id)
+            if client is None:
+                return
+            if client["profile"] != profile:
+                client["profile"] = profile
+                client["switches"] += 1
+            client["frames"] += 1
+            client["window_frames"] += 1
+            client["window_bytes"] += size
+            client["write_ms"] += 0.1 * (write_s * 1000 - client["write_ms"])
+            elapsed = now - client["window_start"]
+            if elapsed >= 1.0:
+                client["fps"] = client["window_frames"] / elapsed
+                client["kbps"] = client["window_bytes"] * 8 / 1000 / elapsed
+                client["window_start"] = now
+                client["window_frames"] = 0
+                client["window_bytes"] = 0
+
+    def stats(self):
+        with self.cond:
+            clients = {
+                str(cid): {"profile": c["profile"], "frames": c["frames"], "fps": round(c["fps"], 1),
+                           "kbps": round(c["kbps"], 1), "write_ms": round(c["write_ms"], 2),
+                           "switches": c["switches"], "connected_s": round(time.time() - c["connected"], 1)}
+                for cid, c in self.clients.items()
+            }
+            encoders = {
+                f"{width or 'source'}/q{quality or 'default'}": {
+                    "encoded": e["encoded"], "encode_ms": round(e["encode_ms"], 2),
+                    "avg_kb": round(e["bytes"] / 1024, 1)}
+                for (width, quality), e in self.encoders.items()
+            }
+            return {
+                "mode": self.mode,
+                "max_fps": self.max_fps,
+                "frame_seq": self.seq,
+                "encoded": sum(e["encoded"] for e in self.encoders.values()),
+                "passthrough": self.passthrough,
+                "encoders": encoders,
+                "clients": clients,
+            }
+
+broadcaster = FrameBroadcaster()
+
+class OverlayChannel:
     """
-    原本的主循环，现在作为一个后台线程运行。
-    负责：读取摄像头 -> YOLO 推理 -> 决策控制 -> 更新全局 output_frame
+    检测结果推送 (直通模式下由网页在 <canvas> 上绘制)：只保留最新一条，
+    每个 SSE 客户端按序号等待，没有客户端时跟踪线程不生成数据。
+    """
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.seq = 0
+        self.payload = None   # 最新一条的 JSON 文本
+        self.clients = 0
+
+    def wanted(self):
+        with self.cond:
+            return self.clients > 0
+
+    def publish(self, overlay):
+        text = json.dumps(overlay, separators=(",", ":"))
+        with self.cond:
+            self.seq += 1
+            self.payload = text
+            self.cond.notify_all()
+
+    def wait(self, last_seq, timeout=OVERLAY_KEEPALIVE):
+        """等待比 last_seq 更新的一条，返回 (seq, JSON 文本)；超时返回 (last_seq, None)"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > last_seq, timeout):
+                return last_seq, None
+            return self.seq, self.payload
+
+    def subscribe(self):
+        with self.cond:
+            self.clients += 1
+
+    def unsubscribe(self):
+        with self.cond:
+            self.clients -= 1
+
+overlay_channel = OverlayChannel()
+
+def is_jpeg_buffer(frame):
+    """CAP_PROP_CONVERT_RGB=0 时 OpenCV 返回的是一维 (或 1xN) 的 JPEG 字节"""
+    return (frame is not None and frame.dtype == np.uint8 and frame.size > 2
+            and (frame.ndim == 1 or frame.shape[0] == 1)
+            and frame.flat[0] == 0xFF and frame.flat[1] == 0xD8)
+
+def enable_passthrough(cap):
+    """
+    让 OpenCV 不解码，直接返回 V4L2 缓冲区里的 MJPEG 字节 (CAP_PROP_CONVERT_RGB=0)。
+    只有 FOURCC 确认是 MJPG 且试读的一帧确实是 JPEG 时才启用，返回是否启用；
+    否则 (例如 libcamerify 下的 Pi 摄像头只给 YUYV) 恢复解码输出。试读的帧一律丢弃。
+    """
+    fourcc = int(cap.get(cv2.CAP_PROP_FOURCC))
+    if fourcc != cv2.VideoWriter_fourcc(*'MJPG'):
+        name = fourcc.to_bytes(4, 'little').decode('ascii', 'replace')
+        print(f"!!! 摄像头输出格式为 {name!r} 而不是 MJPG，改为绘图后重新编码的推流方式", flush=True)
+        return False
+    cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+    success, frame = cap.read()
+    if success and is_jpeg_buffer(frame):
+        return True
+    print("!!! 摄像头没有返回原始 JPEG，改为绘图后重新编码的推流方式", flush=True)
+    cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+    return False
+
+class FrameGrabber:
+    """
+    独立采集线程：不停地 cap.read()，只保留最新的一帧及其采集时间。
+    推理线程每次拿到的都是最新画面，不会处理 V4L2 缓冲区里积压的旧帧。
+    """
+    def __init__(self, cap):
+        self.cap = cap
+        self.cond = threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.timestamp = 0.0
+        self.consumed_seq = 0
+        self.captured = 0      # 采集到的帧数
+        self.consumed = 0      # 被推理线程取走的帧数
+        self.dropped = 0       # 还没被取走就被新帧覆盖的帧数
+        self.read_errors = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        if self.thread:
+            self.thread.join(timeout=1.0)
+
+    def _loop(self):
+        while self.running:
+            try:
+                success, frame = self.cap.read()
+            except Exception:
+                success = False
+            if not success:
+                self.read_errors += 1
+                time.sleep(0.01)
+                continue
+
+            timestamp = time.time()
+            with self.cond:
+                if self.seq > self.consumed_seq:
+                    self.dropped += 1
+                self.seq += 1
+                self.frame = frame
+                self.timestamp = timestamp
+                self.captured += 1
+                self.cond.notify_all()
+
+    def read(self, last_seq, timeout=1.0):
+        """等待比 last_seq 更新的帧，返回 (seq, frame, timestamp)；超时或已停止返回 None"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > last_seq or not self.running, timeout):
+                return None
+            if not self.running:
+                return None
+            self.consumed_seq = self.seq
+            self.consumed += 1
+            return self.seq, self.frame, self.timestamp
+
+    def stats(self):
+        with self.cond:
+            return {
+                "captured": self.captured,
+                "consumed": self.consumed,
+                "dropped": self.dropped,
+                "read_errors": self.read_errors,
+            }
+
+frame_grabber = None  # 由 tracker_thread 创建，/stream_stats 读取
+
+class BoxFlowTracker:
+    """
+    两次 YOLO 检测之间的轻量跟踪：在目标框内取角点，用 LK 光流跟到下一帧，
+    用位移和尺度变化的中位数推算新的目标框。跟丢时返回 None，由调用方重新检测。
+    """
+    MIN_POINTS = 8
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.prev_gray = None
+        self.points = None
+        self.box = None
+
+    @property
+    def active(self):
+        return self.points is not None
+
+    def init(self, frame, box):
+        """用检测到的目标框初始化，特征点太少时返回 False"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        x1, y1, x2, y2 = box
+        mask = np.zeros_like(gray)
+        mask[max(y1, 0):y2, max(x1, 0):x2] = 255
+        points = cv2.goodFeaturesToTrack(gray, maxCorners=50, qualityLevel=0.01,
+                                         minDistance=5, mask=mask)
+        if points is None or len(points) < self.MIN_POINTS:
+            self.reset()
+            return False
+        self.prev_gray = gray
+        self.points = points
+        self.box = box
+        return True
+
+    def update(self, frame):
+        """把目标框推到当前帧，返回 (x1, y1, x2, y2) 或 None"""
+        if self.points is None:
+            return None
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        new_points, status, _ = cv2.calcOpticalFlowPyrLK(
+            self.prev_gray, gray, self.points, None, winSize=(15, 15), maxLevel=2)
+        good = status.reshape(-1) == 1
+        if good.sum() < self.MIN_POINTS:
+            self.reset()
+            return None
+
+        old = self.points[good].reshape(-1, 2)
+        new = new_points[good].reshape(-1, 2)
+        dx, dy = np.median(new - old, axis=0)
+        # 尺度：各点到质心距离的变化比例
+        old_dist = np.linalg.norm(old - old.mean(axis=0), axis=1)
+        new_dist = np.linalg.norm(new - new.mean(axis=0), axis=1)
+        valid = old_dist > 1.0
+        scale = float(np.median(new_dist[valid] / old_dist[valid])) if valid.any() else 1.0
+
+        x1, y1, x2, y2 = self.box
+        cx, cy = (x1 + x2) / 2 + dx, (y1 + y2) / 2 + dy
+        half_w, half_h = (x2 - x1) * scale / 2, (y2 - y1) * scale / 2
+        # 内部保留浮点坐标，避免每帧取整累积误差
+        self.box = (max(cx - half_w, 0.0), max(cy - half_h, 0.0),
+                    min(cx + half_w, FRAME_WIDTH - 1.0), min(cy + half_h, FRAME_HEIGHT - 1.0))
+        self.prev_gray = gray
+        self.points = new.reshape(-1, 1, 2)
+        return tuple(int(round(v)) for v in self.box)
+
+# /metrics 指标 (见 tracing.py)
+metrics = Registry()
+stage_seconds = metrics.histogram(
+    "vision_stage_seconds", "Per-frame processing time by stage", ("stage",))
+capture_to_send_seconds = metrics.histogram(
+    "vision_capture_to_send_seconds", "Frame capture to command sent to car_server")
+commands_total = metrics.counter("vision_commands_total", "Commands sent to car_server", ("result",))
+
+# 常驻的 UDP 指令通道，RTT 与丢失数记录在 car_link.stats
+car_link = CarLink(timeout=CMD_TIMEOUT, rtt_histogram=metrics.histogram(
+    "vision_car_link_rtt_seconds", "UDP command channel round trip time", ("op",)))
+
+def send_cmd(cmd, trace=None):
+    result = car_link.send(cmd, trace=trace)
+    commands_total.inc("acked" if result is not None else "dropped")
+    if trace is not None:
+        capture_to_send_seconds.observe(time.time() - trace.origin)
+    # print(f">> 发送指令: {cmd}")
+
+# ================= 推理后端 =================
+# 名称 -> (ultralytics 导出格式, 导出参数, 缓存文件名后缀)
+# 导出的模型输入尺寸是固定的，所以缓存文件名里带上 INFERENCE_SIZE
+BACKENDS = {
+    "torch": None,  # 直接用 PyTorch 跑 .pt 权重
+    "onnx": ("onnx", {}, ".onnx"),
+    "openvino": ("openvino", {}, "_openvino_model"),
+    "openvino-int8": ("openvino", {"int8": True}, "_int8_openvino_model"),
+}
+
+def cached_model_path(backend):
+    """某个后端导出模型的缓存路径 (ultralytics 根据 _openvino_model 后缀识别 OpenVINO 目录)"""
+    _, _, suffix = BACKENDS[backend]
+    stem = os.path.splitext(os.path.basename(MODEL_WEIGHTS))[0]
+    return os.path.join(MODEL_CACHE_DIR, f"{stem}_{INFERENCE_SIZE}{suffix}")
+
+def load_model(backend=DEFAULT_BACKEND):
+    """按后端加载模型，首次使用时导出并缓存到 MODEL_CACHE_DIR"""
+    from ultralytics import YOLO  # 只在加载模型时导入，import 本模块 (测试、工具脚本) 不需要 ultralytics
+    if BACKENDS[backend] is None:
+        return YOLO(MODEL_WEIGHTS)
+
+    fmt, export_args, _ = BACKENDS[backend]
+    path = cached_model_path(backend)
+    if not os.path.exists(path):
+        print(f"首次使用 {backend} 后端，正在导出模型 (只需一次)...", flush=True)
+        exported = YOLO(MODEL_WEIGHTS).export(format=fmt, imgsz=INFERENCE_SIZE, **export_args)
+        os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+        shutil.move(str(exported), path)
+    return YOLO(path, task='detect')
+
+def run_benchmark(image_dir, backends):
+    """在一个图片目录上依次跑各个后端，打印平均/P95 延迟与 FPS"""
+    images = []
+    for pattern in ("*.jpg", "*.jpeg", "*.png"):
+        for path in sorted(glob.glob(os.path.join(image_dir, pattern))):
+            image = cv2.imread(path)
+            if image is not None:
+                images.append(image)
+    if not images:
+        print(f"!!! {image_dir} 中没有可用的图片")
+        return
+
+    print(f"基准测试: {len(images)} 张图片, 输入尺寸 {INFERENCE_SIZE}")
+    print(f"{'后端':<16}{'平均(ms)':>10}{'P95(ms)':>10}{'FPS':>8}")
+    for backend in backends:
+        try:
+            model = load_model(backend)
+            for image in images[:BENCHMARK_WARMUP]:
+                model(image, imgsz=INFERENCE_SIZE, conf=0.4, verbose=False)
+
+            latencies = []
+            for image in images:
+                start = time.perf_counter()
+                model(image, imgsz=INFERENCE_SIZE, conf=0.4, verbose=False)
+                latencies.append((time.perf_counter() - start) * 1000)
+        except Exception as e:
+            print(f"{backend:<16}失败: {e}")
+            continue
+
+        latencies.sort()
+        mean_ms = sum(latencies) / len(latencies)
+        p95_ms = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"{backend:<16}{mean_ms:>10.1f}{p95_ms:>10.1f}{1000 / mean_ms:>8.1f}")
+
+# ================= 速度控制 =================
+class PID:
+    """简单的 PID 控制器，输出限制在 [-limit, limit]"""
+    def __init__(self, kp, ki=0.0, kd=0.0, limit=1.0):
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.limit = limit
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.prev_error = None
+
+    def update(self, error, dt):
+        if dt > 0 and self.ki > 0:
+            # 积分限幅，防止长时间偏差导致积分饱和
+            bound = self.limit / self.ki
+            self.integral = max(-bound, min(bound, self.integral + error * dt))
+        derivative = 0.0
+        if self.prev_error is not None and dt > 0:
+            derivative = (error - self.prev_error) / dt
+        self.prev_error = error
+        output = self.kp * error + self.ki * self.integral + self.kd * derivative
+        return max(-self.limit, min(self.limit, output))
+
+class VelocityController:
+    """
+    把目标框的偏差换算成 (前进, 平移, 旋转) 速度。
+    水平偏差控制旋转，目标高度比例控制前进；只有速度明显变化或到了重发间隔才发送。
     """
-    global output_frame, lock
+    def __init__(self):
+        self.yaw_pid = PID(*YAW_PID, limit=MAX_YAW_SPEED)
+        self.forward_pid = PID(*FORWARD_PID, limit=MAX_FORWARD_SPEED)
+        self.last_time = None
+        self.last_sent = None
+        self.last_send_time = 0.0
+
+    def compute(self, target_box, frame_time):
+        dt = 0.0 if self.last_time is None else frame_time - self.last_time
+        self.last_time = frame_time
+        if not target_box:
+            self.yaw_pid.reset()
+            self.forward_pid.reset()
+            return (0.0, 0.0, 0.0)
+
+        x1, y1, x2, y2 = target_box
+        x_error = ((x1 + x2) / 2 - CENTER_X) / CENTER_X      # 目标在右侧为正
+        height_error = TARGET_HEIGHT_RATIO - (y2 - y1) / FRAME_HEIGHT  # 目标太小为正
+        if abs(x_error) < YAW_DEADZONE:
+            x_error = 0.0
+        if abs(height_error) < HEIGHT_DEADZONE:
+            height_error = 0.0
+
+        yaw = self.yaw_pid.update(x_error, dt)
+        forward = self.forward_pid.update(height_error, dt)
+        # 目标太近时停下而不是倒车 (与 bang 控制的 S 一致)；偏得越多前进越慢，先转正再靠近
+        forward = max(0.0, forward) * max(0.0, 1.0 - abs(x_error) * 2)
+        return (forward, 0.0, yaw)
+
+    def should_send(self, velocity, now):
+        if self.last_sent is not None:
+            changed = max(abs(a - b) for a, b in zip(velocity, self.last_sent)) >= VEL_DEADBAND
+            # 从运动变为静止时必须立即发送
+            stopping = not any(velocity) and any(self.last_sent)
+            if not changed and not stopping and now - self.last_send_time < VEL_KEEPALIVE:
+                return False
+        self.last_sent = velocity
+        self.last_send_time = now
+        return True
+
+# ================= 检测结果后处理 =================
+def select_target(xyxy, cls, conf, target_class_id):
+    """
+    一次 NumPy 运算完成后处理：类别筛选、面积计算、取面积最大的目标。
+    xyxy: (N, 4) 坐标, cls: (N,) 类别, conf: (N,) 置信度
+    返回 (boxes, is_target, target_index)：boxes 为 int32 坐标，
+    is_target 为布尔掩码，没有目标时 target_index 为 -1。
+    """
+    boxes = np.asarray(xyxy).astype(np.int32).reshape(-1, 4)
+    is_target = np.asarray(cls).astype(np.int32) == target_class_id
+    if not is_target.any():
+        return boxes, is_target, -1
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    areas = np.where(is_target, areas, -1)
+    index = int(np.argmax(areas))
+    # 与逐框比较的旧逻辑一致：面积为 0 的框不作为目标
+    if areas[index] <= 0:
+        return boxes, is_target, -1
+    return boxes, is_target, index
+
+def _select_target_loop(xyxy, cls, conf, target_class_id):
+    """逐框处理的旧写法，仅作为基准测试的对照"""
+    target_index, max_area = -1, 0
+    for i in range(len(cls)):
+        if int(cls[i]) != target_class_id:
+            continue
+        x1, y1, x2, y2 = map(int, xyxy[i])
+        area = (x2 - x1) * (y2 - y1)
+        if area > max_area:
+            max_area, target_index = area, i
+    return target_index
+
+def bench_postprocess(repeats=2000):
+    """在 10 / 100 / 300 个随机检测框上比较向量化与逐框后处理的耗时"""
+    rng = np.random.default_rng(0)
+    print(f"{'框数':<8}{'向量化(us)':>12}{'逐框(us)':>12}")
+    for count in (10, 100, 300):
+        x1y1 = rng.uniform(0, [FRAME_WIDTH - 50, FRAME_HEIGHT - 50], size=(count, 2))
+        wh = rng.uniform(10, 200, size=(count, 2))
+        xyxy = np.hstack([x1y1, x1y1 + wh]).astype(np.float32)
+        cls = rng.integers(0, 80, size=count).astype(np.float32)
+        cls[::5] = DEFAULT_CLASS_ID
+        conf = rng.uniform(0.4, 1.0, size=count).astype(np.float32)
+
+        assert select_target(xyxy, cls, conf, DEFAULT_CLASS_ID)[2] == \
+            _select_target_loop(xyxy, cls, conf, DEFAULT_CLASS_ID)
+
+        timings = []
+        for func in (select_target, _select_target_loop):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                func(xyxy, cls, conf, DEFAULT_CLASS_ID)
+            timings.append((time.perf_counter() - start) / repeats * 1e6)
+        print(f"{count:<8}{timings[0]:>12.1f}{timings[1]:>12.1f}")
+
+# ================= 单帧处理流程 =================
+class MetricsStageTimer:
+    """实时跟踪时把各阶段耗时写入 /metrics 的直方图 (接口与 StageTimer 相同)"""
+    def add(self, stage, start):
+        stage_seconds.observe(time.perf_counter() - start, stage)
+
+class StageTimer:
+    """按阶段记录耗时 (ms)，离线回放时用来输出每个阶段的开销"""
+    STAGES = ("decode", "inference", "postprocess", "track", "control", "draw", "encode")
+
+    def __init__(self):
+        self.samples = {stage: [] for stage in self.STAGES}
+
+    def add(self, stage, start):
+        self.samples[stage].append((time.perf_counter() - start) * 1000)
+
+    def report(self):
+        print(f"{'阶段':<14}{'次数':>8}{'平均(ms)':>10}{'P95(ms)':>10}{'合计(s)':>10}")
+        for stage in self.STAGES:
+            values = sorted(self.samples[stage])
+            if not values:
+                continue
+            mean_ms = sum(values) / len(values)
+            p95_ms = values[min(len(values) - 1, int(len(values) * 0.95))]
+            print(f"{stage:<14}{len(values):>8}{mean_ms:>10.2f}{p95_ms:>10.2f}{sum(values) / 1000:>10.2f}")
+
+class TrackerPipeline:
+    """
+    一帧的处理流程：YOLO 检测 / 光流推算 -> 控制决策 -> (可选) 绘图。
+    实时跟踪 (tracker_thread) 与离线回放 (run_replay) 共用同一份逻辑。
+    send(cmd, trace) 负责把指令发出去，回放时换成记录指令的桩函数。
+    """
+    def __init__(self, model, target_class_id, send, detect_interval=DETECT_INTERVAL,
+                 control_mode=CONTROL_MODE, timer=None, selection=TARGET_SELECTION):
+        self.model = model
+        self.target_class_id = target_class_id
+        self.send = send
+        self.detect_interval = detect_interval
+        self.control_mode = control_mode
+        self.timer = timer
+
+        # 'track' 模式下 YOLO 放低置信度阈值，低分框只用来给已有轨迹续命
+        self.object_tracker = MultiObjectTracker() if selection == 'track' else None
+        self.detect_conf = LOW_CONF if self.object_tracker is not None else HIGH_CONF
+        self.locked_id = None      # 锁定的轨迹 ID
+        self.lock_count = 0        # 锁定过几次目标 (跳变统计)
+        self.flow_tracker = BoxFlowTracker()
+        self.velocity_controller = VelocityController()
+        self.interval = detect_interval if detect_interval > 0 else 1
+        self.frames_since_detect = 0
+        self.target_conf = 0.0
+        self.infer_ms = 0.0        # YOLO 推理耗时 (滑动平均)
+        self.detected_frames = 0
+        self.tracked_frames = 0
+        self.last_cmd_time = 0
+        self.cmd_latency_ms = 0.0  # 采集 -> 发出指令 的耗时 (滑动平均)
+
+        # 最近一帧的结果 (供绘图使用)
+        self.target_box = None
+        self.boxes = None          # 本帧 YOLO 的检测结果 (光流帧为 None)
+        self.is_target = None
+        self.classes = self.confs = None  # 与 boxes 对应的类别与置信度
+        self.track_ids = None      # 与 boxes 对应的轨迹 ID ('largest' 模式为 None)
+
+    def set_target(self, target_class_id):
+        """切换跟踪目标：丢掉旧目标的跟踪状态，下一帧立即用 YOLO 重新检测"""
+        self.target_class_id = target_class_id
+        self.reset()
+
+    def reset(self):
+        self.flow_tracker.reset()
+        self.velocity_controller = VelocityController()
+        self.frames_since_detect = 0
+        self.target_conf = 0.0
+        self.target_box = None
+        self.boxes = self.is_target = None
+        self.classes = self.confs = self.track_ids = None
+        if self.object_tracker is not None:
+            self.object_tracker.reset()
+        self.locked_id = None
+
+    def _time(self, stage, start):
+        if self.timer:
+            self.timer.add(stage, start)
 
-    print(f"正在加载 YOLOv8n 模型... 目标ID: {target_class_id}", flush=True)
+    def process(self, frame, frame_time, now):
+        """处理一帧：更新目标框并发出控制指令，返回目标框"""
+        self.perceive(frame, frame_time)
+        start = time.perf_counter()
+        self.control(frame_time, now)
+        self._time("control", start)
+        return self.target_box
+
+    def perceive(self, frame, frame_time=None):
+        # 决定这一帧是跑 YOLO 还是用光流推算
+        need_detect = (self.frames_since_detect >= self.interval - 1 or not self.flow_tracker.active
+                       or self.target_conf < REDETECT_CONF)
+        self.target_box = None
+        self.boxes = self.is_target = None
+        self.classes = self.confs = self.track_ids = None
+
+        if not need_detect:
+            start = time.perf_counter()
+            self.target_box = self.flow_tracker.update(frame)
+            self._time("track", start)
+            if self.target_box:
+                self.frames_since_detect += 1
+                self.tracked_frames += 1
+                return
+            # 光流跟丢，这一帧立即重新检测
+
+        # YOLO 推理
+        # 降低置信度可以更容易发现目标
+        start = time.perf_counter()
+        results = self.model(frame, imgsz=INFERENCE_SIZE, conf=self.detect_conf, verbose=False)
+        infer_elapsed = (time.perf_counter() - start) * 1000
+        self._time("inference", start)
+
+        # 解析结果：一次性把整批结果转成 NumPy，再向量化挑出最大的目标
+        start = time.perf_counter()
+        self.target_conf = 0.0
+        for result in results:
+            det = result.boxes.cpu().numpy()
+            if self.object_tracker is not None:
+                self.associate(det, time.time() if frame_time is None else frame_time)
+                continue
+            self.boxes, self.is_target, target_index = select_target(
+                det.xyxy, det.cls, det.conf, self.target_class_id)
+            self.classes, self.confs = det.cls, det.conf
+            if target_index >= 0:
+                self.target_box = tuple(self.boxes[target_index].tolist())
+                self.target_conf = float(det.conf[target_index])
+        self._time("postprocess", start)
+
+        self.infer_ms += 0.1 * (infer_elapsed - self.infer_ms)
+        self.detected_frames += 1
+        self.frames_since_detect = 0
+        # 在画框之前初始化光流，避免把画上去的线条当成特征点
+        start = time.perf_counter()
+        if self.target_box:
+            self.flow_tracker.init(frame, self.target_box)
+        else:
+            self.flow_tracker.reset()
+        self._time("track", start)
+        if self.detect_interval <= 0:
+            # 推理越慢，两次检测之间插入的光流帧越多
+            self.interval = max(1, min(MAX_DETECT_INTERVAL, math.ceil(self.infer_ms / CAMERA_FRAME_MS)))
+
+    def associate(self, det, frame_time):
+        """
+        'track' 模式的后处理：检测框关联到轨迹，锁定的轨迹还在就一直跟它，
+        丢失 (超过 MAX_LOST_SECONDS 没匹配到) 后再取面积最大的同类目标重新锁定。
+        """
+        track_ids = self.object_tracker.update(det.xyxy, det.conf, det.cls, frame_time)
+        if self.locked_id is not None and not self.object_tracker.alive(self.locked_id):
+            print(f"目标 #{self.locked_id} 已丢失", flush=True)
+            self.locked_id = None
+        locked_before = self.locked_id
+        target_index, self.locked_id = select_locked(
+            track_ids, det.xyxy, det.cls, self.target_class_id, self.locked_id)
+        if self.locked_id is not None and self.locked_id != locked_before:
+            self.lock_count += 1
+            print(f"锁定目标 #{self.locked_id}", flush=True)
+
+        # 画面上只显示高分框；锁定目标被遮挡、只剩低分框时也显示出来
+        is_locked = track_ids == self.locked_id if self.locked_id is not None else np.zeros(len(track_ids), bool)
+        keep = (det.conf >= HIGH_CONF) | is_locked
+        self.boxes = det.xyxy[keep].astype(np.int32).reshape(-1, 4)
+        self.is_target = is_locked[keep]
+        self.classes, self.confs, self.track_ids = det.cls[keep], det.conf[keep], track_ids[keep]
+        if target_index >= 0:
+            self.target_box = tuple(det.xyxy[target_index].astype(np.int32).tolist())
+            self.target_conf = float(det.conf[target_index])
+
+    def _send(self, cmd, frame_time):
+        """发出指令，附带从这一帧采集时刻开始的 Trace"""
+        trace = Trace("vision")
+        trace.mark("capture", frame_time)
+        trace.mark("decision")
+        self.send(cmd, trace)
+
+    def control(self, frame_time, now):
+        target_box = self.target_box
+        if self.control_mode == 'pid':
+            # 比例速度控制：每帧计算，只有速度变化时才发送
+            velocity = self.velocity_controller.compute(target_box, frame_time)
+            if self.velocity_controller.should_send(velocity, now):
+                self._send(format_velocity(*velocity), frame_time)
+                self.cmd_latency_ms += 0.1 * ((time.time() - frame_time) * 1000 - self.cmd_latency_ms)
+        elif now - self.last_cmd_time > CMD_INTERVAL:
+            if target_box:
+                x1, y1, x2, y2 = target_box
+                box_center_x = (x1 + x2) / 2
+                box_height = y2 - y1
+                
+                if box_center_x < (CENTER_X - TOLERANCE):
+                    self._send('L', frame_time)
+                elif box_center_x > (CENTER_X + TOLERANCE):
+                    self._send('R', frame_time)
+                else:
+                    height_ratio = box_height / FRAME_HEIGHT
+                    if height_ratio > MAX_HEIGHT_RATIO:
+                        self._send('S', frame_time)
+                    elif height_ratio < MIN_HEIGHT_RATIO:
+                        self._send('F', frame_time)
+                    else:
+                        self._send('S', frame_time)
+            else:
+                self._send('S', frame_time)
+            self.last_cmd_time = now
+            self.cmd_latency_ms += 0.1 * ((time.time() - frame_time) * 1000 - self.cmd_latency_ms)
+
+    def draw(self, frame):
+        """把最近一帧的检测结果画到 frame 上"""
+        start = time.perf_counter()
+        # 颜色格式: (B, G, R)
+        if self.boxes is not None:
+            # 无论是不是目标，都画个细框表示看见了
+            for (x1, y1, x2, y2, track_id), is_tgt in zip(self._boxes_with_ids(), self.is_target.tolist()):
+                if is_tgt:
+                    # 目标物体：画粗绿色框
+                    label = f"TARGET {self.target_class_id}" + (f" #{track_id}" if track_id else "")
+                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 4)
+                    cv2.putText(frame, label, (x1, y1 - 10), 
+                               cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+                else:
+                    # 非目标物体：画细红色框
+                    cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 1)
+        elif self.target_box:
+            # 光流推算的目标：画黄色框
+            x1, y1, x2, y2 = self.target_box
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 255), 2)
+        self._time("draw", start)
+
+    def _boxes_with_ids(self):
+        """[x1, y1, x2, y2, 轨迹 ID]，'largest' 模式下 ID 为 0"""
+        ids = self.track_ids.tolist() if self.track_ids is not None else [0] * len(self.boxes)
+        return [box + [int(track_id)] for box, track_id in zip(self.boxes.tolist(), ids)]
+
+    def overlay(self, frame_seq, frame_time, paused=False):
+        """最近一帧的检测结果 (与 draw() 画的内容相同)，供网页在画面上绘制"""
+        boxes = []
+        if self.boxes is not None:
+            boxes = [box[:4] + [bool(is_tgt), box[4]]
+                     for box, is_tgt in zip(self._boxes_with_ids(), self.is_target.tolist())]
+        return {
+            "seq": frame_seq,
+            "t": round(frame_time, 3),
+            "w": FRAME_WIDTH,
+            "h": FRAME_HEIGHT,
+            "target": self.target_class_id,
+            "paused": paused,
+            "boxes": boxes,   # [x1, y1, x2, y2, 是否目标, 轨迹 ID]，光流帧为空
+            "flow": list(self.target_box) if self.boxes is None and self.target_box else None,
+        }
+
+    def write_ring(self, ring, frame, frame_time, paused=False):
+        """把画面与最近一帧的检测结果写进共享内存帧环"""
+        flags = (FLAG_DETECTED if self.boxes is not None else 0) | (FLAG_PAUSED if paused else 0)
+        ring.write(frame, frame_time, self.target_class_id, self.target_box,
+                   self.boxes, self.classes, self.confs, flags)
+
+    def summary(self):
+        text = (f"检测: YOLO {self.detected_frames} 帧 ({self.infer_ms:.0f}ms), "
+                f"光流 {self.tracked_frames} 帧, N={self.interval}")
+        if self.object_tracker is not None:
+            locked = f"#{self.locked_id}" if self.locked_id is not None else "无"
+            text += f", 轨迹 {len(self.object_tracker)} 条, 锁定 {locked} (共锁定 {self.lock_count} 次)"
+        return text
+
+# ================= 常驻进程控制 =================
+# 进程常驻，摄像头与模型一直保持加载；voice_controller 通过 /control/* 接口
+# 切换目标、暂停或恢复跟踪，切换在下一帧生效。
+tracking_state = {
+    "lock": threading.Lock(),
+    "target_class_id": DEFAULT_CLASS_ID,
+    "paused": False,
+    "ready": False,          # 模型已加载、摄像头已打开并完成第一次推理
+    "error": None,           # 启动失败的原因
+    "switch_requested": None,  # 最近一次切换目标的请求时间，生效后清空
+    "last_switch_ms": None,  # 请求切换 -> 新目标第一帧处理完成 的耗时
+}
+
+def set_tracking(target_class_id=None, paused=None):
+    with tracking_state["lock"]:
+        if target_class_id is not None and target_class_id != tracking_state["target_class_id"]:
+            tracking_state["target_class_id"] = target_class_id
+            if tracking_state["ready"]:
+                tracking_state["switch_requested"] = time.time()
+        if paused is not None:
+            tracking_state["paused"] = paused
+
+def get_tracking_status():
+    with tracking_state["lock"]:
+        return {k: v for k, v in tracking_state.items() if k not in ("lock", "switch_requested")}
+
+def tracker_thread(backend=DEFAULT_BACKEND, detect_interval=DETECT_INTERVAL,
+                   control_mode=CONTROL_MODE, record_path=None, stream_mode=STREAM_MODE,
+                   frame_ring=True, selection=TARGET_SELECTION):
+    """
+    原本的主循环，现在作为一个后台线程运行。
+    负责：取最新帧 -> YOLO 推理 (或光流推算) -> 决策控制 -> 发布画面
+    目标与暂停状态从 tracking_state 读取，每帧检查一次。
+    record_path 不为空时把原始画面和发出的指令录制到帧日志。
+    stream_mode='passthrough' 时采集线程拿到的是摄像头的原始 JPEG：
+    推流与录制直接使用这份字节，只有推理前才解码一次。
+    frame_ring=True 时有其他进程在读就把画面和检测结果写进共享内存帧环 (见 frame_ring.py)。
+    selection 为目标选择方式 (见 TARGET_SELECTION)。
+    """
+    global frame_grabber
+    with tracking_state["lock"]:
+        target_class_id = tracking_state["target_class_id"]
+    print(f"正在加载 YOLOv8n 模型 ({backend})... 目标ID: {target_class_id}", flush=True)
     try:
-        model = YOLO('yolov8n.pt')
+        model = load_model(backend)
     except Exception as e:
         print(f"模型加载失败: {e}")
+        with tracking_state["lock"]:
+            tracking_state["error"] = f"模型加载失败: {e}"
         return
 
     print("正在打开摄像头...", flush=True)
@@ -55,130 +1000,517 @@ def tracker_thread(target_class_id):
     cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
     cap.set(3, FRAME_WIDTH)
     cap.set(4, FRAME_HEIGHT)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # 驱动只缓存 1 帧，采集线程负责丢弃旧帧
     
-    INFERENCE_SIZE = 320 
-    last_cmd_time = 0
-    CMD_INTERVAL = 0.2 
+    last_report_time = time.time()
 
     if not cap.isOpened():
         print("!!! 摄像头打开失败 !!!")
+        with tracking_state["lock"]:
+            tracking_state["error"] = "摄像头打开失败"
         return
+    passthrough = stream_mode == 'passthrough' and enable_passthrough(cap)
 
-    print(f"=== 视觉跟踪线程已启动 (ID: {target_class_id}) ===", flush=True)
+    recorder = FrameLogWriter(record_path) if record_path else None
+
+    def send(cmd, trace=None):
+        send_cmd(cmd, trace)
+        if recorder:
+            recorder.add_command(time.time(), cmd)
+
+    timer = MetricsStageTimer()
+    pipeline = TrackerPipeline(model, target_class_id, send, detect_interval, control_mode, timer, selection)
+
+    def decode(raw):
+        """直通模式下把原始 JPEG 解码成 BGR 供推理使用"""
+        if not passthrough:
+            return raw
+        start = time.perf_counter()
+        frame = cv2.imdecode(raw, cv2.IMREAD_COLOR)
+        timer.add("decode", start)
+        return frame
+
+    frame_grabber = FrameGrabber(cap)
+    frame_grabber.start()
+    last_seq = 0
+    stopped = True  # 暂停时只发一次 S
+    status = {"time": time.time(), "frames": 0}
+    ring = None
+
+    def report_status(now, paused):
+        """每秒把跟踪帧率上报给 car_server (UDP STAT)"""
+        elapsed = now - status["time"]
+        if elapsed < STATUS_REPORT_INTERVAL:
+            return
+        car_link.report("vision", timeout=0.01, fps=f"{status['frames'] / elapsed:.1f}",
+                        target=pipeline.target_class_id, paused=int(paused))
+        status["time"] = now
+        status["frames"] = 0
 
     try:
-        while True:
-            # 1. 读帧
+        # 用第一帧预热模型 (首次推理最慢)，完成后才报告就绪
+        grabbed = None
+        while grabbed is None:
+            grabbed = frame_grabber.read(last_seq)
+        last_seq = grabbed[0]
+        if passthrough and not is_jpeg_buffer(grabbed[1]):
+            # 试读时是 JPEG，开始采集后却变了：停下采集线程再恢复解码输出，丢掉这帧
+            print("!!! 摄像头没有返回原始 JPEG，改为绘图后重新编码的推流方式", flush=True)
+            passthrough = False
+            frame_grabber.stop()
+            cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+            frame_grabber.start()
+            grabbed = None
+            while grabbed is None or grabbed[1].ndim != 3:
+                grabbed = frame_grabber.read(last_seq)
+                if grabbed is not None:
+                    last_seq = grabbed[0]
+        broadcaster.mode = 'passthrough' if passthrough else 'draw'
+        first_frame = decode(grabbed[1])
+        pipeline.perceive(first_frame)
+        pipeline.reset()
+        if frame_ring:
+            height, width, channels = first_frame.shape
             try:
-                success, frame = cap.read()
-                if not success:
-                    time.sleep(0.01)
-                    continue
-            except Exception:
-                time.sleep(0.01)
+                ring = FrameRingWriter(width=width, height=height, channels=channels)
+                print(f"共享内存帧环: /dev/shm/{ring.name} ({width}x{height}, {ring.slots} 槽)", flush=True)
+            except OSError as e:
+                print(f"!!! 无法创建共享内存帧环: {e}", flush=True)
+        with tracking_state["lock"]:
+            tracking_state["ready"] = True
+        print(f"=== 视觉跟踪线程已启动 (ID: {target_class_id}) ===", flush=True)
+
+        while True:
+            # 1. 取最新帧 (由采集线程持续读取)
+            grabbed = frame_grabber.read(last_seq)
+            if grabbed is None:
                 continue
+            last_seq, raw, frame_time = grabbed
 
-            # 2. YOLO 推理
-            # 降低置信度可以更容易发现目标
-            results = model(frame, imgsz=INFERENCE_SIZE, stream=True, conf=0.4, verbose=False)
+            with tracking_state["lock"]:
+                target_class_id = tracking_state["target_class_id"]
+                paused = tracking_state["paused"]
+                switch_requested = tracking_state["switch_requested"]
+                tracking_state["switch_requested"] = None
+            if target_class_id != pipeline.target_class_id:
+                pipeline.set_target(target_class_id)
+                print(f">> 切换跟踪目标 -> {target_class_id}", flush=True)
 
-            target_box = None
-            max_area = 0
-            
-            # 3. 解析结果并绘图
-            for result in results:
-                boxes = result.boxes
-                for box in boxes:
-                    cls_id = int(box.cls[0])
-                    x1, y1, x2, y2 = map(int, box.xyxy[0]) # 转为整数坐标
-                    
-                    # --- 绘图逻辑 ---
-                    # 无论是不是目标，都画个细框表示看见了
-                    # 颜色格式: (B, G, R)
-                    if cls_id == target_class_id:
-                        # 目标物体：画粗绿色框
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 4)
-                        cv2.putText(frame, f"TARGET {cls_id}", (x1, y1 - 10), 
-                                   cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-                        
-                        # 记录最大目标用于控制
-                        area = (x2 - x1) * (y2 - y1)
-                        if area > max_area:
-                            max_area = area
-                            target_box = (x1, y1, x2, y2)
+            if paused:
+                # 暂停：不推理，只停车一次；画面照常发布
+                if not stopped:
+                    send('S')
+                    pipeline.reset()
+                    stopped = True
+                if broadcaster.wants_frame():
+                    if passthrough:
+                        broadcaster.publish_jpeg(raw.tobytes())
                     else:
-                        # 非目标物体：画细红色框
-                        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 1)
+                        broadcaster.publish(raw)
+                if passthrough and overlay_channel.wanted():
+                    overlay_channel.publish(pipeline.overlay(last_seq, frame_time, paused=True))
+                if ring is not None and ring.has_readers():
+                    paused_frame = decode(raw)
+                    if paused_frame is not None:
+                        pipeline.write_ring(ring, paused_frame, frame_time, paused=True)
+                report_status(time.time(), True)
+                continue
+            stopped = False
 
-            # 4. 更新全局画面 (供网页直播)
-            with lock:
-                output_frame = frame.copy()
+            frame = decode(raw)
+            if frame is None:
+                continue
+            # 录制的是绘图之前的原始画面 (直通模式下直接写摄像头的 JPEG)
+            if recorder:
+                if passthrough:
+                    recorder.add_frame_jpeg(frame_time, raw.tobytes())
+                else:
+                    recorder.add_frame(frame_time, frame)
 
-            # 5. 控制逻辑 
+            # 2. 检测 / 光流推算，并发出控制指令
             current_time = time.time()
-            if current_time - last_cmd_time > CMD_INTERVAL:
-                if target_box:
-                    x1, y1, x2, y2 = target_box
-                    box_center_x = (x1 + x2) / 2
-                    box_height = y2 - y1
-                    
-                    if box_center_x < (CENTER_X - TOLERANCE):
-                        send_cmd('L')
-                    elif box_center_x > (CENTER_X + TOLERANCE):
-                        send_cmd('R')
-                    else:
-                        height_ratio = box_height / FRAME_HEIGHT
-                        if height_ratio > MAX_HEIGHT_RATIO:
-                            send_cmd('S')
-                        elif height_ratio < MIN_HEIGHT_RATIO:
-                            send_cmd('F')
-                        else:
-                            send_cmd('S')
-                else:
-                    send_cmd('S')
-                last_cmd_time = current_time
+            pipeline.process(frame, frame_time, current_time)
+            status["frames"] += 1
+            report_status(current_time, False)
+            # 绘图之前写入，读者拿到的是原始画面
+            if ring is not None and ring.has_readers(current_time):
+                pipeline.write_ring(ring, frame, frame_time)
+            if switch_requested is not None:
+                with tracking_state["lock"]:
+                    tracking_state["last_switch_ms"] = round((time.time() - switch_requested) * 1000, 1)
+
+            # 3. 发布画面 (供网页直播)
+            # 直通模式转发原始 JPEG，检测框单独推送给网页绘制；
+            # 否则绘图后交给广播器编码。没人观看或未到推流间隔时跳过
+            if passthrough:
+                if broadcaster.wants_frame():
+                    broadcaster.publish_jpeg(raw.tobytes(), frame)
+                if overlay_channel.wanted():
+                    overlay_channel.publish(pipeline.overlay(last_seq, frame_time))
+            elif broadcaster.wants_frame():
+                pipeline.draw(frame)
+                broadcaster.publish(frame)
+
+            if current_time - last_report_time > LINK_REPORT_INTERVAL:
+                print(car_link.summary(), flush=True)
+                grab = frame_grabber.stats()
+                print(f"采集: {grab['captured']} 帧, 推理 {grab['consumed']} 帧, 丢弃旧帧 {grab['dropped']}, "
+                      f"采集->指令 {pipeline.cmd_latency_ms:.0f}ms", flush=True)
+                print(pipeline.summary(), flush=True)
+                last_report_time = current_time
 
     except Exception as e:
         print(f"跟踪线程出错: {e}")
     finally:
+        frame_grabber.stop()
         cap.release()
         send_cmd('S')
+        if recorder:
+            recorder.close()
+        if ring is not None:
+            ring.close()
+
+# ================= 离线回放 =================
+def iter_replay_frames(path, timer):
+    """从帧日志或普通视频文件逐帧读取，返回 (帧序号, 时间戳, BGR 画面)"""
+    if is_frame_log(path):
+        reader = FrameLogReader(path)
+        try:
+            for seq, timestamp, jpeg in reader.frames():
+                start = time.perf_counter()
+                frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                timer.add("decode", start)
+                del jpeg  # 释放对映射内存的引用，之后才能关闭文件
+                if frame is not None:
+                    yield seq, timestamp, frame
+        finally:
+            reader.close()
+        return
+
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    index = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            success, frame = cap.read()
+            if not success:
+                break
+            timer.add("decode", start)
+            # 视频文件没有采集时间，按帧率推算，保证每次回放一致
+            yield index, index / fps, frame
+            index += 1
+    finally:
+        cap.release()
+
+def run_replay(path, target_class_id, backend, detect_interval, control_mode, render=True,
+               selection=TARGET_SELECTION):
+    """
+    把帧日志或视频文件按同样的流程离线跑一遍：指令只记录不发送。
+    输出每个阶段的耗时、整体 FPS 和指令序列，便于对比改动前后的性能与行为。
+    """
+    if detect_interval <= 0:
+        # 自动间隔依赖实测推理耗时，回放时固定下来才能逐帧复现
+        detect_interval = 1
+        print("回放使用固定检测间隔 N=1 (可用 --detect-interval 指定)")
+
+    model = load_model(backend)
+    timer = StageTimer()
+    commands = []   # [(帧序号, 指令)]
+    current = {"seq": 0}
+    pipeline = TrackerPipeline(model, target_class_id,
+                               lambda cmd, trace=None: commands.append((current["seq"], cmd)),
+                               detect_interval, control_mode, timer, selection)
+
+    frames = 0
+    start_wall = time.perf_counter()
+    for seq, frame_time, frame in iter_replay_frames(path, timer):
+        current["seq"] = seq
+        # 用帧时间代替系统时间，发送间隔等逻辑与录制时一致
+        pipeline.process(frame, frame_time, frame_time)
+        if render:
+            pipeline.draw(frame)
+            start = time.perf_counter()
+            cv2.imencode(".jpg", frame)
+            timer.add("encode", start)
+        frames += 1
+    elapsed = time.perf_counter() - start_wall
+
+    if not frames:
+        print(f"!!! 无法从 {path} 读取画面")
+        return
+
+    print(f"回放: {path}, 后端 {backend}, {frames} 帧, 用时 {elapsed:.2f}s, {frames / elapsed:.1f} FPS")
+    timer.report()
+    print(pipeline.summary())
+
+    digest = hashlib.sha1("\n".join(f"{seq} {cmd}" for seq, cmd in commands).encode()).hexdigest()[:12]
+    print(f"指令: {len(commands)} 条, 序列摘要 {digest}")
+    for seq, cmd in commands[:REPLAY_PRINT_COMMANDS]:
+        print(f"  帧 {seq:>5}: {cmd}")
+    if len(commands) > REPLAY_PRINT_COMMANDS:
+        print(f"  ... 其余 {len(commands) - REPLAY_PRINT_COMMANDS} 条省略")
+
+    if is_frame_log(path):
+        reader = FrameLogReader(path)
+        recorded = [(seq, cmd) for seq, _, cmd in reader.commands()]
+        reader.close()
+        same = sum(1 for a, b in zip(commands, recorded) if a == b)
+        print(f"与录制时的指令对比: 录制 {len(recorded)} 条, 回放 {len(commands)} 条, "
+              f"逐条一致 {same} 条")
 
 # ================= Flask 视频流部分 =================
 
-def generate():
-    """视频流生成器"""
-    global output_frame, lock
-    while True:
-        with lock:
-            if output_frame is None:
+def stream_profile_levels(args):
+    """
+    解析 /video_feed 的查询参数，返回档位列表 [(名称, (宽度, 质量, 帧率))]：
+    ?profile=<名称> 选择预设档位，?width= ?quality= ?fps= 覆盖其中的单项；
+    ?adaptive=1 时列表后面接上更低的档位，供拥塞时逐级下降。参数错误抛出 ValueError。
+    """
+    name = args.get("profile", DEFAULT_STREAM_PROFILE)
+    if name not in STREAM_PROFILES:
+        raise ValueError(f"unknown profile {name!r}, choose from {', '.join(STREAM_PROFILES)}")
+    width, quality, fps = STREAM_PROFILES[name]
+    overrides = {key: args.get(key, type=int) for key in ("width", "quality", "fps")}
+    if any(value is not None for value in overrides.values()):
+        name = "custom"
+        if overrides["width"] is not None:
+            if not MIN_STREAM_WIDTH <= overrides["width"] <= FRAME_WIDTH:
+                raise ValueError(f"width must be {MIN_STREAM_WIDTH}..{FRAME_WIDTH}")
+            width = overrides["width"]
+        if overrides["quality"] is not None:
+            if not 10 <= overrides["quality"] <= 95:
+                raise ValueError("quality must be 10..95")
+            quality = overrides["quality"]
+        if overrides["fps"] is not None:
+            if overrides["fps"] < 0:
+                raise ValueError("fps must be >= 0")
+            fps = overrides["fps"]
+    levels = [(name, (width, quality, fps))]
+
+    if args.get("adaptive", 0, type=int):
+        # 只接比请求档位更小的预设档位
+        requested_width = width or FRAME_WIDTH
+        start = STREAM_PROFILE_LADDER.index(name) + 1 if name in STREAM_PROFILE_LADDER else 0
+        levels += [(lower, STREAM_PROFILES[lower]) for lower in STREAM_PROFILE_LADDER[start:]
+                   if (STREAM_PROFILES[lower][0] or FRAME_WIDTH) <= requested_width
+                   and STREAM_PROFILES[lower] != levels[0][1]]
+    return levels
+
+class AdaptiveProfile:
+    """
+    推流档位控制：写出一帧的耗时 (客户端网速跟不上时，套接字发送缓冲区满了写入就会阻塞)
+    连续超过帧间隔的一定比例时降一档；连续通畅一段时间后升一档，最高回到请求的档位。
+    只有一个档位 (非自适应) 时档位不变。
+    """
+    def __init__(self, levels):
+        self.levels = levels
+        self.index = 0
+        self.slow_frames = 0
+        self.fast_since = time.time()
+
+    @property
+    def current(self):
+        return self.levels[self.index]
+
+    def update(self, write_s, interval_s, now):
+        """根据这一帧的写出耗时调整档位，档位改变时返回 True"""
+        if write_s > ADAPT_SLOW_RATIO * interval_s:
+            self.slow_frames += 1
+            self.fast_since = now
+            if self.slow_frames >= ADAPT_DOWN_AFTER and self.index < len(self.levels) - 1:
+                self.index += 1
+                self.slow_frames = 0
+                return True
+        else:
+            self.slow_frames = 0
+            if self.index > 0 and now - self.fast_since >= ADAPT_UP_AFTER:
+                self.index -= 1
+                self.fast_since = now
+                return True
+        return False
+
+def generate(profile):
+    """视频流生成器：只在有新帧时发送，同一档位的编码结果与其他客户端共享"""
+    name = profile.current[0]
+    client_id = broadcaster.subscribe(name)
+    last_seq = 0
+    last_sent = 0.0
+    try:
+        while True:
+            seq = broadcaster.wait_frame(last_seq)
+            if seq is None:
                 continue
-            # 将图片编码为 jpg
-            (flag, encodedImage) = cv2.imencode(".jpg", output_frame)
-            if not flag:
+            name, (width, quality, fps) = profile.current
+            now = time.time()
+            # 留 10% 余量，避免帧间隔抖动时多跳过一帧
+            if fps > 0 and now - last_sent < 0.9 / fps:
+                # 这一档的帧率上限还没到，跳过这一帧 (不编码)
+                last_seq = seq
                 continue
-        
-        # 转换为字节流
-        yield(b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + 
-              bytearray(encodedImage) + b'\r\n')
+            seq, jpeg = broadcaster.get_jpeg(width, quality)
+            # 编码失败也要记下序号，否则 wait_frame 立即返回同一帧，空转占满 CPU
+            last_seq = seq
+            if jpeg is None:
+                continue
+            interval = now - last_sent if last_sent else None  # 第一帧没有间隔，不参与调整
+            last_sent = now
+
+            # 生成器在 yield 处挂起，直到服务器把这一块写进套接字
+            start = time.perf_counter()
+            yield(b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + 
+                  jpeg + b'\r\n')
+            write_s = time.perf_counter() - start
+            broadcaster.record_sent(client_id, len(jpeg), write_s, name)
+            if interval is not None and profile.update(write_s, interval, time.time()):
+                print(f"视频流客户端 {client_id} 切换到档位 {profile.current[0]}", flush=True)
+    finally:
+        # 客户端断开时 Flask 会关闭生成器
+        broadcaster.unsubscribe(client_id)
 
 @app.route("/video_feed")
 def video_feed():
-    """前端 <img> 标签会访问这个地址"""
-    return Response(generate(),
+    """
+    前端 <img> 标签会访问这个地址。
+    ?profile=full|high|medium|low|tiny 选择档位，?width= ?quality= ?fps= 自定义，?adaptive=1 拥塞时自动降档
+    """
+    try:
+        levels = stream_profile_levels(request.args)
+    except ValueError as e:
+        return json.dumps({"error": str(e)}), 400
+    sock = request.environ.get("werkzeug.socket")
+    if len(levels) > 1 and sock is not None:
+        # 缩小发送缓冲区，拥塞能尽快体现为写入阻塞
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, ADAPT_SEND_BUFFER)
+    return Response(generate(AdaptiveProfile(levels)),
                     mimetype = "multipart/x-mixed-replace; boundary=frame")
 
+def overlay_events():
+    """检测框推送流 (SSE)：每处理完一帧推送一条，空闲时发心跳注释"""
+    overlay_channel.subscribe()
+    last_seq = 0
+    try:
+        while True:
+            seq, payload = overlay_channel.wait(last_seq)
+            if payload is None:
+                yield ": keepalive\n\n"
+                continue
+            last_seq = seq
+            yield f"data: {payload}\n\n"
+    finally:
+        overlay_channel.unsubscribe()
+
+@app.route("/overlay_stream")
+def overlay_stream():
+    """网页 (car_server 的 5000 端口) 跨端口订阅，需要允许跨域"""
+    return Response(overlay_events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "Access-Control-Allow-Origin": "*"})
+
+@app.route("/stream_stats")
+def stream_stats():
+    """编码耗时、每个客户端的实际 FPS 以及采集线程的帧计数"""
+    stats = broadcaster.stats()
+    if frame_grabber is not None:
+        stats["capture"] = frame_grabber.stats()
+    return json.dumps(stats)
+
+for _name, _help, _fn, _kind in [
+    ("vision_frames_captured_total", "Frames read from the camera",
+     lambda: frame_grabber and frame_grabber.stats()["captured"], "counter"),
+    ("vision_frames_dropped_total", "Frames overwritten before processing",
+     lambda: frame_grabber and frame_grabber.stats()["dropped"], "counter"),
+    ("vision_stream_clients", "Connected MJPEG clients", lambda: len(broadcaster.stats()["clients"]), "gauge"),
+]:
+    metrics.callback(_name, _help, _fn, _kind)
+
+@app.route("/control/status")
+def control_status():
+    """就绪状态、当前目标与是否暂停"""
+    return json.dumps(get_tracking_status())
+
+@app.route("/control/target", methods=["GET", "POST"])
+def control_target():
+    """切换跟踪目标 ?class_id=<ID>，默认同时恢复跟踪 (resume=0 保持暂停状态)"""
+    class_id = request.values.get("class_id", type=int)
+    if class_id is None:
+        return json.dumps({"error": "class_id required"}), 400
+    resume = request.values.get("resume", 1, type=int)
+    set_tracking(class_id, paused=False if resume else None)
+    return json.dumps(get_tracking_status())
+
+@app.route("/control/pause", methods=["GET", "POST"])
+def control_pause():
+    set_tracking(paused=True)
+    return json.dumps(get_tracking_status())
+
+@app.route("/control/resume", methods=["GET", "POST"])
+def control_resume():
+    set_tracking(paused=False)
+    return json.dumps(get_tracking_status())
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype=PROMETHEUS_CONTENT_TYPE)
+
 def main():
     # 解析参数
-    target_class_id = DEFAULT_CLASS_ID
-    if len(sys.argv) > 1:
-        try:
-            target_class_id = int(sys.argv[1])
-        except ValueError:
-            pass
+    parser = argparse.ArgumentParser(description="YOLOv8 视觉跟踪 + MJPEG 视频流")
+    parser.add_argument("class_id", nargs="?", default=str(DEFAULT_CLASS_ID),
+                        help="跟踪目标的 COCO 类别 ID")
+    parser.add_argument("--backend", choices=list(BACKENDS),
+                        help=f"推理后端 (默认 {DEFAULT_BACKEND})")
+    parser.add_argument("--benchmark", metavar="IMAGE_DIR",
+                        help="在图片目录上测试各推理后端的速度后退出")
+    parser.add_argument("--bench-postprocess", action="store_true",
+                        help="在合成检测结果上测试后处理耗时后退出")
+    parser.add_argument("--control", choices=["pid", "bang"], default=CONTROL_MODE,
+                        help="bang: 旧的 L/R/F/S 指令 (默认，兼容旧固件); pid: 比例速度指令 (需要新版固件)")
+    parser.add_argument("--selection", choices=["track", "largest"], default=TARGET_SELECTION,
+                        help="track: 多目标跟踪，锁定一个目标直到丢失; largest: 每帧取面积最大的目标")
+    parser.add_argument("--stream-fps", type=float, default=STREAM_MAX_FPS,
+                        help="视频流帧率上限，与推理帧率无关 (0=不限制)")
+    parser.add_argument("--stream-mode", choices=["passthrough", "draw"], default=STREAM_MODE,
+                        help="passthrough: 转发摄像头原始 JPEG，检测框由网页绘制; draw: 画框后重新编码")
+    parser.add_argument("--detect-interval", type=int, default=DETECT_INTERVAL, metavar="N",
+                        help="每 N 帧跑一次 YOLO，其余帧用光流推算 (0=按推理耗时自动调整，1=每帧检测)")
+    parser.add_argument("--paused", action="store_true",
+                        help="启动后先不跟踪，等待 /control/target 或 /control/resume (常驻模式)")
+    parser.add_argument("--no-frame-ring", action="store_true",
+                        help="不把画面写进共享内存帧环 (默认有其他进程读取时才写)")
+    parser.add_argument("--record", metavar="PATH",
+                        help="把原始画面与发出的指令录制到帧日志")
+    parser.add_argument("--replay", metavar="PATH",
+                        help="离线回放帧日志或视频文件，输出各阶段耗时与指令序列后退出")
+    parser.add_argument("--no-render", action="store_true",
+                        help="回放时跳过绘图与 JPEG 编码 (模拟没人观看)")
+    args = parser.parse_args()
+
+    if args.bench_postprocess:
+        bench_postprocess()
+        return
+
+    if args.benchmark:
+        # 未指定 --backend 时测试全部后端
+        run_benchmark(args.benchmark, [args.backend] if args.backend else list(BACKENDS))
+        return
+
+    try:
+        target_class_id = int(args.class_id)
+    except ValueError:
+        target_class_id = DEFAULT_CLASS_ID
+    backend = args.backend or DEFAULT_BACKEND
+    broadcaster.max_fps = args.stream_fps
+
+    if args.replay:
+        run_replay(args.replay, target_class_id, backend, args.detect_interval, args.control,
+                   render=not args.no_render, selection=args.selection)
+        return
             
     # 1. 启动视觉跟踪线程 (Daemon=True 主程序退出也被杀死)
-    t = threading.Thread(target=tracker_thread, args=(target_class_id,))
+    set_tracking(target_class_id, paused=args.paused)
+    t = threading.Thread(target=tracker_thread,
+                         args=(backend, args.detect_interval, args.control, args.record, args.stream_mode,
+                               not args.no_frame_ring, args.selection))
     t.daemon = True
     t.start()
     
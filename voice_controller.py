@@ -1,16 +1,27 @@
 #!/usr/bin/env python
 # coding: utf-8
-import azure.cognitiveservices.speech as speechsdk
-import openai
 import asyncio
-import requests
+import argparse
 import os
 import time
+import json
 import subprocess
+import urllib.request
+import urllib.error
+from car_link import AsyncCarLink
+from tracing import Trace
+from voice_intents import match_intent, ReplyCache
 
 # ================= 配置区域 =================
-# 1. Flask 小车服务器地址 (本地)
-CAR_SERVER_URL = "http://127.0.0.1:5000/move"
+# 1. 小车指令通道 (car_server 的本地 UDP 端口，见 car_link.py)
+CMD_TIMEOUT = 0.5
+LOG_TIMEOUT = 0.1
+
+# 视觉常驻进程 (vision_tracker.py --paused) 的控制接口
+VISION_URL = "http://127.0.0.1:5001"
+VISION_HTTP_TIMEOUT = 1.0
+VISION_START_TIMEOUT = 60.0  # 首次启动要加载 torch 与模型
+BARGE_IN_DEBOUNCE = 2.0      # 中间结果已经触发过打断时，这段时间内的“停”不再重复处理 (s)
 
 # 2. Azure 语音服务配置
 AZURE_SPEECH_KEY = ""
@@ -24,8 +35,8 @@ MODEL_NAME = "deepseek-chat" # 或 deepseek-chat
 
 # ===========================================
 
-# 初始化 OpenAI 客户端
-client = openai.AsyncClient(api_key=OPENAI_API_KEY, base_url=OPENAI_API_BASE)
+# LLM 客户端 (openai.AsyncClient，--stub 时为 voice_stubs.StubLLMClient)，在 main() 中创建
+client = None
 
 # 定义系统提示词
 SYSTEM_PROMPT = {
@@ -70,65 +81,252 @@ SYSTEM_PROMPT = {
 }   
 
 conversation_history = [SYSTEM_PROMPT]
-vision_process = None # 全局变量记录视觉进程
+reply_cache = ReplyCache()  # 重复语句直接复用 LLM 回复，并统计本地意图 / 缓存命中率
+voice_latency = {"start": None, "first_audio": None}  # 当前这句话的计时 (TTS 回调线程里更新)
+vision_process = None # 全局变量记录视觉常驻进程
+car_link = AsyncCarLink()  # 与 vision_tracker 共用的指令通道 (asyncio 版本)
+background_tasks = set()   # 后台任务的引用，防止被回收
+motion_state = {"stop_task": None}  # 定时停车任务，新的运动指令或打断时取消
+turn_state = {
+    "task": None,          # 正在进行的这轮对话 (本地意图或 LLM)
+    "speaking": False,     # 正在朗读 (期间识别到的非停车语句多半是回声，忽略)
+    "barge_in_time": 0.0,  # 最近一次打断的时间
+}
+
+def spawn(coro):
+    """在后台运行协程 (保存引用，防止任务被回收)"""
+    task = asyncio.get_running_loop().create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
 
 def remote_log(text, prefix="[AI]"):
-    """把日志发送到 Flask 网页终端"""
+    """把日志发送到 Flask 网页终端 (后台发送，不等待应答)"""
+    # 发送失败只计入 car_link.stats，不影响主程序
+    spawn(car_link.log(f"{prefix} {text}", timeout=LOG_TIMEOUT))
+
+def vision_request(path, timeout=VISION_HTTP_TIMEOUT):
+    """调用视觉进程的控制接口，返回状态字典，失败返回 None"""
     try:
-        # URL 编码并发送
-        requests.get(f"http://127.0.0.1:5000/api/log_message", params={"msg": f"{prefix} {text}"}, timeout=0.1)
-    except:
-        pass # 发送失败不影响主程序
+        with urllib.request.urlopen(VISION_URL + path, timeout=timeout) as response:
+            return json.loads(response.read())
+    except (OSError, ValueError):
+        return None
 
-def manage_vision(action, class_id=0):
-    """启动或关闭视觉脚本 (修复版)"""
+def start_vision_daemon():
+    """启动视觉常驻进程 (暂停状态)，摄像头与模型加载后一直保持"""
+    global vision_process
+    if vision_process and vision_process.poll() is None:
+        return
+    print(">> 启动视觉常驻进程 (后台加载模型)...")
+    try:
+        vision_process = subprocess.Popen(
+            ["libcamerify", "python3", "vision_tracker.py", "--paused"],
+            stdout=None, # 让输出直接打印到控制台
+            stderr=None
+        )
+    except Exception as e:
+        print(f"!!! 启动视觉脚本失败: {e}")
+        vision_process = None
+
+def stop_vision_daemon():
+    """程序退出时关闭视觉进程"""
     global vision_process
-    
-    # 1. 先彻底清理旧进程
     if vision_process:
-        print(">> 正在停止旧的视觉任务...", end="", flush=True)
         vision_process.terminate() # 发送 SIGTERM 信号
-        
         # 等待进程真正结束，防止僵尸进程
         try:
-            vision_process.wait(timeout=3) 
+            vision_process.wait(timeout=3)
         except subprocess.TimeoutExpired:
             vision_process.kill() # 如果卡住，强制杀掉
-            
         vision_process = None
-        print(" [已停止]")
-        
-        # 等待 3 秒，让摄像头和端口释放
-        print(">> 等待资源释放 (3s)...")
-        time.sleep(3.0) 
-        
-    # 2. 启动新任务
+
+async def manage_vision(action, class_id=0):
+    """切换跟踪目标或暂停跟踪 (视觉进程常驻，不再重启)"""
     if action == "START":
-        print(f">> 启动新视觉跟踪，目标 ID: {class_id}")
-        try:
-            vision_process = subprocess.Popen(
-                ["libcamerify", "python3", "vision_tracker.py", str(class_id)],
-                stdout=None, # 让输出直接打印到控制台
-                stderr=None
-            )
-            
-            # 稍微等一下，让 Flask 有时间启动
-            time.sleep(2.0) 
-            print(">> 视觉进程已加载")
-            
-        except Exception as e:
-            print(f"!!! 启动视觉脚本失败: {e}")
+        start_vision_daemon()  # 进程意外退出时重新拉起
+        path = f"/control/target?class_id={int(class_id)}"
+    else:
+        path = "/control/pause"
+
+    # 进程刚启动时 HTTP 服务还没起来，重试到超时为止 (HTTP 请求放到线程里，不阻塞事件循环)
+    deadline = time.time() + VISION_START_TIMEOUT
+    while True:
+        status = await asyncio.to_thread(vision_request, path)
+        if status is not None or vision_process is None or vision_process.poll() is not None:
+            break
+        if action != "START" or time.time() > deadline:
+            break
+        await asyncio.sleep(0.2)
+
+    if status is None:
+        print(f"!!! 视觉进程无响应: {path}")
+    elif action == "START":
+        state = "就绪" if status.get("ready") else "加载中，就绪后开始跟踪"
+        print(f">> 跟踪目标 ID: {class_id} ({state})")
+    else:
+        print(">> 已暂停视觉跟踪")
+
+async def control_car(cmd_code, trace=None):
+    """发送指令给小车服务器 (trace 记录从识别出语音开始的各跳耗时，见 tracing.py)"""
+    print(f">> 发送控制指令: {cmd_code}")
+    if await car_link.send(cmd_code, timeout=CMD_TIMEOUT, trace=trace) is None:
+        print(f"小车连接失败: 指令 {cmd_code} 无应答 ({car_link.summary()})")
+
+async def stop_after(delay):
+    await asyncio.sleep(delay)
+    motion_state["stop_task"] = None
+    await control_car('S')
 
-def control_car(cmd_code):
-    """发送指令给 Flask 服务器"""
+def cancel_timed_stop():
+    task = motion_state["stop_task"]
+    if task is not None:
+        task.cancel()
+        motion_state["stop_task"] = None
+
+# ================= 流式回复解析 =================
+SENTENCE_ENDS = "。！？!?；;\n"
+MOTION_CODES = "FBLRSQE"
+TIMED_MOTIONS = "FBLR"   # 这些动作执行 MOVE_DURATION 秒后自动停车
+MOVE_DURATION = 1.0
+
+class ReplyStreamParser:
+    """
+    逐块解析 LLM 的流式回复：
+      - 遇到句末标点就切出一句，交给 TTS 朗读
+      - "||" 之后是控制暗号，一旦能确定完整就立即返回，不等回复结束
+    运动指令是单个字母，看到就算完整；TRACK:<ID> 要等到 ID 后面出现非数字字符或回复结束。
+    """
+    def __init__(self):
+        self.speech = ""       # 还没切出的朗读文本
+        self.code = None       # "||" 之后的文本，None 表示还没遇到 "||"
+        self.dispatched = False
+
+    def feed(self, text):
+        """输入一段增量文本，返回 (完整的句子列表, 新识别出的控制暗号或 None)"""
+        if self.code is not None:
+            self.code += text
+            return [], self._take_code(final=False)
+        self.speech += text
+        if "||" in self.speech:
+            # "||" 之前的文本已经完整，全部交给 TTS
+            self.speech, _, self.code = self.speech.partition("||")
+            sentences, rest = self._split_sentences(), self.speech.strip()
+            self.speech = ""
+            return sentences + ([rest] if rest else []), self._take_code(final=False)
+        # 结尾的 "|" 可能是被切开的 "||"，留到下一块再判断
+        return self._split_sentences(keep_tail=1 if self.speech.endswith("|") else 0), None
+
+    def finish(self):
+        """回复结束：返回剩余的朗读文本与 (若还没发出) 控制暗号"""
+        rest = self.speech.strip()
+        self.speech = ""
+        return ([rest] if rest else []), self._take_code(final=True)
+
+    def _split_sentences(self, keep_tail=0):
+        sentences = []
+        start = 0
+        limit = len(self.speech) - keep_tail
+        for i, ch in enumerate(self.speech[:limit]):
+            if ch in SENTENCE_ENDS:
+                sentence = self.speech[start:i + 1].strip()
+                if sentence:
+                    sentences.append(sentence)
+                start = i + 1
+        self.speech = self.speech[start:]
+        return sentences
+
+    def _take_code(self, final):
+        if self.dispatched or self.code is None:
+            return None
+        code = self.code.strip().upper()
+        if not code:
+            return None
+        if code[0] in MOTION_CODES:
+            command = code[0]
+        elif code.startswith("TRACK:"):
+            value = code[len("TRACK:"):]
+            if value.startswith("STOP"):
+                command = "TRACK:STOP"
+            else:
+                digits = len(value) - len(value.lstrip("0123456789"))
+                # 数字后面还可能有数字，直到出现别的字符或回复结束
+                if not digits or (digits == len(value) and not final):
+                    return None if not final else self._give_up(code)
+                command = "TRACK:" + value[:digits]
+        elif "TRACK:".startswith(code) and not final:
+            return None  # "T" / "TRA" ... 等待后续文本
+        else:
+            return self._give_up(code)
+        self.dispatched = True
+        return command
+
+    def _give_up(self, code):
+        self.dispatched = True
+        print(f"无法识别的控制暗号: {code}")
+        return None
+
+async def dispatch_command(command, trace=None):
+    """执行控制暗号：跟踪指令交给视觉进程，运动指令发给小车"""
+    if command.startswith("TRACK:"):
+        track_val = command.split(":")[1]
+        if track_val == "STOP":
+            await manage_vision("STOP")
+        else:
+            await manage_vision("START", int(track_val))
+        return
+    # 新的运动指令取代之前的定时停车
+    cancel_timed_stop()
+    await control_car(command, trace)
+    if command in TIMED_MOTIONS:
+        # 不阻塞对话：到时间后由后台任务发出停车指令
+        motion_state["stop_task"] = spawn(stop_after(MOVE_DURATION))
+
+def say(synthesizer, text):
+    """提交一句朗读 (合成请求按提交顺序依次播放)，返回 SDK 的 future"""
+    turn_state["speaking"] = True
+    return synthesizer.speak_text_async(text)
+
+async def wait_speech(futures):
+    """等待朗读结束 (在线程里等 SDK 的 future，不占用事件循环)"""
     try:
-        print(f">> 发送控制指令: {cmd_code}")
-        requests.get(f"{CAR_SERVER_URL}?cmd={cmd_code}", timeout=0.5)
+        for future in futures:
+            await asyncio.to_thread(future.get)
+    finally:
+        turn_state["speaking"] = False
+
+async def handle_locally(text, synthesizer, trace=None):
+    """简单指令在本地识别后立即执行，不经过 LLM；返回是否已处理"""
+    global conversation_history
+    intent = match_intent(text)
+    if intent is None:
+        return False
+    reply_cache.stats["intents"] += 1
+    voice_latency.update(start=trace.origin if trace is not None else time.time(), first_audio=None)
+    if trace is not None:
+        trace.mark("intent")
+    # 先执行指令再朗读，停车不等任何网络请求
+    try:
+        await dispatch_command(intent.command, trace)
     except Exception as e:
-        print(f"小车连接失败: {e}")
+        print(f"指令执行出错 {intent.command}: {e}")
+    if trace is not None:
+        print(f"[延迟] 本地意图 {intent.command}: 识别 -> 指令发出 {(time.time() - trace.origin) * 1000:.0f}ms")
+
+    # 写入对话历史，LLM 后续仍然知道刚才做了什么
+    conversation_history.append({"role": "user", "content": text})
+    conversation_history.append({"role": "assistant", "content": f"{intent.reply}||{intent.command}"})
+    if len(conversation_history) > 10:
+        conversation_history = [SYSTEM_PROMPT] + conversation_history[-8:]
+    remote_log(text, prefix="[USER]")
+    remote_log(intent.reply, prefix="[AI]")
+
+    print(f"AI 回复 (本地): {intent.reply}")
+    await wait_speech([say(synthesizer, intent.reply)])
+    return True
 
-async def ask_ai_and_speak(text, synthesizer):
-    """发送文本给 AI，获取回复，分离指令，并朗读"""
+async def ask_ai_and_speak(text, synthesizer, trace=None):
+    """流式获取 AI 回复：每句话生成完就开始朗读，控制暗号一出现就立即执行"""
     global conversation_history
     conversation_history.append({"role": "user", "content": text})
     
@@ -136,65 +334,102 @@ async def ask_ai_and_speak(text, synthesizer):
     if len(conversation_history) > 10:
         conversation_history = [SYSTEM_PROMPT] + conversation_history[-8:]
 
+    # 延迟都从识别出文字开始计算
+    t0 = trace.origin if trace is not None else time.time()
+    voice_latency.update(start=t0, first_audio=None)
+    remote_log(text, prefix="[USER]")
+
     print("AI 思考中...")
-    try:
+    parser = ReplyStreamParser()
+    reply_parts = []
+    speech_futures = []
+    first_token = first_sentence = command_time = None
+
+    def speak(sentences):
+        nonlocal first_sentence
+        for sentence in sentences:
+            if first_sentence is None:
+                first_sentence = time.time()
+            print(f"AI 朗读: {sentence}")
+            speech_futures.append(say(synthesizer, sentence))
+
+    async def run(command):
+        nonlocal command_time
+        if command is None:
+            return
+        if trace is not None:
+            trace.mark("llm_reply")
+        command_time = time.time()
+        try:
+            await dispatch_command(command, trace)
+        except Exception as e:
+            print(f"指令执行出错 {command}: {e}")
+
+    cached = reply_cache.get(text)
+
+    async def reply_chunks():
+        if cached is not None:
+            # 命中缓存：整段回复当作一个数据块，走同样的解析流程
+            yield cached
+            return
         response = await client.chat.completions.create(
             model=MODEL_NAME,
-            messages=conversation_history
+            messages=conversation_history,
+            stream=True
         )
-        
-        full_reply = response.choices[0].message.content
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    try:
+        if cached is not None:
+            print("(命中回复缓存)")
+        async for delta in reply_chunks():
+            if first_token is None:
+                first_token = time.time()
+            reply_parts.append(delta)
+            sentences, command = parser.feed(delta)
+            speak(sentences)
+            await run(command)
+
+        sentences, command = parser.finish()
+        speak(sentences)
+        await run(command)
+
+        full_reply = "".join(reply_parts)
         conversation_history.append({"role": "assistant", "content": full_reply})
-        
-        # === 记录用户和 AI 的对话到网页终端 ===
-        remote_log(text, prefix="[USER]") 
-        remote_log(full_reply, prefix="[AI]") 
-        
-        # === 解析指令 ===
-        speak_text = full_reply
-        command = None
-        track_id = None
-        
-        if "||" in full_reply:
-            parts = full_reply.split("||")
-            speak_text = parts[0]
-            cmd_part = parts[1].strip()
-            
-            # 判断是跟踪指令还是运动指令
-            if cmd_part.startswith("TRACK:"):
-                track_val = cmd_part.split(":")[1]
-                if track_val == "STOP":
-                    manage_vision("STOP")
-                else:
-                    try:
-                        track_id = int(track_val)
-                        manage_vision("START", track_id)
-                    except:
-                        print(f"ID 解析错误: {track_val}")
-            else:
-                command = cmd_part.upper() # F, B, L, R, S
-        
-        print(f"AI 回复: {speak_text}")
-        
-        # === 并行执行 ===
-        # 现在这里的 synthesizer 变量能正确找到了
-        speech_future = synthesizer.speak_text_async(speak_text)
-        
-        # 如果有普通运动指令
-        if command:
-            control_car(command)
-            if command in ['F', 'B', 'L', 'R']:
-                time.sleep(1.0) 
-                control_car('S') 
-                
-        speech_future.get()
+        if cached is None:
+            reply_cache.put(text, full_reply)
+        remote_log(full_reply, prefix="[AI]")
+
+        def ms(t):
+            return f"{(t - t0) * 1000:.0f}ms" if t else "-"
+        print(f"[延迟] 识别 -> 首个 token {ms(first_token)}, 首句送 TTS {ms(first_sentence)}, "
+              f"指令发出 {ms(command_time)}, 回复结束 {ms(time.time())}")
+
+        await wait_speech(speech_futures)
 
+    except asyncio.CancelledError:
+        # 被打断：已经生成的部分也记入对话历史
+        partial = "".join(reply_parts)
+        if partial:
+            conversation_history.append({"role": "assistant", "content": partial + "……(被打断)"})
+        turn_state["speaking"] = False
+        raise
     except Exception as e:
         print(f"AI 交互出错: {e}")
-        synthesizer.speak_text_async("我的大脑有点短路了。")
+        # 兜底回复也走 say()/wait_speech()，读完后清除 speaking，否则主循环会把之后的每句话都当成回声丢掉
+        speech_futures.append(say(synthesizer, "我的大脑有点短路了。"))
+        await wait_speech(speech_futures)
 
-async def main():
-    # 配置 Azure 语音
+# ================= 主循环 =================
+def create_speech(stub=False, script=None, interval=2.0):
+    """创建识别器与合成器：Azure 语音服务，或 voice_stubs 中的本地替身"""
+    if stub:
+        from voice_stubs import StubRecognizer, StubSynthesizer
+        return StubRecognizer(script, interval), StubSynthesizer()
+
+    import azure.cognitiveservices.speech as speechsdk
     speech_config = speechsdk.SpeechConfig(subscription=AZURE_SPEECH_KEY, region=AZURE_REGION)
     speech_config.speech_recognition_language = "zh-CN"
     speech_config.speech_synthesis_voice_name = VOICE_NAME
@@ -204,38 +439,150 @@ async def main():
     
     recognizer = speechsdk.SpeechRecognizer(speech_config=speech_config, audio_config=audio_config)
     synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_out_config)
+    return recognizer, synthesizer
+
+def create_llm_client(stub=False):
+    if stub:
+        from voice_stubs import StubLLMClient
+        return StubLLMClient()
+    import openai
+    return openai.AsyncClient(api_key=OPENAI_API_KEY, base_url=OPENAI_API_BASE)
+
+def is_stop(text):
+    intent = match_intent(text)
+    return intent is not None and intent.command == "S"
 
-    print("=== 语音小车助手已启动 ===")
+async def barge_in(synthesizer, trace=None):
+    """打断：取消当前这轮对话和定时停车，停止朗读，立即停车"""
+    turn_state["barge_in_time"] = time.time()
+    busy = turn_state["task"] is not None and not turn_state["task"].done()
+    if busy:
+        turn_state["task"].cancel()
+        print(">> 打断当前动作")
+    cancel_timed_stop()
+    synthesizer.stop_speaking_async()
+    await control_car('S', trace)
+    if trace is not None:
+        print(f"[延迟] 停车: 识别 -> 指令发出 {(time.time() - trace.origin) * 1000:.0f}ms")
+    return busy
 
+async def run_turn(text, synthesizer, trace):
+    """一轮对话：本地意图优先，否则交给 LLM"""
+    reply_cache.stats["utterances"] += 1
+    if not await handle_locally(text, synthesizer, trace):
+        await ask_ai_and_speak(text, synthesizer, trace)
+    print(f"[统计] {reply_cache.summary()}")
+
+async def turn_worker(turns, synthesizer):
+    """按顺序处理排队的语句；每轮是单独的任务，打断时只取消这一轮"""
     while True:
-        print("\n正在聆听... (请对着麦克风说话)")
-        try:
-            result = recognizer.recognize_once_async().get()
-            
-            if result.reason == speechsdk.ResultReason.RecognizedSpeech:
-                text = result.text
-                print(f"你说了: {text}")
-
-                if len(text) < 2: continue
-                if "退出" in text: break
-                
-                await ask_ai_and_speak(text, synthesizer)
-                
-            elif result.reason == speechsdk.ResultReason.NoMatch:
-                print("没有检测到语音")
-            elif result.reason == speechsdk.ResultReason.Canceled:
-                cancellation_details = result.cancellation_details
-                print(f"!!! 语音识别被取消: {cancellation_details.reason}")
-                if cancellation_details.reason == speechsdk.CancellationReason.Error:
-                    print(f"!!! 错误详情: {cancellation_details.error_details}")
+        text, trace = await turns.get()
+        task = asyncio.get_running_loop().create_task(run_turn(text, synthesizer, trace))
+        turn_state["task"] = task
+        await asyncio.wait({task})  # 任务被取消时不会把 CancelledError 抛到这里
+        if not task.cancelled() and task.exception() is not None:
+            print(f"对话出错: {task.exception()}")
+        turn_state["task"] = None
 
-        except Exception as e:
-            print(f"主循环错误: {e}")
-            time.sleep(1)
+async def main(args):
+    global client
+    loop = asyncio.get_running_loop()
+    recognizer, synthesizer = create_speech(args.stub, args.say, args.say_interval)
+    client = create_llm_client(args.stub)
+    await car_link.connect()
+
+    def on_synthesizing(evt):
+        # 收到第一段合成音频：记录 识别 -> 首个音频 的延迟
+        if voice_latency["start"] is not None and voice_latency["first_audio"] is None:
+            voice_latency["first_audio"] = time.time()
+            print(f"[延迟] 识别 -> 首个音频 {(voice_latency['first_audio'] - voice_latency['start']) * 1000:.0f}ms")
+    synthesizer.synthesizing.connect(on_synthesizing)
+
+    # 连续识别：SDK 在自己的线程里回调，结果通过队列交给事件循环
+    utterances = asyncio.Queue()
+
+    def on_recognizing(evt):
+        # 中间结果里已经出现“停”：不等整句识别完就打断
+        if is_stop(evt.result.text) and time.time() - turn_state["barge_in_time"] > BARGE_IN_DEBOUNCE:
+            trace = Trace("voice")
+            trace.mark("recognizing")
+            turn_state["barge_in_time"] = time.time()
+            loop.call_soon_threadsafe(lambda: spawn(barge_in(synthesizer, trace)))
+
+    def on_recognized(evt):
+        text = evt.result.text
+        if not text:
+            return  # 没有识别出内容 (NoMatch)
+        # 延迟追踪从识别出文字开始
+        trace = Trace("voice")
+        trace.mark("recognized")
+        loop.call_soon_threadsafe(utterances.put_nowait, (text, trace))
+
+    def on_canceled(evt):
+        details = getattr(evt, "cancellation_details", None)
+        print(f"!!! 语音识别被取消: {getattr(details, 'reason', evt)}")
+        if getattr(details, "error_details", None):
+            print(f"!!! 错误详情: {details.error_details}")
+
+    recognizer.recognizing.connect(on_recognizing)
+    recognizer.recognized.connect(on_recognized)
+    recognizer.canceled.connect(on_canceled)
+
+    # 提前启动视觉进程，第一次“跟踪”时模型已经加载好
+    if not args.stub:
+        start_vision_daemon()
+
+    turns = asyncio.Queue()
+    worker = spawn(turn_worker(turns, synthesizer))
+    await asyncio.to_thread(recognizer.start_continuous_recognition_async().get)
+    print("=== 语音小车助手已启动 (连续识别中，请对着麦克风说话) ===")
+
+    try:
+        while True:
+            text, trace = await utterances.get()
+            print(f"你说了: {text}")
+            if "退出" in text:
+                break
+
+            if is_stop(text):
+                # 停车从不排队：打断当前这轮和排队的语句
+                reply_cache.stats["utterances"] += 1
+                reply_cache.stats["intents"] += 1
+                while not turns.empty():
+                    turns.get_nowait()
+                if time.time() - turn_state["barge_in_time"] < BARGE_IN_DEBOUNCE:
+                    continue  # 中间结果已经处理过
+                if not await barge_in(synthesizer, trace):
+                    say(synthesizer, "好的，停车。")
+                    turn_state["speaking"] = False
+                continue
+
+            if turn_state["speaking"]:
+                print(f"(朗读中，忽略可能的回声: {text})")
+                continue
+            if len(text) < 2 and match_intent(text) is None:
+                continue
+            turns.put_nowait((text, trace))
+    finally:
+        worker.cancel()
+        if turn_state["task"] is not None:
+            turn_state["task"].cancel()
+        recognizer.stop_continuous_recognition_async()
+        synthesizer.stop_speaking_async()
+        car_link.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="语音小车助手")
+    parser.add_argument("--stub", action="store_true",
+                        help="用本地替身代替 Azure 语音与 LLM (见 voice_stubs.py)，不需要麦克风和网络")
+    parser.add_argument("--say", action="append", metavar="TEXT",
+                        help="--stub 时按顺序“说出”的语句 (可重复)，不提供时从标准输入读取")
+    parser.add_argument("--say-interval", type=float, default=2.0,
+                        help="--say 语句之间的间隔 (s)")
+    args = parser.parse_args()
     try:
-        asyncio.run(main())
+        asyncio.run(main(args))
     except KeyboardInterrupt:
-        manage_vision("STOP")
-        print("程序停止")
\ No newline at end of file
+        print("程序停止")
+    finally:
+        stop_vision_daemon()
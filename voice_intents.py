@@ -0,0 +1,162 @@
+"""
+本地意图匹配 + 回复缓存 (voice_controller.py 在调用 LLM 之前使用)
+
+简单的运动 / 停车 / 跟踪指令与 SYSTEM_PROMPT 中的控制暗号是固定对应的，
+用关键词正则在本地直接识别，不需要等一次 DeepSeek 往返；只有闲聊才交给 LLM。
+LLM 的回复按归一化后的语句缓存 (LRU)，重复的问题直接复用。
+
+直接运行本文件会跑一遍匹配规则的自检。
+"""
+import re
+from collections import OrderedDict, namedtuple
+
+MAX_INTENT_CHARS = 12   # 超过这个长度的句子多半是闲聊，交给 LLM (停车除外)
+REPLY_CACHE_SIZE = 64
+
+# COCO 名称 -> ID (与 SYSTEM_PROMPT 中的常见 ID 一致，另加几个常用说法)
+COCO_NAMES = {
+    "人": 0, "行人": 0, "我": 0,
+    "自行车": 1, "单车": 1,
+    "汽车": 2, "车子": 2,
+    "猫": 15, "小猫": 15,
+    "狗": 16, "小狗": 16,
+    "背包": 24, "书包": 24,
+    "球": 32, "足球": 32, "篮球": 32,
+    "瓶子": 39, "水瓶": 39,
+    "杯子": 41,
+    "椅子": 56,
+    "手机": 67,
+}
+# 长的名称优先匹配 (“自行车”先于“车子”之类的短名称)
+_COCO_PATTERN = re.compile("|".join(sorted(map(re.escape, COCO_NAMES), key=len, reverse=True)))
+
+Intent = namedtuple("Intent", "command reply")
+
+# (正则, 指令, 朗读的回复)，按顺序匹配：先停止跟踪，再跟踪，再停车，最后各方向运动
+MOTION_RULES = [
+    (re.compile(r"(停止|别|不要|取消|不用)(再)?(跟踪|跟了|跟着|追了)"), "TRACK:STOP", "已停止跟踪。"),
+    (re.compile(r"(停车|停下|刹车|别动|站住|^停止?$|^停$)"), "S", "好的，停车。"),
+    (re.compile(r"(向左|往左|左)(边)?(平移|横移|滑动|滑)"), "Q", "好的，向左平移。"),
+    (re.compile(r"(向右|往右|右)(边)?(平移|横移|滑动|滑)"), "E", "好的，向右平移。"),
+    (re.compile(r"(前进|向前|往前|直走)"), "F", "好的，前进。"),
+    (re.compile(r"(后退|向后|往后|倒退|倒车)"), "B", "好的，后退。"),
+    (re.compile(r"(左转|左拐|向左转|往左转)"), "L", "好的，左转。"),
+    (re.compile(r"(右转|右拐|向右转|往右转)"), "R", "好的，右转。"),
+]
+TRACK_RULE = re.compile(r"(跟踪|跟着|跟随|追踪|锁定|跟住)")
+# 否定、疑问或只是“看看”：“不要前进”“你会左转吗”“左转还是右转”“往后看看”不能按字面执行，交给 LLM
+HEDGE_RULE = re.compile(r"(别|不要|不想|不|吗|还是|看|[?？])")
+STOP_COMMANDS = ("S", "TRACK:STOP")
+
+_PUNCTUATION = re.compile(r"[\s，。！？、,.!?;；:：~～…\"'“”‘’]+")
+_FILLERS = re.compile(r"(请|麻烦|帮我|一下|一点|吧|啊|呀|呢|嘛|小车)")
+
+
+def normalize(text):
+    """缓存键：去掉标点与空白，英文转小写"""
+    return _PUNCTUATION.sub("", text).lower()
+
+
+def match_intent(text):
+    """识别固定的控制指令，返回 Intent(command, reply)；不是简单指令时返回 None"""
+    key = _FILLERS.sub("", normalize(text))
+    if not key:
+        return None
+
+    # 停车 / 停止跟踪不受长度与否定词限制，任何时候都不等网络 (误停是安全的)
+    for pattern, command, reply in MOTION_RULES:
+        if command in STOP_COMMANDS and pattern.search(key):
+            return Intent(command, reply)
+    # 其余指令会让小车动起来，语气不确定时宁可多问一次 LLM (标点已被 normalize 去掉，用原文判断)
+    if HEDGE_RULE.search(text):
+        return None
+
+    # 跟踪：必须能认出物体，否则交给 LLM 推断 ID
+    if TRACK_RULE.search(key):
+        if len(key) > MAX_INTENT_CHARS:
+            return None
+        match = _COCO_PATTERN.search(key[TRACK_RULE.search(key).end():]) or _COCO_PATTERN.search(key)
+        if match is None:
+            return None
+        name = match.group(0)
+        return Intent(f"TRACK:{COCO_NAMES[name]}", f"好的，正在锁定{name}。")
+
+    if len(key) > MAX_INTENT_CHARS:
+        return None
+    for pattern, command, reply in MOTION_RULES:
+        if pattern.search(key):
+            return Intent(command, reply)
+    return None
+
+
+class ReplyCache:
+    """归一化语句 -> LLM 回复 的 LRU 缓存，同时统计本地意图与缓存命中率"""
+
+    def __init__(self, size=REPLY_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.stats = {"utterances": 0, "intents": 0, "hits": 0, "misses": 0}
+
+    def get(self, text):
+        key = normalize(text)
+        reply = self.entries.get(key)
+        if reply is None:
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return reply
+
+    def put(self, text, reply):
+        key = normalize(text)
+        if not key or not reply:
+            return
+        self.entries[key] = reply
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def summary(self):
+        st = self.stats
+        total = max(st["utterances"], 1)
+        lookups = max(st["hits"] + st["misses"], 1)
+        return (f"本地意图 {st['intents']}/{st['utterances']} ({st['intents'] / total:.0%}), "
+                f"回复缓存命中 {st['hits']}/{st['hits'] + st['misses']} ({st['hits'] / lookups:.0%}), "
+                f"缓存 {len(self.entries)} 条")
+
+
+def _selftest():
+    cases = {
+        "停": "S", "停下来！": "S", "快刹车": "S", "前面有人，快停车，不然要撞上了": "S",
+        "前进": "F", "往前走一点": "F", "后退一下": "B", "倒车": "B",
+        "左转": "L", "向右转吧": "R",
+        "往左平移": "Q", "向右边横移一点": "E", "左滑": "Q",
+        "跟踪这个瓶子": "TRACK:39", "跟着我走": "TRACK:0", "帮我跟踪那只小狗": "TRACK:16",
+        "别跟了": "TRACK:STOP", "停止跟踪": "TRACK:STOP",
+        "你好": None, "跟踪那个东西": None, "今天天气怎么样": None,
+        "给我讲一个关于小车一直前进的故事吧": None,
+        # 否定 / 疑问：不能按字面执行
+        "不要前进": None, "别往前走": None, "别后退": None, "不要左转": None, "我不想前进": None,
+        "你会前进吗": None, "左转还是右转": None, "往后看看": None, "前进？": None,
+        "你能跟着我吗": None, "别动": "S", "不用跟了": "TRACK:STOP",
+    }
+    failed = 0
+    for text, expected in cases.items():
+        intent = match_intent(text)
+        got = intent.command if intent else None
+        if got != expected:
+            failed += 1
+            print(f"!!! {text!r}: 期望 {expected}, 实际 {got}")
+
+    cache = ReplyCache(size=2)
+    cache.put("你好！", "你好呀")
+    assert cache.get("你好") == "你好呀" and cache.get("再见") is None
+    cache.put("a", "1")
+    cache.put("b", "2")
+    assert cache.get("你好") is None  # 最久未用的被淘汰
+    print(f"自检{'通过' if not failed else '失败'}: {len(cases) - failed}/{len(cases)} 条规则正确")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    _selftest()
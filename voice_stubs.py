@@ -0,0 +1,191 @@
+"""
+语音助手的本地替身 (不需要麦克风、Azure 密钥和网络)
+
+接口与 voice_controller.py 用到的那部分 Azure Speech SDK / openai AsyncClient 一致：
+  - StubRecognizer: 连续识别，recognizing (中间结果) / recognized (最终结果) 事件；
+    话语来自脚本 (按间隔依次“说出”) 或标准输入 (每行一句)
+  - StubSynthesizer: 按字数模拟朗读时长，支持 stop_speaking_async() 打断
+  - StubLLMClient: 流式返回脚本化的回复，模拟首个 token 延迟与逐字输出
+用法: python3 voice_controller.py --stub [--say 给我讲个故事 --say 停 ...]
+"""
+import asyncio
+import sys
+import threading
+import time
+from collections import namedtuple
+
+RECOGNIZE_CHAR_DELAY = 0.08   # 中间结果每个字的间隔 (s)
+SPEAK_CHARS_PER_SECOND = 6.0  # 模拟朗读速度
+LLM_FIRST_TOKEN_DELAY = 0.4   # 模拟 LLM 首个 token 延迟 (s)
+LLM_TOKEN_DELAY = 0.05
+
+StubResult = namedtuple("StubResult", "text reason")
+StubEventArgs = namedtuple("StubEventArgs", "result")
+
+
+class StubSignal:
+    """仿 Azure SDK 的 EventSignal：connect(callback)，回调在后台线程里执行"""
+
+    def __init__(self):
+        self.callbacks = []
+
+    def connect(self, callback):
+        self.callbacks.append(callback)
+
+    def fire(self, evt):
+        for callback in self.callbacks:
+            callback(evt)
+
+
+class StubFuture:
+    """仿 Azure SDK 的 ResultFuture：get() 阻塞到完成"""
+
+    def __init__(self, result=None):
+        self.event = threading.Event()
+        self.result = result
+        if result is not None:
+            self.event.set()
+
+    def set(self, result=True):
+        self.result = result
+        self.event.set()
+
+    def get(self):
+        self.event.wait()
+        return self.result
+
+
+class StubRecognizer:
+    def __init__(self, script=None, interval=2.0):
+        self.script = script        # 话语列表，None 表示从标准输入读取
+        self.interval = interval    # 脚本中相邻两句的间隔 (s)
+        self.recognizing = StubSignal()
+        self.recognized = StubSignal()
+        self.canceled = StubSignal()
+        self.running = False
+
+    def start_continuous_recognition_async(self):
+        self.running = True
+        threading.Thread(target=self._loop, daemon=True).start()
+        return StubFuture(True)
+
+    def stop_continuous_recognition_async(self):
+        self.running = False
+        return StubFuture(True)
+
+    def _utterances(self):
+        if self.script is not None:
+            for text in self.script:
+                time.sleep(self.interval)
+                yield text
+            return
+        print("(模拟麦克风：输入一句话并回车)")
+        for line in sys.stdin:
+            if line.strip():
+                yield line.strip()
+
+    def _loop(self):
+        for text in self._utterances():
+            if not self.running:
+                return
+            # 先逐字发出中间结果，再发最终结果
+            for i in range(1, len(text)):
+                self.recognizing.fire(StubEventArgs(StubResult(text[:i], "RecognizingSpeech")))
+                time.sleep(RECOGNIZE_CHAR_DELAY)
+            self.recognized.fire(StubEventArgs(StubResult(text, "RecognizedSpeech")))
+
+
+class StubSynthesizer:
+    """按提交顺序依次“朗读”，stop_speaking_async() 清空队列并打断当前这句"""
+
+    def __init__(self, chars_per_second=SPEAK_CHARS_PER_SECOND):
+        self.chars_per_second = chars_per_second
+        self.synthesizing = StubSignal()
+        self.cond = threading.Condition()
+        self.queue = []     # [(text, StubFuture)]
+        self.generation = 0  # 每次打断 +1，正在朗读的句子据此提前结束
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def speak_text_async(self, text):
+        future = StubFuture()
+        with self.cond:
+            self.queue.append((text, future))
+            self.cond.notify_all()
+        return future
+
+    def stop_speaking_async(self):
+        with self.cond:
+            dropped, self.queue = self.queue, []
+            self.generation += 1
+            self.cond.notify_all()
+        for _, future in dropped:
+            future.set(False)
+        return StubFuture(True)
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                text, future = self.queue.pop(0)
+                generation = self.generation
+            self.synthesizing.fire(StubEventArgs(StubResult(text, "SynthesizingAudio")))
+            print(f"    (朗读) {text}", flush=True)
+            deadline = time.time() + len(text) / self.chars_per_second
+            with self.cond:
+                while self.generation == generation and time.time() < deadline:
+                    self.cond.wait(deadline - time.time())
+                finished = self.generation == generation
+            if not finished:
+                print("    (朗读被打断)", flush=True)
+            future.set(finished)
+
+
+# ================= LLM =================
+_Delta = namedtuple("_Delta", "content")
+_Choice = namedtuple("_Choice", "delta")
+_Chunk = namedtuple("_Chunk", "choices")
+_Message = namedtuple("_Message", "role content")
+_MessageChoice = namedtuple("_MessageChoice", "index message finish_reason")
+_Completion = namedtuple("_Completion", "choices")
+
+# 关键词 -> 回复 (按顺序匹配)，其余语句原样复述
+STUB_REPLIES = [
+    ("故事", "从前有一辆小车，它每天在院子里转圈。有一天它发现了一个瓶子。它决定一直跟着这个瓶子走。"
+             "后来瓶子被风吹走了，小车追了很远很远。最后它在河边找到了瓶子，开心地回家了。"),
+    ("瓶子", "好的，正在锁定瓶子。||TRACK:39"),
+    ("转一圈", "好的，我来转一圈。||R"),
+    ("你好", "你好！我是你的小车助手。"),
+]
+
+
+class _StubStream:
+    def __init__(self, text):
+        self.text = text
+
+    def __aiter__(self):
+        return self._chunks()
+
+    async def _chunks(self):
+        await asyncio.sleep(LLM_FIRST_TOKEN_DELAY)
+        for i in range(0, len(self.text), 2):
+            yield _Chunk([_Choice(_Delta(self.text[i:i + 2]))])
+            await asyncio.sleep(LLM_TOKEN_DELAY)
+
+
+class _StubCompletions:
+    async def create(self, model=None, messages=(), stream=False, **kwargs):
+        question = messages[-1]["content"] if messages else ""
+        reply = next((r for key, r in STUB_REPLIES if key in question), f"你刚才说：{question}。")
+        if stream:
+            return _StubStream(reply)
+        # 非流式：等整段回复生成完再一次性返回，形状与 openai 的 ChatCompletion 一致
+        await asyncio.sleep(LLM_FIRST_TOKEN_DELAY + LLM_TOKEN_DELAY * len(reply) / 2)
+        return _Completion([_MessageChoice(0, _Message("assistant", reply), "stop")])
+
+
+class StubLLMClient:
+    """仿 openai.AsyncClient：client.chat.completions.create(...)，支持 stream=True 与非流式"""
+
+    def __init__(self):
+        self.chat = namedtuple("_Chat", "completions")(_StubCompletions())